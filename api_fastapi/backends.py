@@ -0,0 +1,407 @@
+# backends.py - Moteurs d'inférence interchangeables (PyTorch, ONNX Runtime, OpenVINO)
+
+"""
+Choix du moteur qui exécute le modèle YOLO.
+
+Les poids ``best.pt`` sont exportés une fois (à la construction de l'image
+Docker) vers ONNX et/ou OpenVINO, éventuellement quantifiés en INT8 par
+calibration sur des images locales. Au démarrage, ``INFERENCE_BACKEND`` et
+``INFERENCE_PRECISION`` désignent le modèle exporté à charger ; Ultralytics
+le charge derrière la même interface ``YOLO`` que les poids PyTorch, si bien
+que ``detect_fire_image`` et les endpoints ne changent pas.
+
+Utilisation en ligne de commande::
+
+    python -m api_fastapi.backends export --backend onnx --precision int8
+    python -m api_fastapi.backends parity --backend onnx --precision int8
+
+``parity`` compare les détections du moteur choisi à celles de PyTorch et
+sort en erreur si elles divergent au-delà des tolérances de la précision
+(``PARITY_TOLERANCES``). En INT8, l'écart est seulement signalé, sauf avec
+``--strict``.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+from api_fastapi import config
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+PRECISIONS = ("fp32", "int8")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+class BackendError(Exception):
+    """Moteur inconnu, modèle non exporté ou dépendance optionnelle absente."""
+
+
+def _check(backend, precision):
+    if backend not in BACKENDS:
+        raise BackendError(f"Moteur inconnu: {backend} (attendu: {', '.join(BACKENDS)})")
+    if precision not in PRECISIONS:
+        raise BackendError(f"Précision inconnue: {precision} (attendu: {', '.join(PRECISIONS)})")
+    if backend == "pytorch" and precision != "fp32":
+        raise BackendError("La quantification INT8 nécessite un moteur exporté (onnx ou openvino)")
+
+
+def exported_path(backend=None, precision=None, weights=None):
+    """
+    Chemin du modèle à charger pour un moteur et une précision.
+
+    Suit les conventions de nommage d'Ultralytics à côté des poids d'origine :
+    ``best.onnx``, ``best_int8.onnx``, ``best_openvino_model/``,
+    ``best_int8_openvino_model/``.
+    """
+    backend = backend or config.INFERENCE_BACKEND
+    precision = precision or config.INFERENCE_PRECISION
+    weights = weights or config.MODEL_PATH
+    _check(backend, precision)
+
+    if backend == "pytorch":
+        return weights
+    stem = os.path.splitext(weights)[0]
+    suffix = "_int8" if precision == "int8" else ""
+    if backend == "onnx":
+        return f"{stem}{suffix}.onnx"
+    return f"{stem}{suffix}_openvino_model"
+
+
+def load_model(backend=None, precision=None, weights=None):
+    """
+    Charge le modèle YOLO pour le moteur configuré.
+
+    Returns:
+        ``(modèle, chemin chargé)``.
+    """
+    from ultralytics import YOLO
+
+    path = exported_path(backend, precision, weights)
+    if not os.path.exists(path):
+        raise BackendError(
+            f"Modèle introuvable: {path} (exporter avec "
+            f"`python -m api_fastapi.backends export --backend {backend or config.INFERENCE_BACKEND}`)"
+        )
+    return YOLO(path, task="detect"), path
+
+
+def calibration_images(sources=None):
+    """
+    Liste les images locales (fichiers ou dossiers, non récursif) pour la calibration INT8.
+    """
+    sources = sources or [config.CALIBRATION_IMAGES]
+    images = []
+    for source in sources:
+        if os.path.isdir(source):
+            images.extend(
+                os.path.join(source, name) for name in sorted(os.listdir(source))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        elif os.path.isfile(source):
+            images.append(source)
+    if not images:
+        raise BackendError(f"Aucune image de calibration trouvée dans: {', '.join(sources)}")
+    return images
+
+
+def letterbox(image, size):
+    """
+    Redimensionne l'image dans un carré ``size`` x ``size`` en gardant ses proportions.
+
+    Même prétraitement que le prédicteur Ultralytics pour les modèles exportés
+    (bordures grises 114) : tenseur ``(1, 3, size, size)`` RGB dans [0, 1].
+    """
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    resized = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - new_height) // 2, (size - new_width) // 2
+    canvas[top:top + new_height, left:left + new_width] = resized
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(tensor, dtype=np.float32)[None] / 255.0
+
+
+def _quantize_onnx(fp32_path, int8_path, images, imgsz):
+    """
+    Quantification statique INT8 (QDQ) d'un modèle ONNX, calibrée sur ``images``.
+    """
+    try:
+        import onnxruntime
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    except ImportError:
+        raise BackendError("onnxruntime est requis pour la quantification ONNX (pip install onnxruntime)")
+
+    input_name = onnxruntime.InferenceSession(
+        fp32_path, providers=["CPUExecutionProvider"]
+    ).get_inputs()[0].name
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(images)
+
+        def get_next(self):
+            for path in self._paths:
+                image = cv2.imread(path, cv2.IMREAD_COLOR)
+                if image is not None:
+                    return {input_name: letterbox(image, imgsz)}
+            return None
+
+    quantize_static(
+        fp32_path,
+        int8_path,
+        ImageReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    return int8_path
+
+
+def _calibration_dataset(images, names):
+    """
+    Crée un dataset YOLO temporaire (fichier yaml) pointant sur les images de calibration.
+
+    La quantification OpenVINO d'Ultralytics (NNCF) lit ses images de
+    calibration dans la partie ``val`` d'un dataset.
+    """
+    root = tempfile.mkdtemp(prefix="calibration_")
+    image_dir = os.path.join(root, "images")
+    os.makedirs(image_dir)
+    for path in images:
+        shutil.copy(path, image_dir)
+    data = os.path.join(root, "data.yaml")
+    with open(data, "w") as f:
+        json.dump({"path": root, "train": "images", "val": "images", "names": names}, f)
+    return root, data
+
+
+def export_model(backend, precision="fp32", weights=None, images=None, imgsz=None):
+    """
+    Exporte les poids PyTorch vers un moteur (axe de lot dynamique pour le micro-batching).
+
+    Args:
+        backend: ``onnx`` ou ``openvino``.
+        precision: ``fp32`` ou ``int8`` (calibration sur ``images``).
+        weights: Poids ``.pt`` d'origine (``MODEL_PATH`` par défaut).
+        images: Fichiers ou dossiers d'images de calibration (``CALIBRATION_IMAGES`` par défaut).
+        imgsz: Taille d'entrée du modèle exporté (``INFERENCE_IMGSZ`` par défaut).
+
+    Returns:
+        Chemin du modèle exporté (celui que charge ``load_model``).
+    """
+    from ultralytics import YOLO
+
+    weights = weights or config.MODEL_PATH
+    imgsz = imgsz or config.INFERENCE_IMGSZ
+    target = exported_path(backend, precision, weights)
+    if backend == "pytorch":
+        return target
+
+    model = YOLO(weights)
+    if backend == "onnx":
+        fp32_path = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if precision == "int8":
+            return _quantize_onnx(fp32_path, target, calibration_images(images), imgsz)
+        return fp32_path
+
+    if precision == "int8":
+        root, data = _calibration_dataset(calibration_images(images), dict(model.names))
+        try:
+            return model.export(format="openvino", imgsz=imgsz, dynamic=True, int8=True, data=data)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    return model.export(format="openvino", imgsz=imgsz, dynamic=True)
+
+
+def _iou(box, boxes):
+    """
+    IoU entre une boîte ``(4,)`` et un tableau de boîtes ``(N, 4)``.
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+# Tolérances de parité par précision : écart de confiance maximal entre boîtes
+# appariées et détections non appariées admises par image. La quantification
+# INT8 déplace les confiances : une boîte proche du seuil peut apparaître ou
+# disparaître sans que le modèle soit faux.
+PARITY_TOLERANCES = {
+    "fp32": {"score": 0.05, "count": 0},
+    "int8": {"score": 0.15, "count": 1},
+}
+
+
+def compare_detections(reference, candidate, iou_threshold=0.5, score_tolerance=0.05, count_tolerance=0,
+                       thresholds=None):
+    """
+    Apparie les détections de deux moteurs (même classe, IoU maximal).
+
+    Args:
+        reference: Détections du moteur de référence (``boxes``, ``scores``, ``class_ids``).
+        candidate: Détections du moteur comparé.
+        iou_threshold: IoU minimal pour considérer deux boîtes identiques.
+        score_tolerance: Écart de confiance maximal entre deux boîtes appariées.
+        count_tolerance: Détections non appariées (manquantes + en trop) admises.
+        thresholds: Seuils de confiance par classe ; une détection non appariée dont
+            la confiance est à moins de ``score_tolerance`` de son seuil est dite
+            ``borderline`` et n'est pas comptée comme une divergence.
+
+    Returns:
+        Rapport : détections appariées, manquantes, en trop, limites, écarts maximaux et ``passed``.
+    """
+    def borderline(score, class_id):
+        return thresholds is not None and float(score) < thresholds[class_id] + score_tolerance
+
+    unmatched = np.ones(len(candidate["boxes"]), dtype=bool)
+    matched = 0
+    missing = 0
+    borderlines = 0
+    max_score_delta = 0.0
+    min_iou = 1.0
+    for box, score, class_id in zip(reference["boxes"], reference["scores"], reference["class_ids"]):
+        candidates = np.flatnonzero(unmatched & (candidate["class_ids"] == class_id))
+        ious = _iou(box, candidate["boxes"][candidates]) if len(candidates) else np.empty(0)
+        best = int(np.argmax(ious)) if len(ious) else None
+        if best is None or ious[best] < iou_threshold:
+            if borderline(score, class_id):
+                borderlines += 1
+            else:
+                missing += 1
+            continue
+        unmatched[candidates[best]] = False
+        matched += 1
+        max_score_delta = max(max_score_delta, abs(float(score) - float(candidate["scores"][candidates[best]])))
+        min_iou = min(min_iou, float(ious[best]))
+
+    extra = 0
+    for index in np.flatnonzero(unmatched):
+        if borderline(candidate["scores"][index], candidate["class_ids"][index]):
+            borderlines += 1
+        else:
+            extra += 1
+    return {
+        "reference": len(reference["boxes"]),
+        "candidate": len(candidate["boxes"]),
+        "matched": matched,
+        "missing": missing,
+        "extra": extra,
+        "borderline": borderlines,
+        "max_score_delta": round(max_score_delta, 4),
+        "min_iou": round(min_iou, 4) if matched else None,
+        "passed": missing + extra <= count_tolerance and max_score_delta <= score_tolerance,
+    }
+
+
+def _detections(result, thresholds):
+    """
+    Détections d'un résultat YOLO au-dessus des seuils par classe (même filtre que ``ml.postprocess``).
+    """
+    data = result.boxes.data.cpu().numpy() if result.boxes is not None else np.empty((0, 6), dtype=np.float32)
+    data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+    class_ids = data[:, 5].astype(np.int64)
+    known = (class_ids >= 0) & (class_ids < len(thresholds))
+    keep = known & (data[:, 4] >= thresholds[np.where(known, class_ids, 0)])
+    return {"boxes": data[keep, :4], "scores": data[keep, 4], "class_ids": class_ids[keep]}
+
+
+def parity_check(backend, precision="fp32", images=None, iou_threshold=0.5, score_tolerance=None,
+                 count_tolerance=None):
+    """
+    Compare, image par image, les détections d'un moteur à celles des poids PyTorch.
+
+    Seuls les deux modèles comparés sont chargés ; leurs sorties passent par
+    le même filtre que ``detect_fire_image`` (seuils par classe compris).
+    Tolérances par défaut : ``PARITY_TOLERANCES[precision]``.
+
+    Returns:
+        ``{"passed": bool, "images": {chemin: rapport}}``.
+    """
+    from api_fastapi.ml import _class_thresholds
+
+    tolerances = PARITY_TOLERANCES[precision]
+    score_tolerance = tolerances["score"] if score_tolerance is None else score_tolerance
+    count_tolerance = tolerances["count"] if count_tolerance is None else count_tolerance
+
+    reference_model, _ = load_model("pytorch", "fp32")
+    candidate_model, candidate_path = load_model(backend, precision)
+    thresholds = _class_thresholds(dict(reference_model.names))
+
+    reports = {}
+    for path in calibration_images(images):
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        reference = _detections(reference_model(image, verbose=False)[0], thresholds)
+        candidate = _detections(candidate_model(image, verbose=False)[0], thresholds)
+        reports[path] = compare_detections(
+            reference, candidate, iou_threshold, score_tolerance, count_tolerance, thresholds
+        )
+
+    return {
+        "backend": backend,
+        "precision": precision,
+        "model": candidate_path,
+        "score_tolerance": score_tolerance,
+        "count_tolerance": count_tolerance,
+        "passed": all(report["passed"] for report in reports.values()),
+        "images": reports,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export et comparaison des moteurs d'inférence")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Exporter best.pt vers un moteur")
+    parity = commands.add_parser("parity", help="Comparer les détections d'un moteur à PyTorch")
+    for command in (export, parity):
+        command.add_argument("--backend", default=config.INFERENCE_BACKEND, choices=BACKENDS)
+        command.add_argument("--precision", default=config.INFERENCE_PRECISION, choices=PRECISIONS)
+        command.add_argument("--images", nargs="*", help="Images ou dossiers d'images (calibration / comparaison)")
+    export.add_argument("--weights", default=config.MODEL_PATH)
+    export.add_argument("--imgsz", type=int, default=config.INFERENCE_IMGSZ)
+    parity.add_argument("--iou", type=float, default=0.5)
+    parity.add_argument("--score-tolerance", type=float, help="Défaut : PARITY_TOLERANCES[précision]")
+    parity.add_argument("--count-tolerance", type=int, help="Défaut : PARITY_TOLERANCES[précision]")
+    parity.add_argument(
+        "--strict", action="store_true", help="Échouer aussi en INT8 (par défaut, rapport seulement)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            print(export_model(args.backend, args.precision, args.weights, args.images, args.imgsz))
+            return 0
+        report = parity_check(
+            args.backend, args.precision, args.images, args.iou, args.score_tolerance, args.count_tolerance
+        )
+    except BackendError as e:
+        print(f"Erreur: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(report, indent=2))
+    if report["passed"]:
+        return 0
+    if args.precision == "int8" and not args.strict:
+        # Calibration sur quelques images : l'écart INT8 est signalé sans bloquer
+        print("Parité INT8 hors tolérances (rapport seulement, --strict pour échouer)", file=sys.stderr)
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
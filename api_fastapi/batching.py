@@ -0,0 +1,217 @@
+# batching.py - Ordonnanceur de micro-batching pour l'inférence YOLO
+
+"""
+Regroupement dynamique des requêtes d'inférence concurrentes.
+
+Sur nos nœuds CPU, un passage du modèle sur un lot de N images coûte bien
+moins que N passages d'une image. Le ``BatchScheduler`` accumule les images
+soumises par les endpoints pendant au plus ``BATCH_MAX_WAIT_MS`` (ou jusqu'à
+``BATCH_MAX_SIZE`` images), lance un seul appel batché au modèle dans un
+thread dédié, puis rend à chaque appelant son propre résultat.
+
+Fonctionnalités:
+    - Taille de lot et temps d'attente maximum configurables
+    - Inférence exécutée hors de la boucle asyncio
+    - Taille d'entrée propre à chaque image (``imgsz``, entier ou forme
+      ``(hauteur, largeur)``) : un lot est découpé en un appel au modèle par
+      taille, donc par forme d'entrée
+    - Compteurs : taille des lots, attente en file, temps d'inférence
+      (l'attente en file alimente aussi l'histogramme ``queue_wait`` de ``/metrics``)
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api_fastapi import config, metrics
+
+
+class BatchScheduler:
+    """
+    Accumule les images soumises et les envoie au modèle par lots.
+
+    Args:
+        infer_fn: Fonction ``list[image] -> list[résultat]`` appelée pour chaque lot
+            (avec l'argument ``imgsz`` pour les images soumises à une taille d'entrée propre).
+        max_batch_size: Nombre maximal d'images par lot.
+        max_wait: Attente maximale (s) après la première image d'un lot.
+        max_concurrent_batches: Nombre de lots pouvant s'exécuter en parallèle.
+    """
+
+    def __init__(self, infer_fn, max_batch_size=None, max_wait=None, max_concurrent_batches=1):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max_batch_size or config.BATCH_MAX_SIZE
+        self.max_wait = config.BATCH_MAX_WAIT_MS / 1000 if max_wait is None else max_wait
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        self._running = set()
+        # Le modèle n'est pas thread-safe : un thread par lot concurrent
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_batches, thread_name_prefix="inference"
+        )
+
+        # Statistiques
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = {}
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._inference_total = 0.0
+        self._errors = 0
+
+    async def start(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        # Les requêtes encore en file ne seront jamais traitées
+        while self._queue is not None and not self._queue.empty():
+            _, future, _, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Ordonnanceur d'inférence arrêté"))
+
+    async def submit(self, image, imgsz=None):
+        """
+        Soumet une image et attend son résultat de détection.
+
+        ``imgsz`` : taille d'entrée du modèle pour cette image, entier ou ``(hauteur, largeur)``
+        (celle du modèle par défaut).
+        """
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future, time.perf_counter(), imgsz))
+        return await future
+
+    def load(self):
+        """
+        Images en attente, rapportées à ce que traite un passage (lots concurrents pleins).
+        """
+        if self._queue is None:
+            return 0.0
+        return self._queue.qsize() / (self.max_batch_size * self.max_concurrent_batches)
+
+    async def run(self, fn, *args):
+        """
+        Exécute une fonction dans le thread d'inférence, en exclusion avec les lots.
+
+        Sert aux opérations qui touchent le modèle hors lot (chargement, préchauffage).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def _collect(self, batch):
+        """
+        Attend une première image puis complète le lot jusqu'à la taille ou au délai maximum.
+
+        Le lot est rempli en place : si la collecte est annulée, l'appelant sait
+        quelles images ont déjà quitté la file.
+        """
+        batch.append(await self._queue.get())
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Vider d'abord ce qui est déjà en file, sans attendre
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            batch = []
+            try:
+                await self._collect(batch)
+            except BaseException:
+                self._slots.release()
+                # Annulation (arrêt) : les images déjà sorties de la file ne seront jamais traitées
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Ordonnanceur d'inférence arrêté"))
+                raise
+            task = asyncio.create_task(self._execute(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _infer(self, batch):
+        """
+        Un appel à ``infer_fn`` par taille d'entrée du lot, résultats remis dans l'ordre du lot.
+        """
+        groups = {}
+        for index, (_, _, _, imgsz) in enumerate(batch):
+            groups.setdefault(imgsz, []).append(index)
+        results = [None] * len(batch)
+        for imgsz, indexes in groups.items():
+            images = [batch[index][0] for index in indexes]
+            group_results = self.infer_fn(images) if imgsz is None else self.infer_fn(images, imgsz=imgsz)
+            for index, result in zip(indexes, group_results):
+                results[index] = result
+        return results
+
+    async def _execute(self, batch):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(self._executor, self._infer, batch)
+        except Exception as e:
+            self._errors += 1
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except asyncio.CancelledError:
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Ordonnanceur d'inférence arrêté"))
+            raise
+        finally:
+            self._slots.release()
+
+        finished = time.perf_counter()
+        self._batches += 1
+        self._items += len(batch)
+        self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+        self._inference_total += finished - started
+        for (_, future, submitted, _), result in zip(batch, results):
+            wait = started - submitted
+            self._queue_wait_total += wait
+            self._queue_wait_max = max(self._queue_wait_max, wait)
+            metrics.observe("queue_wait", wait, per_request=False)
+            # L'appelant a pu abandonner (client déconnecté)
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self._batches,
+            "items": self._items,
+            "errors": self._errors,
+            "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "batch_sizes": dict(sorted(self._batch_sizes.items())),
+            "mean_queue_wait_ms": round(1000 * self._queue_wait_total / self._items, 2) if self._items else 0.0,
+            "max_queue_wait_ms": round(1000 * self._queue_wait_max, 2),
+            "mean_inference_ms": round(1000 * self._inference_total / self._batches, 2) if self._batches else 0.0,
+        }
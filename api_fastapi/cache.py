@@ -0,0 +1,178 @@
+# cache.py - Cache des résultats de détection pour /detect_fire_url
+
+"""
+Cache adressé par contenu des résultats de ``/detect_fire_url``.
+
+Nous soumettons souvent les mêmes URL (instantanés de caméras, images
+d'actualité) : sans cache, chaque appel retélécharge, décode, réinfère et
+réencode l'image. Le cache a deux niveaux:
+
+    - URL : ``url -> (ETag, Last-Modified, empreinte du contenu)``. Pendant
+      ``DETECTION_CACHE_FRESH_SECONDS`` l'URL est servie sans accès réseau,
+      ensuite elle est revalidée par une requête conditionnelle (304).
+    - Contenu : ``(sha256 des octets, version du modèle) -> détections`` et
+      ``(..., qualité JPEG, taille max) -> image annotée``. Une même image
+      servie par deux URL différentes n'est analysée qu'une fois.
+
+Les deux niveaux partagent un budget mémoire (``DETECTION_CACHE_MAX_BYTES``)
+avec éviction LRU et une durée de vie maximale (``DETECTION_CACHE_TTL``).
+La version du modèle fait partie des clés : les entrées calculées avec
+d'autres poids ne sont plus jamais servies et sont purgées au changement.
+"""
+
+import time
+from collections import OrderedDict
+
+from api_fastapi import config
+
+# Surcoût mémoire approximatif d'une entrée (clé, dictionnaires...)
+ENTRY_OVERHEAD = 256
+
+
+def results_size(results):
+    """
+    Estime la taille mémoire (octets) d'un résultat de détection.
+    """
+    arrays = sum(results[key].nbytes for key in ("boxes", "scores", "class_ids"))
+    return arrays + ENTRY_OVERHEAD * (1 + len(results["detections"]))
+
+
+class LRUCache:
+    """
+    Cache LRU borné en octets, avec durée de vie des entrées.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, size, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self.pop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, size):
+        size += ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self.pop(key)
+        self._entries[key] = (value, size, time.monotonic())
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+
+class UrlEntry:
+    """
+    Validateurs HTTP et empreinte du dernier contenu téléchargé pour une URL.
+    """
+
+    def __init__(self, etag, last_modified, digest):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.validated_at = time.monotonic()
+
+    def mark_validated(self):
+        self.validated_at = time.monotonic()
+
+    @property
+    def fresh(self):
+        return time.monotonic() - self.validated_at < config.DETECTION_CACHE_FRESH_SECONDS
+
+    @property
+    def revalidable(self):
+        return bool(self.etag or self.last_modified)
+
+
+class DetectionCache:
+    """
+    Cache à deux niveaux (URL puis contenu) des résultats de détection.
+    """
+
+    def __init__(self, max_bytes=None, ttl=None):
+        self._lru = LRUCache(
+            max_bytes or config.DETECTION_CACHE_MAX_BYTES,
+            ttl or config.DETECTION_CACHE_TTL,
+        )
+        self._model_version = None
+        self.hits = 0
+        self.revalidated = 0
+        self.content_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def check_model_version(self, model_version):
+        """
+        Purge le cache si les poids du modèle ont changé.
+        """
+        if model_version != self._model_version:
+            if self._model_version is not None:
+                self._lru.clear()
+                self.invalidations += 1
+            self._model_version = model_version
+
+    def get_url(self, url):
+        return self._lru.get(("url", url))
+
+    def put_url(self, url, headers, digest):
+        entry = UrlEntry(headers.get("etag"), headers.get("last-modified"), digest)
+        self._lru.put(("url", url), entry, len(url))
+
+    def get_results(self, digest):
+        return self._lru.get(("results", digest, self._model_version))
+
+    def put_results(self, digest, results):
+        self._lru.put(("results", digest, self._model_version), results, results_size(results))
+
+    def get_render(self, digest, render_key):
+        return self._lru.get(("render", digest, self._model_version, render_key))
+
+    def put_render(self, digest, render_key, jpeg):
+        self._lru.put(("render", digest, self._model_version, render_key), jpeg, len(jpeg))
+
+    def stats(self):
+        lookups = self.hits + self.revalidated + self.content_hits + self.misses
+        return {
+            "enabled": bool(config.DETECTION_CACHE_ENABLED),
+            "entries": len(self._lru),
+            "bytes": self._lru.bytes,
+            "max_bytes": self._lru.max_bytes,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "content_hits": self.content_hits,
+            "misses": self.misses,
+            "hit_ratio": round((lookups - self.misses) / lookups, 3) if lookups else 0.0,
+            "evictions": self._lru.evictions,
+            "expirations": self._lru.expirations,
+            "model_invalidations": self.invalidations,
+        }
+
+
+# Instance unique utilisée par /detect_fire_url
+detection_cache = DetectionCache()
@@ -0,0 +1,326 @@
+# camera.py - Gestion persistante des caméras avec capture en arrière-plan
+
+"""
+Gestionnaire de capture webcam persistant.
+
+Ouvrir un périphérique ``cv2.VideoCapture`` coûte plusieurs centaines de
+millisecondes : le faire à chaque requête dominait la latence de
+``/detect_fire_webcam``. Ici chaque caméra est ouverte une seule fois, puis
+un thread dédié lit les frames en continu dans un petit tampon circulaire.
+Les requêtes se contentent de récupérer la frame la plus récente.
+
+Fonctionnalités:
+    - Un thread de capture par caméra (ouverture à la première demande)
+    - Tampon circulaire des dernières frames (``CAMERA_BUFFER_SIZE``)
+    - Reconnexion automatique avec backoff exponentiel en cas d'erreur
+    - Webcams des endpoints limitées à ``CAMERA_ALLOWED_INDEXES`` ; fermées et
+      oubliées après ``CAMERA_MAX_OPEN_FAILURES`` ouvertures échouées ou
+      ``CAMERA_IDLE_TIMEOUT`` s sans lecture
+    - Statistiques par caméra : FPS de capture, âge de la dernière frame
+    - Sources réseau (RTSP/HTTP) et fichiers vidéo ; un fichier est lu à sa
+      cadence nominale et en boucle, comme une caméra de substitution
+
+Note:
+    Les frames du tampon sont partagées entre les requêtes et marquées en
+    lecture seule : copier la frame avant de dessiner dessus.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from api_fastapi import config
+
+
+class CameraError(Exception):
+    """Erreur levée lorsqu'aucune frame exploitable n'est disponible."""
+
+
+def _open_capture(source):
+    """
+    Ouvre la source vidéo : index de périphérique (V4L2 privilégié sous Linux),
+    URL RTSP/HTTP ou chemin de fichier.
+    """
+    if not isinstance(source, int):
+        cap = cv2.VideoCapture(source)
+        if cap.isOpened():
+            return cap
+        cap.release()
+        return None
+    index = source
+    if sys.platform.startswith("linux"):
+        cap = cv2.VideoCapture(index, cv2.CAP_V4L2)
+        if cap.isOpened():
+            return cap
+        cap.release()
+    cap = cv2.VideoCapture(index)
+    if cap.isOpened():
+        return cap
+    cap.release()
+    return None
+
+
+class CameraStream:
+    """
+    Capture continue d'une caméra dans un tampon circulaire.
+
+    Args:
+        index: Clé de la caméra (index de périphérique ou nom de source).
+        buffer_size: Nombre de frames conservées.
+        source: Source à ouvrir si différente de ``index`` (URL, fichier).
+        max_open_failures: Ouvertures échouées consécutives avant l'arrêt du thread (0 : jamais).
+        idle_timeout: Durée (s) sans lecture avant l'arrêt du thread (0 : jamais).
+        on_exit: Fonction ``stream -> None`` appelée quand le thread s'arrête de lui-même.
+    """
+
+    def __init__(self, index, buffer_size=None, source=None, max_open_failures=0, idle_timeout=0, on_exit=None):
+        self.index = index
+        self.source = index if source is None else source
+        self.max_open_failures = max_open_failures
+        self.idle_timeout = idle_timeout
+        self._on_exit = on_exit
+        self._last_read = time.monotonic()
+        self._is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        self._buffer = deque(maxlen=buffer_size or config.CAMERA_BUFFER_SIZE)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._cap = None
+
+        # Statistiques
+        self._seq = 0
+        self._fps = 0.0
+        self._last_frame_time = None
+        self._reconnects = 0
+        self._last_error = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._last_read = time.monotonic()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=f"camera-{self.index}", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._release()
+
+    def _release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def _run(self):
+        delay = config.CAMERA_RECONNECT_DELAY
+        # Fichiers : cadence nominale et lecture en boucle
+        frame_period = 0.0
+        next_frame = 0.0
+        rewound = False
+        failures = 0
+        while not self._stop_event.is_set():
+            if self.idle_timeout and time.monotonic() - self._last_read > self.idle_timeout:
+                # Plus aucun lecteur : inutile de garder le périphérique ouvert
+                break
+            if self._cap is None:
+                self._cap = _open_capture(self.source)
+                if self._cap is None:
+                    failures += 1
+                    self._last_error = f"Caméra {self.index} inaccessible"
+                    if self.max_open_failures and failures >= self.max_open_failures:
+                        self._last_error = f"Caméra {self.index} inaccessible après {failures} tentatives"
+                        break
+                    self._stop_event.wait(delay)
+                    delay = min(delay * 2, config.CAMERA_RECONNECT_MAX_DELAY)
+                    continue
+                failures = 0
+                if self._seq > 0:
+                    self._reconnects += 1
+                delay = config.CAMERA_RECONNECT_DELAY
+                if self._is_file:
+                    fps = self._cap.get(cv2.CAP_PROP_FPS)
+                    frame_period = 1.0 / fps if fps and fps > 0 else 1.0 / 25
+                    next_frame = time.monotonic()
+
+            if frame_period:
+                # Ne pas lire un fichier plus vite que sa cadence nominale
+                self._stop_event.wait(max(0.0, next_frame - time.monotonic()))
+                next_frame = max(next_frame + frame_period, time.monotonic() - frame_period)
+
+            ret, frame = self._cap.read()
+            if (not ret or frame is None) and self._is_file and not rewound:
+                # Fin du fichier : retour au début
+                rewound = True
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            if not ret or frame is None:
+                # Périphérique débranché ou flux interrompu : on rouvre
+                self._last_error = f"Lecture impossible sur la caméra {self.index}"
+                self._release()
+                self._stop_event.wait(delay)
+                continue
+
+            rewound = False
+            now = time.monotonic()
+            frame.flags.writeable = False
+            with self._condition:
+                if self._last_frame_time is not None:
+                    instant_fps = 1.0 / max(now - self._last_frame_time, 1e-6)
+                    # Moyenne glissante exponentielle pour lisser le FPS
+                    self._fps = instant_fps if self._fps == 0 else 0.9 * self._fps + 0.1 * instant_fps
+                self._last_frame_time = now
+                self._seq += 1
+                self._buffer.append((self._seq, now, frame))
+                self._last_error = None
+                self._condition.notify_all()
+
+        self._release()
+        if not self._stop_event.is_set() and self._on_exit is not None:
+            self._on_exit(self)
+
+    def read_latest(self, timeout=None, max_age=None, after_seq=0):
+        """
+        Retourne ``(seq, timestamp, frame)`` pour la frame la plus récente.
+
+        Args:
+            timeout: Attente maximale (s) d'une frame plus récente que ``after_seq``.
+            max_age: Âge maximal accepté (s) pour la frame retournée.
+            after_seq: Numéro de la dernière frame déjà consommée par l'appelant.
+        """
+        if timeout is None:
+            timeout = config.CAMERA_FIRST_FRAME_TIMEOUT
+        if max_age is None:
+            max_age = config.CAMERA_MAX_FRAME_AGE
+
+        self.start()
+        with self._condition:
+            ready = self._condition.wait_for(
+                lambda: self._buffer and self._buffer[-1][0] > after_seq, timeout
+            )
+            if not ready:
+                raise CameraError(self._last_error or f"Aucune frame reçue de la caméra {self.index}")
+            seq, timestamp, frame = self._buffer[-1]
+
+        if time.monotonic() - timestamp > max_age:
+            raise CameraError(self._last_error or f"Frame périmée sur la caméra {self.index}")
+        return seq, timestamp, frame
+
+    def peek(self):
+        """
+        Retourne ``(seq, timestamp, frame)`` de la frame la plus récente, sans attendre
+        (``None`` si aucune frame n'a encore été capturée).
+        """
+        self._last_read = time.monotonic()
+        with self._condition:
+            return self._buffer[-1] if self._buffer else None
+
+    def stats(self):
+        with self._condition:
+            age = None
+            if self._last_frame_time is not None:
+                age = time.monotonic() - self._last_frame_time
+            return {
+                "camera_index": self.index,
+                "source": self.source,
+                "running": self.running,
+                "connected": self._cap is not None,
+                "fps": round(self._fps, 2),
+                "frame_age": round(age, 3) if age is not None else None,
+                "frames_captured": self._seq,
+                "reconnects": self._reconnects,
+                "last_error": self._last_error,
+            }
+
+
+class CameraManager:
+    """
+    Registre des caméras ouvertes, partagé par toute l'application.
+    """
+
+    def __init__(self):
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def get(self, index, source=None, max_open_failures=0):
+        """
+        Caméra ``index`` (ouverte à la première demande), reconnectée jusqu'à
+        ``max_open_failures`` ouvertures échouées consécutives (0 : indéfiniment).
+
+        Sert aux sources déclarées (ingestion) ; les requêtes passent par ``read_latest``.
+        """
+        with self._lock:
+            stream = self._streams.get(index)
+            if stream is None:
+                stream = CameraStream(index, source=source, max_open_failures=max_open_failures)
+                self._streams[index] = stream
+            stream.start()
+            return stream
+
+    def allowed(self, index):
+        """
+        La webcam ``index`` peut-elle être ouverte par une requête ?
+        """
+        return index in config.CAMERA_ALLOWED_INDEXES
+
+    def _webcam(self, index):
+        if not self.allowed(index):
+            raise CameraError(f"Caméra {index} non autorisée (CAMERA_ALLOWED_INDEXES)")
+        with self._lock:
+            stream = self._streams.get(index)
+            if stream is None:
+                stream = CameraStream(
+                    index,
+                    max_open_failures=config.CAMERA_MAX_OPEN_FAILURES,
+                    idle_timeout=config.CAMERA_IDLE_TIMEOUT,
+                    on_exit=self._evict,
+                )
+                self._streams[index] = stream
+            stream.start()
+            return stream
+
+    def _evict(self, stream):
+        """
+        Oublie une caméra dont le thread s'est arrêté (abandon ou inactivité).
+        """
+        with self._lock:
+            if self._streams.get(stream.index) is stream:
+                del self._streams[stream.index]
+
+    def remove(self, index):
+        """
+        Arrête et oublie une caméra.
+        """
+        with self._lock:
+            stream = self._streams.pop(index, None)
+        if stream is not None:
+            stream.stop()
+
+    def read_latest(self, index, **kwargs):
+        return self._webcam(index).read_latest(**kwargs)
+
+    def stats(self):
+        with self._lock:
+            streams = list(self._streams.values())
+        return [stream.stats() for stream in streams]
+
+    def stop_all(self):
+        with self._lock:
+            streams = list(self._streams.values())
+            self._streams.clear()
+        for stream in streams:
+            stream.stop()
+
+
+# Instance unique utilisée par les endpoints
+camera_manager = CameraManager()
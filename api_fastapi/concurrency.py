@@ -0,0 +1,85 @@
+# concurrency.py - Exécuteur CPU borné et limiteur de concurrence
+
+"""
+Outils pour garder la boucle asyncio de uvicorn réactive.
+
+Le travail CPU des endpoints (décodage, dessin des boîtes, encodage JPEG,
+base64) est déporté dans un pool de threads borné, et le nombre de requêtes
+de détection simultanées est plafonné : au-delà d'une file d'attente
+raisonnable, les requêtes sont rejetées avec un 429 et un en-tête
+``Retry-After`` plutôt que de laisser la latence croître sans limite.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from api_fastapi import config
+
+# Pool partagé pour le travail CPU hors inférence
+cpu_executor = ThreadPoolExecutor(max_workers=config.CPU_WORKERS, thread_name_prefix="cpu")
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """
+    Exécute une fonction bloquante dans le pool CPU sans bloquer la boucle asyncio.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, functools.partial(fn, *args, **kwargs))
+
+
+class ConcurrencyLimiter:
+    """
+    Limite le nombre de requêtes en cours, avec une file d'attente bornée.
+
+    S'utilise comme gestionnaire de contexte asynchrone::
+
+        async with request_limiter:
+            ...
+
+    Lève une ``HTTPException`` 429 (avec ``Retry-After``) si la file est pleine.
+    """
+
+    def __init__(self, max_concurrent=None, max_queued=None, retry_after=None):
+        self.max_concurrent = max_concurrent or config.MAX_CONCURRENT_REQUESTS
+        self.max_queued = config.MAX_QUEUED_REQUESTS if max_queued is None else max_queued
+        self.retry_after = retry_after or config.RETRY_AFTER_SECONDS
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._in_flight = 0
+        self._queued = 0
+        self._rejected = 0
+
+    async def __aenter__(self):
+        if self._semaphore.locked() and self._queued >= self.max_queued:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Serveur saturé, veuillez réessayer plus tard",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        self._queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._queued -= 1
+        self._in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "rejected": self._rejected,
+        }
+
+
+# Limiteur partagé par les endpoints de détection
+request_limiter = ConcurrencyLimiter()
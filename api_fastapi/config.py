@@ -0,0 +1,249 @@
+# config.py - Paramètres de l'API lus depuis les variables d'environnement
+
+"""
+Configuration centralisée de l'API de détection de feu et fumée.
+
+Chaque paramètre peut être surchargé par une variable d'environnement du même
+nom, ce qui permet d'ajuster le comportement du conteneur (docker-compose,
+Azure) sans reconstruire l'image.
+"""
+
+import os
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+# --- Capture webcam ---
+# Nombre de frames conservées dans le tampon circulaire de chaque caméra.
+CAMERA_BUFFER_SIZE = _env_int("CAMERA_BUFFER_SIZE", 2)
+# Délai (s) avant une tentative de reconnexion après une erreur de capture.
+CAMERA_RECONNECT_DELAY = _env_float("CAMERA_RECONNECT_DELAY", 1.0)
+# Délai maximal (s) entre deux tentatives de reconnexion (backoff exponentiel).
+CAMERA_RECONNECT_MAX_DELAY = _env_float("CAMERA_RECONNECT_MAX_DELAY", 10.0)
+# Temps d'attente maximal (s) de la première frame lors d'une requête.
+CAMERA_FIRST_FRAME_TIMEOUT = _env_float("CAMERA_FIRST_FRAME_TIMEOUT", 5.0)
+# Âge maximal (s) d'une frame avant qu'elle soit considérée comme périmée.
+CAMERA_MAX_FRAME_AGE = _env_float("CAMERA_MAX_FRAME_AGE", 2.0)
+# Index des webcams locales accessibles par les endpoints, séparés par des virgules.
+CAMERA_ALLOWED_INDEXES = tuple(
+    int(index) for index in os.getenv("CAMERA_ALLOWED_INDEXES", "0").split(",") if index.strip()
+)
+# Ouvertures échouées consécutives avant l'abandon d'une webcam ouverte par une requête.
+CAMERA_MAX_OPEN_FAILURES = _env_int("CAMERA_MAX_OPEN_FAILURES", 5)
+# Durée (s) sans lecture au bout de laquelle une webcam ouverte par une requête est fermée.
+CAMERA_IDLE_TIMEOUT = _env_float("CAMERA_IDLE_TIMEOUT", 60.0)
+
+# --- Micro-batching de l'inférence ---
+# Nombre maximal d'images regroupées dans un même appel au modèle.
+BATCH_MAX_SIZE = _env_int("BATCH_MAX_SIZE", 8)
+# Attente maximale (ms) pour compléter un lot après la première image.
+BATCH_MAX_WAIT_MS = _env_float("BATCH_MAX_WAIT_MS", 10.0)
+
+# --- Téléchargement des images ---
+# Délai maximal (s) d'un téléchargement d'image.
+HTTP_TIMEOUT = _env_float("HTTP_TIMEOUT", 10.0)
+# Taille maximale (octets) d'une image téléchargée.
+MAX_DOWNLOAD_BYTES = _env_int("MAX_DOWNLOAD_BYTES", 25 * 1024 * 1024)
+# Connexions simultanées et connexions keep-alive du client HTTP partagé.
+HTTP_MAX_CONNECTIONS = _env_int("HTTP_MAX_CONNECTIONS", 100)
+HTTP_MAX_KEEPALIVE = _env_int("HTTP_MAX_KEEPALIVE", 20)
+
+# --- Concurrence ---
+# Threads dédiés au travail CPU hors inférence (décodage, dessin, encodage).
+CPU_WORKERS = _env_int("CPU_WORKERS", min(8, os.cpu_count() or 1))
+# Requêtes de détection traitées simultanément.
+MAX_CONCURRENT_REQUESTS = _env_int("MAX_CONCURRENT_REQUESTS", 16)
+# Requêtes pouvant attendre une place avant d'être rejetées avec un 429.
+MAX_QUEUED_REQUESTS = _env_int("MAX_QUEUED_REQUESTS", 32)
+# Valeur de l'en-tête Retry-After (s) renvoyé avec un 429.
+RETRY_AFTER_SECONDS = _env_int("RETRY_AFTER_SECONDS", 1)
+
+# --- Flux MJPEG ---
+# Nombre maximal de clients connectés simultanément au flux annoté.
+STREAM_MAX_CLIENTS = _env_int("STREAM_MAX_CLIENTS", 4)
+# Cadence maximale (images/s) envoyée à chaque client du flux.
+STREAM_MAX_FPS = _env_float("STREAM_MAX_FPS", 15.0)
+
+# --- Ingestion multi-caméras ---
+# Fichier JSON des sources surveillées au démarrage : [{"name", "url", "fps", "priority"}].
+VIDEO_SOURCES = os.getenv("VIDEO_SOURCES", "")
+# Cadence d'analyse (images/s) par défaut d'une source.
+INGEST_DEFAULT_FPS = _env_float("INGEST_DEFAULT_FPS", 2.0)
+# Nombre maximal de sources surveillées (fichier et API confondus).
+MAX_SOURCES = _env_int("MAX_SOURCES", 32)
+# Ouvertures échouées consécutives avant l'abandon du flux d'une source (0 : jamais).
+SOURCE_MAX_OPEN_FAILURES = _env_int("SOURCE_MAX_OPEN_FAILURES", 30)
+# Inférences simultanées, toutes sources confondues.
+INGEST_MAX_IN_FLIGHT = _env_int("INGEST_MAX_IN_FLIGHT", BATCH_MAX_SIZE)
+# Intervalle (s) de scrutation des nouvelles frames par le répartiteur.
+INGEST_POLL_INTERVAL = _env_float("INGEST_POLL_INTERVAL", 0.01)
+# Nombre de mesures de latence conservées par source.
+INGEST_LATENCY_WINDOW = _env_int("INGEST_LATENCY_WINDOW", 200)
+
+# --- Régions d'intérêt et taille d'entrée par source vidéo ---
+# Fichier JSON des profils : {"source": {"roi": [[[x, y], ...]], "imgsz": [320, 480, 640]}}.
+SOURCE_PROFILES = os.getenv("SOURCE_PROFILES", "")
+# File d'inférence (en lots pleins) au-delà de laquelle une source adaptative réduit sa taille d'entrée...
+ADAPTIVE_HIGH_LOAD = _env_float("ADAPTIVE_HIGH_LOAD", 1.0)
+# ... et en deçà de laquelle elle l'augmente.
+ADAPTIVE_LOW_LOAD = _env_float("ADAPTIVE_LOW_LOAD", 0.25)
+# Intervalle minimal (s) entre deux changements de taille d'une source.
+ADAPTIVE_INTERVAL = _env_float("ADAPTIVE_INTERVAL", 2.0)
+# Durée (s) passée à la plus grande taille après une détection.
+ADAPTIVE_HOLD_SECONDS = _env_float("ADAPTIVE_HOLD_SECONDS", 10.0)
+
+# --- Saut des frames statiques (webcam) ---
+# Réutiliser les détections précédentes tant que la scène ne change pas (1 pour activer).
+SCENE_GATE_ENABLED = _env_int("SCENE_GATE_ENABLED", 0)
+# Largeur (px) de la vignette en niveaux de gris comparée entre deux frames.
+SCENE_GATE_WIDTH = _env_int("SCENE_GATE_WIDTH", 64)
+# Écart de niveau de gris (0-255) à partir duquel un pixel de la vignette a changé.
+SCENE_GATE_PIXEL_DELTA = _env_int("SCENE_GATE_PIXEL_DELTA", 16)
+# Part des pixels changés (0-1) au-delà de laquelle la frame est réanalysée.
+SCENE_GATE_THRESHOLD = _env_float("SCENE_GATE_THRESHOLD", 0.005)
+# Intervalle maximal (s) entre deux inférences complètes, même sans changement.
+SCENE_GATE_MAX_INTERVAL = _env_float("SCENE_GATE_MAX_INTERVAL", 2.0)
+
+# --- Suivi entre images clés (webcam) ---
+# Détecteur sur les seules images clés, boîtes suivies par flux optique entre elles (1 pour activer).
+TRACKING_ENABLED = _env_int("TRACKING_ENABLED", 0)
+# N initial : frames entre deux images clés.
+KEYFRAME_INTERVAL = _env_int("KEYFRAME_INTERVAL", 5)
+# Adapter N au CPU disponible (0 pour garder KEYFRAME_INTERVAL).
+KEYFRAME_ADAPTIVE = _env_int("KEYFRAME_ADAPTIVE", 1)
+# Bornes de N lorsqu'il est adapté.
+KEYFRAME_MIN_INTERVAL = _env_int("KEYFRAME_MIN_INTERVAL", 1)
+KEYFRAME_MAX_INTERVAL = _env_int("KEYFRAME_MAX_INTERVAL", 30)
+# Délai maximal (s) entre deux images clés, quel que soit N.
+KEYFRAME_MAX_SECONDS = _env_float("KEYFRAME_MAX_SECONDS", 1.0)
+# Part (0-1) du temps entre frames que l'inférence peut occuper, CPU libre.
+KEYFRAME_CPU_BUDGET = _env_float("KEYFRAME_CPU_BUDGET", 0.5)
+# IoU minimal pour associer une détection à une piste existante.
+TRACK_IOU_THRESHOLD = _env_float("TRACK_IOU_THRESHOLD", 0.3)
+# Images clés sans détection avant suppression d'une piste.
+TRACK_MAX_MISSED = _env_int("TRACK_MAX_MISSED", 2)
+# Largeur (px) des frames en niveaux de gris utilisées pour le flux optique.
+TRACK_WIDTH = _env_int("TRACK_WIDTH", 320)
+
+# --- Réponses ---
+# Qualité JPEG par défaut des images annotées (1-100).
+JPEG_QUALITY = _env_int("JPEG_QUALITY", 95)
+
+# --- Post-traitement des détections ---
+# Seuil de confiance par défaut appliqué à toutes les classes.
+CONFIDENCE_THRESHOLD = _env_float("CONFIDENCE_THRESHOLD", 0.5)
+
+
+def _parse_class_thresholds(value):
+    thresholds = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, threshold = item.split("=")
+        thresholds[name.strip()] = float(threshold)
+    return thresholds
+
+
+# Seuils propres à certaines classes, ex: "fire=0.5,smoke=0.4".
+CLASS_CONFIDENCE_THRESHOLDS = _parse_class_thresholds(os.getenv("CLASS_CONFIDENCE_THRESHOLDS", ""))
+
+# --- Modèle ---
+# Poids du modèle YOLO chargés au démarrage.
+MODEL_PATH = os.getenv("MODEL_PATH", "best.pt")
+# Moteur d'inférence : "pytorch" (poids .pt), "onnx" (ONNX Runtime) ou "openvino".
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch")
+# Précision du modèle exporté : "fp32" ou "int8" (quantification post-entraînement).
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32")
+# Taille d'entrée (px) des modèles exportés.
+INFERENCE_IMGSZ = _env_int("INFERENCE_IMGSZ", 640)
+# Dossier des images locales utilisées pour calibrer la quantification INT8.
+CALIBRATION_IMAGES = os.getenv("CALIBRATION_IMAGES", "calibration")
+# Inférences de préchauffage par taille de lot (1 et BATCH_MAX_SIZE) au démarrage.
+MODEL_WARMUP_RUNS = _env_int("MODEL_WARMUP_RUNS", 2)
+# Tailles d'entrée (px) supplémentaires préchauffées, ex: "320,480" (tailles des profils de sources).
+WARMUP_IMGSZ = tuple(int(size) for size in os.getenv("WARMUP_IMGSZ", "").split(",") if size.strip())
+
+# --- Processus de modèle ---
+# Nombre de processus d'inférence, chacun avec son modèle (0 : modèle dans le processus de l'API).
+MODEL_WORKERS = _env_int("MODEL_WORKERS", 0)
+# Threads de calcul (intra-op) par processus ; 0 : cœurs répartis entre les processus.
+WORKER_THREADS = _env_int("WORKER_THREADS", 0)
+# Taille (octets) d'un emplacement de frame en mémoire partagée (1080p BGR par défaut).
+WORKER_SLOT_BYTES = _env_int("WORKER_SLOT_BYTES", 1920 * 1080 * 3)
+# Emplacements de mémoire partagée par processus (au-delà, les frames sont sérialisées).
+WORKER_SLOTS = _env_int("WORKER_SLOTS", BATCH_MAX_SIZE)
+# Durée maximale (s) d'un lot avant de considérer le processus bloqué et de le relancer.
+WORKER_TIMEOUT = _env_float("WORKER_TIMEOUT", 60.0)
+# Délai (s) avant la relance d'un processus arrêté, doublé à chaque échec consécutif.
+WORKER_RESTART_DELAY = _env_float("WORKER_RESTART_DELAY", 1.0)
+WORKER_RESTART_MAX_DELAY = _env_float("WORKER_RESTART_MAX_DELAY", 30.0)
+
+# --- Inférence par tuiles (images haute résolution : drones, satellites) ---
+# Découpe des grandes images en tuiles recouvrantes (0 pour désactiver).
+TILING_ENABLED = _env_int("TILING_ENABLED", 0)
+# Côté (px) des tuiles, à la taille d'entrée du modèle par défaut.
+TILE_SIZE = _env_int("TILE_SIZE", INFERENCE_IMGSZ)
+# Recouvrement entre tuiles voisines (fraction du côté).
+TILE_OVERLAP = _env_float("TILE_OVERLAP", 0.2)
+# Plus grand côté (px) à partir duquel une image est découpée.
+TILE_MIN_SIZE = _env_int("TILE_MIN_SIZE", 1280)
+# Nombre de tuiles d'une image soumises ensemble à l'inférence.
+TILE_CONCURRENCY = _env_int("TILE_CONCURRENCY", BATCH_MAX_SIZE)
+# Passe supplémentaire sur l'image entière (grands objets à cheval sur plusieurs tuiles).
+TILE_INCLUDE_FULL = _env_int("TILE_INCLUDE_FULL", 1)
+# Fusion des détections aux bords des tuiles : NMS par classe, seuil et mesure ("iou" ou "ios").
+TILE_NMS_THRESHOLD = _env_float("TILE_NMS_THRESHOLD", 0.5)
+TILE_NMS_METRIC = os.getenv("TILE_NMS_METRIC", "iou")
+
+# --- Cache des résultats de /detect_fire_url ---
+# Activation du cache (0 pour désactiver).
+DETECTION_CACHE_ENABLED = _env_int("DETECTION_CACHE_ENABLED", 1)
+# Budget mémoire (octets) du cache : au-delà, éviction LRU.
+DETECTION_CACHE_MAX_BYTES = _env_int("DETECTION_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+# Durée de vie maximale (s) d'une entrée.
+DETECTION_CACHE_TTL = _env_float("DETECTION_CACHE_TTL", 3600.0)
+# Durée (s) pendant laquelle une URL est servie sans revalidation auprès du serveur.
+DETECTION_CACHE_FRESH_SECONDS = _env_float("DETECTION_CACHE_FRESH_SECONDS", 60.0)
+
+# --- Détection par lot ---
+# Nombre maximal d'images par requête de lot.
+BULK_MAX_ITEMS = _env_int("BULK_MAX_ITEMS", 500)
+# Téléchargements/analyses simultanés, tous lots confondus.
+BULK_CONCURRENCY = _env_int("BULK_CONCURRENCY", 16)
+
+# --- Historique des détections (DuckDB) ---
+# Enregistrement des détections (0 pour désactiver).
+STORE_ENABLED = _env_int("STORE_ENABLED", 1)
+# Base DuckDB des détections récentes.
+STORE_PATH = os.getenv("STORE_PATH", "fire_detections.duckdb")
+# Dossier des archives Parquet (une partition par jour).
+STORE_PARQUET_DIR = os.getenv("STORE_PARQUET_DIR", "detections_parquet")
+# Lignes en attente d'écriture au-delà desquelles les nouvelles détections sont abandonnées.
+STORE_QUEUE_MAX = _env_int("STORE_QUEUE_MAX", 100_000)
+# Écriture groupée dès que ce nombre de lignes est en attente...
+STORE_FLUSH_ROWS = _env_int("STORE_FLUSH_ROWS", 1000)
+# ... ou au plus tard après ce délai (s).
+STORE_FLUSH_INTERVAL = _env_float("STORE_FLUSH_INTERVAL", 1.0)
+# Ancienneté (h) au-delà de laquelle les lignes sont archivées en Parquet.
+STORE_RETENTION_HOURS = _env_float("STORE_RETENTION_HOURS", 24.0)
+# Intervalle (s) entre deux archivages.
+STORE_ARCHIVE_INTERVAL = _env_float("STORE_ARCHIVE_INTERVAL", 600.0)
+
+# --- Métriques (/metrics, en-tête Server-Timing) ---
+# Mesure des étapes (téléchargement, décodage, inférence...) et des requêtes (0 pour désactiver).
+METRICS_ENABLED = _env_int("METRICS_ENABLED", 1)
+# Bornes (s) des histogrammes de latence, séparées par des virgules.
+METRICS_BUCKETS = tuple(
+    float(bound) for bound in os.getenv(
+        "METRICS_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",")
+)
+
+# --- Décodage des images ---
+# Les JPEG plus grands sont décodés à résolution réduite (1/2, 1/4, 1/8) tant
+# que le grand côté reste au moins égal à cette taille (2x l'entrée du modèle).
+DECODE_MIN_SIZE = _env_int("DECODE_MIN_SIZE", 1280)
@@ -0,0 +1,103 @@
+# downloads.py - Téléchargement asynchrone des images
+
+"""
+Client HTTP asynchrone partagé pour télécharger les images à analyser.
+
+Un seul ``httpx.AsyncClient`` est créé pour toute l'application : les
+connexions sont réutilisées (keep-alive) au lieu d'être rouvertes à chaque
+requête, et le téléchargement est lu en flux avec une taille maximale pour
+ne jamais charger en mémoire une réponse démesurée.
+"""
+
+import httpx
+
+from api_fastapi import config
+
+
+class DownloadError(Exception):
+    """
+    Échec du téléchargement d'une image, avec le code HTTP à renvoyer au client.
+    """
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+_client = None
+
+
+def get_http_client():
+    """
+    Retourne le client HTTP partagé (créé à la première utilisation).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=config.HTTP_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def download_image(url, max_bytes=None, etag=None, last_modified=None):
+    """
+    Télécharge une image et retourne ``(contenu, en-têtes)``.
+
+    Avec ``etag`` et/ou ``last_modified``, la requête est conditionnelle
+    (``If-None-Match`` / ``If-Modified-Since``) : si le serveur répond 304,
+    le contenu retourné est ``None``.
+
+    Lève une ``DownloadError`` si l'URL est injoignable, si la réponse n'est
+    pas une image ou si elle dépasse ``max_bytes``.
+    """
+    max_bytes = max_bytes or config.MAX_DOWNLOAD_BYTES
+    client = get_http_client()
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and headers:
+                return None, response.headers
+            if response.status_code != 200:
+                raise DownloadError(400, "Impossible de télécharger l'image depuis l'URL")
+
+            # Vérifier le type de contenu
+            content_type = response.headers.get("content-type", "")
+            if not content_type.startswith("image/"):
+                raise DownloadError(400, "L'URL ne pointe pas vers une image valide")
+
+            # En-tête invalide ignoré : la lecture en flux borne la taille de toute façon
+            try:
+                content_length = int(response.headers.get("content-length", ""))
+            except ValueError:
+                content_length = None
+            if content_length is not None and content_length > max_bytes:
+                raise DownloadError(413, "Image trop volumineuse")
+
+            # Lecture en flux : on s'arrête dès que la taille maximale est dépassée
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise DownloadError(413, "Image trop volumineuse")
+                chunks.append(chunk)
+            return b"".join(chunks), response.headers
+    except httpx.HTTPError as e:
+        raise DownloadError(400, f"Erreur lors du téléchargement: {str(e)}")
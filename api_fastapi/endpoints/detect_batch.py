@@ -0,0 +1,169 @@
+# detect_batch.py - Détection par lot avec résultats en flux NDJSON
+
+"""
+Analyse de nombreuses images en une seule requête.
+
+Pensé pour les balayages périodiques de centaines d'instantanés de caméras :
+les images sont téléchargées en parallèle (``BULK_CONCURRENCY`` au plus,
+tous lots confondus), l'inférence est regroupée par l'ordonnanceur de
+micro-batching et chaque résultat est renvoyé dès qu'il est prêt, une ligne
+JSON par image (NDJSON), dans l'ordre de complétion.
+
+Une image en erreur (y compris un fichier au-delà de ``MAX_DOWNLOAD_BYTES``)
+produit une ligne ``"success": false`` avec son code et son message : le
+reste du lot continue.
+"""
+
+import asyncio
+import json
+from typing import List, Literal
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import Field
+
+from api_fastapi import config
+from api_fastapi.concurrency import request_limiter, run_cpu
+from api_fastapi.downloads import DownloadError
+from api_fastapi.imaging import ImageDecodeError, encode_base64
+from api_fastapi.pipeline import analyse_content, analyse_url
+from api_fastapi.responses import DetectionOutputOptions, options_from_form
+from api_fastapi.store import detection_store
+
+router = APIRouter()
+
+# Plafond global des analyses de lot simultanées
+_bulk_slots = asyncio.Semaphore(config.BULK_CONCURRENCY)
+
+
+class BulkOptions(DetectionOutputOptions):
+    """
+    Options de sortie d'un lot : détections seules (par défaut) ou avec image en base64.
+    """
+    response_format: Literal["detections", "json"] = "detections"
+
+
+class BatchUrlRequest(BulkOptions):
+    image_urls: List[str] = Field(min_length=1, max_length=config.BULK_MAX_ITEMS)
+
+
+async def _process_item(index, source, analyse):
+    """
+    Analyse une image du lot et retourne sa ligne de résultat (jamais d'exception).
+    """
+    async with _bulk_slots:
+        try:
+            results, jpeg = await analyse()
+            item = {
+                "index": index,
+                "source": source,
+                "success": True,
+                "detections": results["detections"],
+                "fire_detected": results["fire_detected"],
+                "smoke_detected": results["smoke_detected"],
+            }
+            if jpeg is not None:
+                item["encoded_image"] = await run_cpu(encode_base64, jpeg)
+            return item
+        except DownloadError as e:
+            return {"index": index, "source": source, "success": False,
+                    "status_code": e.status_code, "error": e.detail}
+        except ImageDecodeError as e:
+            return {"index": index, "source": source, "success": False,
+                    "status_code": 400, "error": str(e)}
+        except HTTPException as e:
+            return {"index": index, "source": source, "success": False,
+                    "status_code": e.status_code, "error": e.detail}
+        except Exception as e:
+            return {"index": index, "source": source, "success": False,
+                    "status_code": 500, "error": f"Erreur: {str(e)}"}
+
+
+async def _ndjson_results(items):
+    """
+    Lance l'analyse de chaque élément et émet les lignes NDJSON dans l'ordre de complétion.
+
+    Args:
+        items: Liste de ``(source, fonction asynchrone -> (résultats, jpeg))``.
+    """
+    tasks = [
+        asyncio.create_task(_process_item(index, source, analyse))
+        for index, (source, analyse) in enumerate(items)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            yield (json.dumps(jsonable_encoder(item)) + "\n").encode()
+    finally:
+        # Client déconnecté : inutile de poursuivre les analyses restantes
+        for task in tasks:
+            task.cancel()
+
+
+def _ndjson_response(items):
+    return StreamingResponse(_ndjson_results(items), media_type="application/x-ndjson")
+
+
+@router.post("/detect_fire_batch")
+async def detect_fire_batch(request: BatchUrlRequest):
+    """
+    Détecte le feu et la fumée sur une liste d'URL d'images.
+
+    Réponse en flux NDJSON : une ligne par image avec ``index`` (position dans
+    la liste), ``source`` (URL), ``success`` puis les détections ou l'erreur.
+    Les URL passent par le même cache que ``/detect_fire_url``.
+    """
+    def analyser(url):
+        async def analyse():
+            results, jpeg, _ = await analyse_url(url, request)
+            return results, jpeg
+        return analyse
+
+    return _ndjson_response([(url, analyser(url)) for url in request.image_urls])
+
+
+@router.post("/detect_fire_batch_files")
+async def detect_fire_batch_files(
+    files: List[UploadFile] = File(...),
+    response_format: str = Form(None),
+    jpeg_quality: int = Form(None),
+    max_size: int = Form(None),
+):
+    """
+    Détecte le feu et la fumée sur des images envoyées en multipart.
+
+    Même réponse NDJSON que ``/detect_fire_batch`` ; ``source`` est le nom du fichier.
+    Un fichier au-delà de ``MAX_DOWNLOAD_BYTES`` n'est pas lu en entier : il
+    donne une ligne d'erreur 413. La réception des fichiers passe par le
+    limiteur de requêtes (429 si le serveur est saturé).
+    """
+    if len(files) > config.BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Au plus {config.BULK_MAX_ITEMS} images par lot")
+    options = options_from_form(
+        BulkOptions, response_format=response_format, jpeg_quality=jpeg_quality, max_size=max_size
+    )
+
+    def analyser(filename, content):
+        async def analyse():
+            results, jpeg, _, _ = await analyse_content(content, options)
+            detection_store.record(f"upload:{filename}", results)
+            return results, jpeg
+        return analyse
+
+    async def too_large():
+        raise HTTPException(status_code=413, detail="Image trop volumineuse")
+
+    async def read(upload):
+        if upload.size is not None and upload.size > config.MAX_DOWNLOAD_BYTES:
+            return too_large
+        # Taille inconnue : lecture bornée à un octet au-delà du maximum
+        content = await upload.read(config.MAX_DOWNLOAD_BYTES + 1)
+        if len(content) > config.MAX_DOWNLOAD_BYTES:
+            return too_large
+        return analyser(upload.filename, content)
+
+    async with request_limiter:
+        # Les fichiers reçus sont fermés dès la fin du handler : les lire maintenant
+        items = [(upload.filename, await read(upload)) for upload in files]
+    return _ndjson_response(items)
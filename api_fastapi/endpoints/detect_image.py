@@ -1,92 +1,103 @@
-# detect_image.py - Endpoint pour la détection de feu via URL d'image
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-import requests
-import numpy as np
-from PIL import Image
-import io
-import cv2
-import base64
-from api_fastapi.ml import detect_fire_image
+# detect_image.py - Endpoints pour la détection de feu sur une image (URL ou fichier envoyé)
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from api_fastapi import config
+from api_fastapi.concurrency import request_limiter
+from api_fastapi.downloads import DownloadError
+from api_fastapi.imaging import ImageDecodeError
+from api_fastapi.metrics import error_detail
+from api_fastapi.pipeline import analyse_content, analyse_url
+from api_fastapi.store import detection_store
+from api_fastapi.responses import (
+    DetectionOutputOptions,
+    detection_message,
+    format_detection_response,
+    options_from_form,
+)
 
 router = APIRouter()
 
-class ImageUrlRequest(BaseModel):
+class ImageUrlRequest(DetectionOutputOptions):
     image_url: str
 
-@router.post("/detect_fire_url")  
+
+def _image_payload(results):
+    fire_detected = results["fire_detected"]
+    smoke_detected = results["smoke_detected"]
+    return {
+        "success": True,
+        "message": detection_message(fire_detected, smoke_detected, "dans l'image"),
+        "detections": results["detections"],
+        "fire_detected": fire_detected,
+        "smoke_detected": smoke_detected,
+    }
+
+
+@router.post("/detect_fire_url")
 async def detect_fire_url(request: ImageUrlRequest):
     """
     Détecte le feu et la fumée dans une image fournie par URL.
+
+    Le téléchargement est asynchrone et le travail CPU (décodage, dessin,
+    encodage) est déporté hors de la boucle asyncio. Au-delà de la capacité
+    configurée, la requête est rejetée avec un 429.
+
+    ``response_format`` choisit la sortie : ``json`` (par défaut, image en
+    base64), ``detections`` (sans image), ``jpeg`` ou ``multipart``.
+
+    Les résultats sont mis en cache par URL et par contenu (voir
+    ``api_fastapi.pipeline``) ; l'en-tête ``X-Cache`` indique l'origine
+    de la réponse. L'en-tête ``Server-Timing`` détaille la durée de chaque
+    étape (téléchargement, décodage, inférence, rendu, encodage) et une erreur
+    500 indique l'étape en échec.
+    """
+    async with request_limiter:
+        try:
+            results, jpeg, cache_status = await analyse_url(request.image_url, request)
+            payload = _image_payload(results)
+            return await format_detection_response(payload, request, jpeg, headers={"X-Cache": cache_status})
+
+        except DownloadError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except ImageDecodeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=error_detail(e))
+
+
+@router.post("/detect_fire_upload")
+async def detect_fire_upload(
+    file: UploadFile = File(...),
+    response_format: str = Form(None),
+    jpeg_quality: int = Form(None),
+    max_size: int = Form(None),
+):
     """
-    try:
-        # Télécharger l'image depuis l'URL
-        response = requests.get(request.image_url, timeout=10)
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Impossible de télécharger l'image depuis l'URL")
-        
-        # Vérifier le type de contenu
-        content_type = response.headers.get('content-type', '')
-        if not content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="L'URL ne pointe pas vers une image valide")
-        
-        # Convertir en image PIL puis en array numpy
-        image = Image.open(io.BytesIO(response.content))
-        image_array = np.array(image)
-        
-        # Convertir RGB en BGR pour OpenCV
-        if len(image_array.shape) == 3:
-            image_array = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
-        
-        # Garder une copie pour dessiner les détections
-        image_with_detections = image_array.copy()
-        
-        # Utiliser la fonction du ml.py
-        results = detect_fire_image(image_array)
-        
-        # Dessiner les boîtes de détection sur l'image
-        for detection in results["detections"]:
-            x1, y1, x2, y2 = int(detection["x1"]), int(detection["y1"]), int(detection["x2"]), int(detection["y2"])
-            confidence = detection["confidence"]
-            detection_type = detection["type"]
-            
-            # Couleur selon le type
-            color = (0, 0, 255) if detection_type == "fire" else (0, 255, 255)  # Rouge pour feu, jaune pour fumée
-            
-            # Dessiner la boîte
-            cv2.rectangle(image_with_detections, (x1, y1), (x2, y2), color, 2)
-            
-            # Ajouter le texte
-            label = f"{detection_type}: {confidence:.2f}"
-            cv2.putText(image_with_detections, label, (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-        
-        # Convertir l'image en base64 pour l'envoyer à Streamlit
-        _, buffer = cv2.imencode('.jpg', image_with_detections)
-        image_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        # Message de réponse
-        fire_detected = results["fire_detected"]
-        smoke_detected = results["smoke_detected"]
-        
-        if fire_detected and smoke_detected:
-            message = "Feu et fumée détectés dans l'image"
-        elif fire_detected:
-            message = "Feu détecté dans l'image"
-        elif smoke_detected:
-            message = "Fumée détectée dans l'image"
-        else:
-            message = "Aucun feu ou fumée détecté"
-        
-        return {
-            "success": True,
-            "message": message,
-            "detections": results["detections"],
-            "fire_detected": fire_detected,
-            "smoke_detected": smoke_detected,
-            "encoded_image": image_base64  # ← Change "image_encoded" en "encoded_image"
-        }
-            
-    except requests.RequestException as e:
-        raise HTTPException(status_code=400, detail=f"Erreur lors du téléchargement: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+    Détecte le feu et la fumée dans une image envoyée en multipart.
+
+    Les octets reçus sont décodés directement en BGR par ``cv2.imdecode``
+    (les très grands JPEG à résolution réduite) ; les boîtes sont toujours
+    exprimées dans les coordonnées de l'image d'origine. Mêmes formats de
+    réponse que ``/detect_fire_url``.
+    """
+    options = options_from_form(
+        DetectionOutputOptions, response_format=response_format, jpeg_quality=jpeg_quality, max_size=max_size
+    )
+    if file.size is not None and file.size > config.MAX_DOWNLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image trop volumineuse")
+
+    async with request_limiter:
+        try:
+            content = await file.read()
+            results, jpeg, _, _ = await analyse_content(content, options)
+            detection_store.record(f"upload:{file.filename}", results)
+            payload = _image_payload(results)
+            return await format_detection_response(payload, options, jpeg)
+
+        except ImageDecodeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=error_detail(e))
@@ -1,62 +1,72 @@
 # detect_webcam.py
 
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
 from datetime import datetime
-import cv2
-import base64
-from api_fastapi.ml import detect_fire_webcam
+from api_fastapi.camera import camera_manager
+from api_fastapi.concurrency import request_limiter, run_cpu
+from api_fastapi.metrics import error_detail, stage
+from api_fastapi.ml import batch_scheduler, capture_webcam_frame
+from api_fastapi.responses import DetectionOutputOptions, build_detection_response, detection_message
+from api_fastapi.tracking import detect_tracked
 
 router = APIRouter()
 
-class WebcamRequest(BaseModel):
+class WebcamRequest(DetectionOutputOptions):
     camera_index: int = 0
 
 @router.post("/detect_fire_webcam")  
 async def detect_fire_webcam_endpoint(params: WebcamRequest = WebcamRequest()):
     """
     Détecte le feu, dessine sur l'image et la retourne.
+
+    La capture, le dessin et l'encodage sont déportés hors de la boucle asyncio.
+    Mêmes formats de réponse que ``/detect_fire_url`` ; en JSON, l'image
+    annotée est dans ``encoded_image``. ``inferred`` vaut ``false`` lorsque
+    les détections n'ont pas été recalculées (scène inchangée ou frame entre
+    deux images clés). Avec le suivi activé, chaque détection porte un
+    ``track_id`` stable et ``new_track_ids`` liste les pistes apparues.
+
+    Étapes mesurées (``Server-Timing``, ``/metrics``) : ``capture``, ``detect``
+    (portier de scène, suivi et inférence), ``render`` et ``encode``.
+    """
+    if not camera_manager.allowed(params.camera_index):
+        raise HTTPException(status_code=404, detail=f"Caméra {params.camera_index} non autorisée")
+    async with request_limiter:
+        try:
+            # Récupérer la dernière frame (attente éventuelle hors de la boucle asyncio)
+            with stage("capture"):
+                frame = await run_cpu(capture_webcam_frame, params.camera_index)
+            # Détections réutilisées si la scène n'a pas changé (SCENE_GATE_ENABLED),
+            # ou suivies entre deux images clés (TRACKING_ENABLED)
+            with stage("detect"):
+                results, inferred = await detect_tracked(params.camera_index, frame, batch_scheduler.submit)
+
+            fire_detected = results["fire_detected"]
+            smoke_detected = results["smoke_detected"]
+            payload = {
+                "success": True,
+                "message": detection_message(fire_detected, smoke_detected, "via webcam"),
+                "detections": results["detections"],
+                "fire_detected": fire_detected,
+                "smoke_detected": smoke_detected,
+                "inferred": inferred,
+                "timestamp": datetime.now(),
+            }
+            if "track_ids" in results:
+                payload["new_track_ids"] = results["new_track_ids"]
+
+            # La frame du tampon est partagée : le dessin se fait sur une copie
+            return await build_detection_response(frame, results, payload, params, copy=True)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=error_detail(e))
+
+
+@router.get("/cameras")
+async def cameras_status():
+    """
+    Retourne l'état des caméras ouvertes (FPS de capture, âge de la dernière frame).
     """
-    try:
-        # <--- CHANGEMENT CLÉ : Récupérer les résultats ET la frame
-        results, frame = detect_fire_webcam(params.camera_index)
-        
-        # Dessiner les boîtes de détection sur l'image
-        for detection in results["detections"]:
-            x1, y1, x2, y2 = int(detection["x1"]), int(detection["y1"]), int(detection["x2"]), int(detection["y2"])
-            confidence = detection["confidence"]
-            detection_type = detection["type"]
-            color = (0, 0, 255) if detection_type == "fire" else (0, 255, 255)
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            label = f"{detection_type}: {confidence:.2f}"
-            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-        
-        # Encoder l'image modifiée en base64
-        _, buffer = cv2.imencode('.jpg', frame)
-        image_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        # Message de réponse
-        fire_detected = results["fire_detected"]
-        smoke_detected = results["smoke_detected"]
-        
-        if fire_detected and smoke_detected:
-            message = "Feu et fumée détectés via webcam"
-        elif fire_detected:
-            message = "Feu détecté via webcam"
-        elif smoke_detected:
-            message = "Fumée détectée via webcam"
-        else:
-            message = "Aucun feu ou fumée détecté"
-        
-        return {
-            "success": True,
-            "message": message,
-            "detections": results["detections"],
-            "fire_detected": fire_detected,
-            "smoke_detected": smoke_detected,
-            "timestamp": datetime.now(),
-            "image_encoded": image_base64  # <--- L'image encodée est maintenant incluse
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+    return {"cameras": camera_manager.stats()}
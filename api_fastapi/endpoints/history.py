@@ -0,0 +1,35 @@
+# history.py - Consultation de l'historique des détections
+
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from api_fastapi.concurrency import run_cpu
+from api_fastapi.store import detection_store
+
+router = APIRouter()
+
+
+@router.get("/detections/history")
+async def detections_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    source: Optional[str] = None,
+    class_name: Optional[str] = None,
+    limit: int = Query(1000, gt=0, le=100_000),
+):
+    """
+    Détections enregistrées entre ``start`` et ``end`` (ISO 8601), filtrées
+    par ``source`` (URL, ``webcam:0``, ``upload:<fichier>``, nom de source)
+    et par classe, les plus récentes d'abord.
+
+    La base DuckDB (détections récentes) et les archives Parquet sont
+    interrogées ensemble. Les détections encore en file d'écriture (au plus
+    ``STORE_FLUSH_INTERVAL`` s) n'apparaissent pas encore.
+    """
+    try:
+        rows = await run_cpu(detection_store.history, start, end, source, class_name, limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"count": len(rows), "detections": rows}
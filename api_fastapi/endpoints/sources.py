@@ -0,0 +1,87 @@
+# sources.py - Gestion des sources vidéo surveillées en continu
+
+from typing import List, Optional, Union
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+
+from api_fastapi.ingestion import SourceError, SourceLimitError, SourceNotAllowedError, ingestion_service
+from api_fastapi.profiles import ProfileError
+
+router = APIRouter()
+
+
+class SourceRequest(BaseModel):
+    name: str = Field(min_length=1)
+    url: str = Field(min_length=1)
+    fps: Optional[float] = Field(default=None, gt=0)
+    priority: float = Field(default=1.0, gt=0)
+    # Polygones de la région d'intérêt, points [x, y] normalisés entre 0 et 1
+    roi: Optional[List[List[List[float]]]] = None
+    # Taille d'entrée fixe, ou tailles entre lesquelles la source s'adapte à la charge
+    imgsz: Optional[Union[int, List[int]]] = None
+
+
+@router.get("/sources")
+async def list_sources():
+    """
+    Liste les sources surveillées avec leurs métriques (cadence obtenue,
+    frames abandonnées, latence capture -> résultat).
+    """
+    return ingestion_service.stats()
+
+
+@router.post("/sources", status_code=201)
+async def add_source(request: SourceRequest):
+    """
+    Ajoute une source vidéo (URL RTSP/HTTP, chemin de fichier ou index de
+    périphérique) analysée en continu à ``fps`` images/s au plus.
+
+    À capacité d'inférence saturée, les sources sont servies au prorata de
+    leur ``priority`` et sautent des frames plutôt que de prendre du retard.
+
+    ``roi`` limite l'analyse aux polygones donnés (le reste de la frame n'est
+    pas calculé) ; ``imgsz`` fixe la taille d'entrée du modèle, ou une liste
+    de tailles entre lesquelles la source s'adapte à la charge.
+
+    Un index de périphérique doit figurer dans ``CAMERA_ALLOWED_INDEXES``
+    (sinon 403) ; au-delà de ``MAX_SOURCES`` sources, la requête est rejetée
+    avec un 429.
+    """
+    try:
+        source = ingestion_service.add(
+            request.name, request.url, request.fps, request.priority, request.roi, request.imgsz
+        )
+    except SourceNotAllowedError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except SourceLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except SourceError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProfileError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return source.stats()
+
+
+@router.delete("/sources/{name}")
+async def remove_source(name: str):
+    """
+    Arrête la surveillance d'une source et ferme son flux.
+    """
+    try:
+        ingestion_service.remove(name)
+    except SourceError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"success": True, "name": name}
+
+
+@router.get("/sources/{name}")
+async def source_detections(name: str):
+    """
+    Dernier résultat de détection d'une source et ses métriques.
+    """
+    try:
+        source = ingestion_service.get(name)
+    except SourceError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"result": source.last_result, "stats": source.stats()}
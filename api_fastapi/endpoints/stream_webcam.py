@@ -0,0 +1,131 @@
+# stream_webcam.py - Flux MJPEG annoté pour la webcam
+
+"""
+Flux vidéo annoté poussé par le serveur sur une seule connexion HTTP.
+
+Au lieu d'une requête POST par image (JSON + JPEG en base64), le client
+ouvre une fois ``/stream_fire_webcam`` et reçoit un flux
+``multipart/x-mixed-replace`` : chaque partie contient un JPEG annoté et les
+métadonnées de détection dans l'en-tête ``X-Detections`` (JSON).
+
+Le serveur envoie toujours la frame la plus récente de la caméra : si le
+client lit moins vite que la caméra ne produit, les frames intermédiaires
+sont abandonnées (compteur ``dropped``) au lieu d'être mises en file.
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from api_fastapi import config
+from api_fastapi.camera import CameraError, camera_manager
+from api_fastapi.concurrency import run_cpu
+from api_fastapi.imaging import render_annotated_jpeg
+from api_fastapi.ml import batch_scheduler
+from api_fastapi.tracking import detect_tracked
+
+router = APIRouter()
+
+BOUNDARY = "frame"
+
+# Nombre de clients actuellement connectés au flux
+_active_streams = 0
+
+
+async def _mjpeg_parts(camera_index, max_fps, jpeg_quality=None, max_size=None):
+    """
+    Génère les parties du flux MJPEG : une frame annotée à la fois.
+    """
+    global _active_streams
+    _active_streams += 1
+    jpeg_quality = jpeg_quality or config.JPEG_QUALITY
+    min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+    last_seq = 0
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                # Attendre une frame plus récente que la dernière envoyée
+                seq, _, frame = await run_cpu(
+                    camera_manager.read_latest, camera_index, after_seq=last_seq
+                )
+            except CameraError:
+                # Caméra momentanément indisponible : la reconnexion est en cours
+                await asyncio.sleep(config.CAMERA_RECONNECT_DELAY)
+                continue
+
+            dropped = max(seq - last_seq - 1, 0) if last_seq else 0
+            last_seq = seq
+
+            results, inferred = await detect_tracked(camera_index, frame, batch_scheduler.submit)
+            jpeg = await run_cpu(
+                render_annotated_jpeg, frame, results, jpeg_quality, max_size
+            )
+
+            metadata = {
+                "frame": seq,
+                "dropped": dropped,
+                "inferred": inferred,
+                "timestamp": datetime.now().isoformat(),
+                "detections": results["detections"],
+                "fire_detected": results["fire_detected"],
+                "smoke_detected": results["smoke_detected"],
+            }
+            if "track_ids" in results:
+                metadata["new_track_ids"] = results["new_track_ids"]
+            metadata = json.dumps(metadata)
+            header = (
+                f"--{BOUNDARY}\r\n"
+                f"Content-Type: image/jpeg\r\n"
+                f"Content-Length: {len(jpeg)}\r\n"
+                f"X-Detections: {metadata}\r\n\r\n"
+            ).encode()
+            # L'envoi n'aboutit que lorsque le client a de la place : un client
+            # lent ralentit la boucle et les frames intermédiaires sont sautées
+            yield header + jpeg + b"\r\n"
+
+            elapsed = time.monotonic() - started
+            if elapsed < min_interval:
+                await asyncio.sleep(min_interval - elapsed)
+    finally:
+        _active_streams -= 1
+
+
+@router.get("/stream_fire_webcam")
+async def stream_fire_webcam(
+    camera_index: int = 0,
+    max_fps: float = None,
+    jpeg_quality: int = Query(None, ge=1, le=100),
+    max_size: int = Query(None, gt=0),
+):
+    """
+    Flux MJPEG continu des frames webcam annotées.
+
+    Chaque partie contient un JPEG et l'en-tête ``X-Detections`` (JSON avec les
+    détections, ``fire_detected``, ``smoke_detected`` et le nombre de frames
+    sautées depuis la partie précédente). ``inferred`` vaut ``false`` si les
+    détections n'ont pas été recalculées (scène inchangée ou frame suivie
+    entre deux images clés) ; avec le suivi, chaque détection porte un
+    ``track_id`` et ``new_track_ids`` liste les pistes apparues.
+    ``jpeg_quality`` et ``max_size`` (plus grand côté en pixels) réduisent le
+    coût d'encodage et le débit.
+    """
+    if not camera_manager.allowed(camera_index):
+        raise HTTPException(status_code=404, detail=f"Caméra {camera_index} non autorisée")
+    if _active_streams >= config.STREAM_MAX_CLIENTS:
+        raise HTTPException(
+            status_code=429,
+            detail="Trop de clients connectés au flux",
+            headers={"Retry-After": str(config.RETRY_AFTER_SECONDS)},
+        )
+    if max_fps is None:
+        max_fps = config.STREAM_MAX_FPS
+    return StreamingResponse(
+        _mjpeg_parts(camera_index, max_fps, jpeg_quality, max_size),
+        media_type=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+        headers={"Cache-Control": "no-store"},
+    )
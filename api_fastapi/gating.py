@@ -0,0 +1,87 @@
+# gating.py - Saut de l'inférence sur les frames sans changement de scène
+
+"""
+Filtrage des frames redondantes des caméras fixes.
+
+Nos caméras filment des scènes presque toujours statiques : analyser chaque
+frame avec YOLO refait le même calcul pour le même résultat. Le
+``SceneChangeGate`` compare une vignette en niveaux de gris de la frame
+courante à celle de la dernière frame analysée ; tant que la part de pixels
+changés reste sous ``SCENE_GATE_THRESHOLD``, les détections précédentes sont
+réutilisées.
+
+Garde-fous pour ne pas manquer un départ de feu:
+    - Inférence complète forcée au moins toutes les ``SCENE_GATE_MAX_INTERVAL`` s
+    - Tant que la dernière analyse a détecté quelque chose, chaque frame est analysée
+    - Comparaison pixel à pixel de la vignette (et non moyenne globale) : un
+      petit foyer qui apparaît suffit à déclencher une analyse
+
+Le ``SceneChangeGate`` lui-même est dans ``api_fastapi.scene`` (sans
+dépendance à l'API) ; ce module tient une porte par source et la relie à
+l'ordonnanceur d'inférence.
+"""
+
+import threading
+
+from api_fastapi import config
+from api_fastapi.concurrency import run_cpu
+from api_fastapi.scene import SceneChangeGate
+
+
+class SceneGateRegistry:
+    """
+    Un ``SceneChangeGate`` par source vidéo (index de caméra).
+    """
+
+    def __init__(self):
+        self._gates = {}
+        self._lock = threading.Lock()
+
+    def get(self, source):
+        with self._lock:
+            gate = self._gates.get(source)
+            if gate is None:
+                gate = SceneChangeGate()
+                self._gates[source] = gate
+            return gate
+
+    def remove(self, source):
+        with self._lock:
+            self._gates.pop(source, None)
+
+    def stats(self):
+        with self._lock:
+            gates = dict(self._gates)
+        return {
+            "enabled": bool(config.SCENE_GATE_ENABLED),
+            "sources": {str(source): gate.stats() for source, gate in gates.items()},
+        }
+
+
+# Registre partagé par l'endpoint webcam et le flux MJPEG
+scene_gates = SceneGateRegistry()
+
+
+async def detect_gated(source, frame, submit):
+    """
+    Analyse une frame d'une source vidéo, sauf si la scène n'a pas changé.
+
+    Args:
+        source: Identifiant de la source (index de caméra).
+        frame: Frame BGR.
+        submit: Fonction asynchrone ``frame -> résultats`` (ordonnanceur d'inférence).
+
+    Returns:
+        ``(résultats, inférence exécutée)``.
+    """
+    if not config.SCENE_GATE_ENABLED:
+        return await submit(frame), True
+
+    gate = scene_gates.get(source)
+    thumbnail, results = await run_cpu(gate.check, frame)
+    if results is not None:
+        return results, False
+
+    results = await submit(frame)
+    gate.update(thumbnail, results, active=len(results["boxes"]) > 0)
+    return results, True
@@ -0,0 +1,161 @@
+# imaging.py - Décodage, annotation et encodage des images
+
+"""
+Opérations d'image partagées par les endpoints de détection.
+
+Ces fonctions sont bloquantes (CPU) : les endpoints les appellent via
+``run_cpu`` pour ne pas bloquer la boucle asyncio.
+"""
+
+import base64
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+class ImageDecodeError(ValueError):
+    """Octets reçus illisibles en tant qu'image."""
+
+
+# Facteurs de réduction gérés nativement par le décodeur JPEG (libjpeg)
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _reduction_factor(content, min_size):
+    """
+    Plus grand facteur (2, 4 ou 8) gardant au moins ``min_size`` pixels sur le grand côté.
+
+    Seuls les JPEG sont concernés : libjpeg décode alors directement à taille
+    réduite, sans jamais allouer l'image pleine résolution. L'en-tête est lu
+    par PIL (lecture paresseuse, sans décodage des pixels).
+    """
+    if not min_size:
+        return 1
+    try:
+        with Image.open(io.BytesIO(content)) as header:
+            if header.format != "JPEG":
+                return 1
+            longest = max(header.size)
+    except Exception:
+        return 1
+    factor = 1
+    for candidate in (2, 4, 8):
+        if longest / candidate >= min_size:
+            factor = candidate
+    return factor
+
+
+def decode_image(content, min_size=None):
+    """
+    Décode les octets d'une image en tableau numpy BGR 3 canaux pour OpenCV.
+
+    Décodage direct des octets de la requête par ``cv2.imdecode`` (pas de
+    passage par PIL ni de copies intermédiaires). Les images en niveaux de
+    gris, RGBA ou à palette sont toutes ramenées en BGR. Les JPEG dont le grand
+    côté dépasse largement ``min_size`` sont décodés à résolution réduite.
+
+    Returns:
+        ``(image, échelle)`` où échelle = taille décodée / taille d'origine.
+    """
+    buffer = np.frombuffer(content, dtype=np.uint8)
+    factor = _reduction_factor(content, min_size)
+    image = cv2.imdecode(buffer, _REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR))
+    if image is None:
+        # Formats inconnus d'OpenCV : repli sur PIL
+        try:
+            with Image.open(io.BytesIO(content)) as fallback:
+                image = cv2.cvtColor(np.asarray(fallback.convert("RGB")), cv2.COLOR_RGB2BGR)
+        except Exception:
+            raise ImageDecodeError("Le contenu reçu n'est pas une image lisible")
+        factor = 1
+    return image, 1.0 / factor
+
+
+def resize_max(image, max_size):
+    """
+    Réduit l'image pour que son plus grand côté ne dépasse pas ``max_size``.
+
+    Retourne ``(image, échelle)`` ; l'image d'origine est retournée telle
+    quelle (échelle 1.0) si aucune réduction n'est nécessaire.
+    """
+    height, width = image.shape[:2]
+    if not max_size or max(height, width) <= max_size:
+        return image, 1.0
+    scale = max_size / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+
+# Couleurs BGR par classe : rouge pour feu, jaune pour fumée
+CLASS_COLORS = {"fire": (0, 0, 255), "smoke": (0, 255, 255)}
+DEFAULT_COLOR = (255, 0, 255)
+
+
+def draw_detections(image, results, scale=1.0):
+    """
+    Dessine les boîtes de détection sur l'image (modifiée sur place).
+
+    Travaille sur les colonnes du résultat (``boxes``, ``scores``, ``labels``) :
+    les coordonnées sont converties en une seule opération et toutes les
+    boîtes d'une même classe sont tracées par un unique appel ``polylines``.
+    ``scale`` convertit les coordonnées vers celles de l'image (image réduite).
+    """
+    boxes = results["boxes"]
+    if len(boxes) == 0:
+        return image
+
+    corners = np.rint(np.asarray(boxes) * scale).astype(np.int32)
+    labels = results["labels"]
+    label_array = np.asarray(labels)
+
+    # Rectangles : un appel par classe présente
+    for label in set(labels):
+        x1, y1, x2, y2 = corners[label_array == label].T
+        polygons = np.stack([
+            np.stack([x1, y1], axis=1), np.stack([x2, y1], axis=1),
+            np.stack([x2, y2], axis=1), np.stack([x1, y2], axis=1),
+        ], axis=1)
+        cv2.polylines(image, list(polygons), True, CLASS_COLORS.get(label, DEFAULT_COLOR), 2)
+
+    # Textes
+    for label, score, (x1, y1) in zip(labels, results["scores"].tolist(), corners[:, :2].tolist()):
+        color = CLASS_COLORS.get(label, DEFAULT_COLOR)
+        cv2.putText(image, f"{label}: {score:.2f}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return image
+
+
+def encode_jpeg(image, quality=95):
+    """
+    Encode l'image en JPEG et retourne les octets.
+    """
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buffer.tobytes()
+
+
+def render_annotated_jpeg(image, results, quality=95, max_size=None, copy=True, box_scale=1.0):
+    """
+    Réduit éventuellement l'image, dessine les détections et retourne le JPEG.
+
+    La réduction a lieu avant le dessin et l'encodage, qui coûtent alors
+    moins cher. Sans réduction, le dessin se fait sur une copie si ``copy``
+    (frames partagées du tampon webcam). ``box_scale`` convertit les boîtes
+    vers l'image reçue (image décodée à résolution réduite).
+    """
+    resized, scale = resize_max(image, max_size)
+    if resized is image and copy:
+        resized = image.copy()
+    draw_detections(resized, results, scale * box_scale)
+    return encode_jpeg(resized, quality)
+
+
+def encode_base64(content):
+    """
+    Encode des octets en base64 pour les inclure dans une réponse JSON.
+    """
+    return base64.b64encode(content).decode('utf-8')
@@ -0,0 +1,311 @@
+# ingestion.py - Surveillance de nombreuses sources vidéo avec partage équitable de l'inférence
+
+"""
+Service d'ingestion multi-caméras.
+
+Chaque source (flux RTSP/HTTP, fichier vidéo, périphérique local) a son
+propre thread de lecture (voir ``api_fastapi.camera``). Un répartiteur
+unique partage la capacité d'inférence entre les sources:
+
+    - Chaque source a une cadence cible (``fps``) et une priorité ; à capacité
+      saturée, une source de priorité 2 est servie deux fois plus souvent
+      qu'une source de priorité 1 (file équitable pondérée, par temps virtuel).
+    - Au plus une inférence en cours par source et ``INGEST_MAX_IN_FLIGHT``
+      au total : une source en retard saute des frames (on analyse toujours
+      la plus récente), aucune file ne se forme.
+    - Métriques par source : frames analysées, sautées (toutes les frames
+      non analysées, cadence cible comprise) et abandonnées (arrivées alors
+      que la source était due mais encore en cours d'analyse ou bloquée par
+      ``INGEST_MAX_IN_FLIGHT`` : la surcharge), cadence obtenue, latence
+      capture -> résultat, retards sur la cadence cible.
+
+Les sources sont déclarées au démarrage (fichier JSON ``VIDEO_SOURCES``) ou
+via l'API ``/sources``, avec au besoin leur région d'intérêt et leur taille
+d'entrée (voir ``api_fastapi.profiles``). Des fichiers vidéo locaux servent
+de caméras de substitution pour les essais. Au plus ``MAX_SOURCES`` sources ; un index
+de périphérique local doit figurer dans ``CAMERA_ALLOWED_INDEXES``, et le
+flux d'une source injoignable est abandonné après
+``SOURCE_MAX_OPEN_FAILURES`` tentatives (voir ``last_error`` de la caméra).
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from api_fastapi import config
+from api_fastapi.camera import camera_manager
+from api_fastapi.ml import batch_scheduler
+from api_fastapi.profiles import SourceProfile, source_profiles
+from api_fastapi.gating import scene_gates
+from api_fastapi.tracking import detect_tracked, trackers
+
+
+class SourceError(ValueError):
+    """Source inconnue ou déjà déclarée."""
+
+
+class SourceLimitError(SourceError):
+    """Nombre maximal de sources atteint (``MAX_SOURCES``)."""
+
+
+class SourceNotAllowedError(SourceError):
+    """Périphérique local hors de ``CAMERA_ALLOWED_INDEXES``."""
+
+
+class VideoSource:
+    """
+    Source surveillée : configuration, état du répartiteur et métriques.
+    """
+
+    def __init__(self, name, url, fps=None, priority=1.0, profile=None):
+        self.name = name
+        self.url = url
+        self.fps = fps or config.INGEST_DEFAULT_FPS
+        self.priority = priority
+        # Profil déclaré avec la source (sinon, celui de SOURCE_PROFILES s'il existe)
+        self.profile = profile
+        # Les index numériques désignent un périphérique local ; un flux injoignable finit par être abandonné
+        self.stream = camera_manager.get(
+            ("source", name),
+            source=int(url) if str(url).isdigit() else url,
+            max_open_failures=config.SOURCE_MAX_OPEN_FAILURES,
+        )
+
+        # État du répartiteur
+        self.in_flight = False
+        self.last_seq = 0
+        self.next_due = 0.0
+        self.virtual_time = 0.0
+        # Dernière frame disponible quand la source est devenue due
+        self.due_seq = None
+
+        # Métriques
+        self.inferred = 0
+        self.analysed = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.late = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_result = None
+        self.last_result_time = None
+        self._latencies = deque(maxlen=config.INGEST_LATENCY_WINDOW)
+        self._started = time.monotonic()
+
+    def record(self, seq, captured_at, results, inferred):
+        now = time.monotonic()
+        self.analysed += 1
+        self.inferred += int(inferred)
+        self._latencies.append(now - captured_at)
+        self.last_result = {
+            "frame": seq,
+            "inferred": inferred,
+            "detections": results["detections"],
+            "fire_detected": results["fire_detected"],
+            "smoke_detected": results["smoke_detected"],
+        }
+        if "track_ids" in results:
+            self.last_result["new_track_ids"] = results["new_track_ids"]
+        self.last_result_time = now
+        self.last_error = None
+
+    def stats(self):
+        latencies = np.asarray(self._latencies) * 1000
+        elapsed = time.monotonic() - self._started
+        profile = source_profiles.get(self.name)
+        return {
+            "name": self.name,
+            "url": self.url,
+            "target_fps": self.fps,
+            "priority": self.priority,
+            "fps": round(self.analysed / elapsed, 2) if elapsed > 0 else 0.0,
+            "analysed": self.analysed,
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "late": self.late,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "mean_latency_ms": round(float(latencies.mean()), 2) if len(latencies) else None,
+            "p95_latency_ms": round(float(np.percentile(latencies, 95)), 2) if len(latencies) else None,
+            "max_latency_ms": round(float(latencies.max()), 2) if len(latencies) else None,
+            "camera": self.stream.stats(),
+            "profile": profile.stats() if profile is not None else None,
+        }
+
+
+class IngestionService:
+    """
+    Registre des sources et répartiteur équitable de l'inférence.
+
+    Args:
+        max_in_flight: Inférences simultanées, toutes sources confondues.
+    """
+
+    def __init__(self, max_in_flight=None):
+        self.max_in_flight = max_in_flight or config.INGEST_MAX_IN_FLIGHT
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._virtual_clock = 0.0
+        self._tasks = set()
+        self._dispatcher = None
+        self._wake = None
+
+    def add(self, name, url, fps=None, priority=1.0, roi=None, imgsz=None):
+        # Profil validé avant toute ouverture de flux (ProfileError)
+        profile = SourceProfile(roi, imgsz) if roi is not None or imgsz is not None else None
+        # Mêmes périphériques locaux que les endpoints webcam
+        if str(url).isdigit() and not camera_manager.allowed(int(url)):
+            raise SourceNotAllowedError(f"Caméra {url} non autorisée (CAMERA_ALLOWED_INDEXES)")
+        with self._lock:
+            if name in self._sources:
+                raise SourceError(f"Source déjà déclarée: {name}")
+            if len(self._sources) >= config.MAX_SOURCES:
+                raise SourceLimitError(f"Au plus {config.MAX_SOURCES} sources (MAX_SOURCES)")
+            source = VideoSource(name, url, fps, priority, profile)
+            self._sources[name] = source
+        if profile is not None:
+            source_profiles.set(name, profile)
+        self._notify()
+        return source
+
+    def remove(self, name):
+        with self._lock:
+            source = self._sources.pop(name, None)
+        if source is None:
+            raise SourceError(f"Source inconnue: {name}")
+        if source.profile is not None:
+            source_profiles.remove(name)
+        # Une source redéclarée sous le même nom repart d'un suivi et d'une porte neufs
+        trackers.remove(name)
+        scene_gates.remove(name)
+        camera_manager.remove(("source", name))
+
+    def get(self, name):
+        source = self._sources.get(name)
+        if source is None:
+            raise SourceError(f"Source inconnue: {name}")
+        return source
+
+    def load(self, path):
+        """
+        Déclare les sources d'un fichier JSON : ``[{"name", "url", "fps", "priority", "roi", "imgsz"}, ...]``.
+        """
+        with open(path) as f:
+            for item in json.load(f):
+                self.add(
+                    item["name"], item["url"], item.get("fps"), item.get("priority", 1.0),
+                    item.get("roi"), item.get("imgsz"),
+                )
+
+    async def start(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wake = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        with self._lock:
+            names = list(self._sources)
+        for name in names:
+            self.remove(name)
+
+    def _notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def _eligible(self, now):
+        """
+        Sources dues ayant une frame plus récente que la dernière analysée.
+        """
+        with self._lock:
+            sources = list(self._sources.values())
+        eligible = []
+        for source in sources:
+            if now < source.next_due:
+                continue
+            latest = source.stream.peek()
+            if latest is None:
+                continue
+            if source.due_seq is None:
+                source.due_seq = latest[0]
+            if not source.in_flight and latest[0] > source.last_seq:
+                eligible.append((source, latest))
+        return eligible
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            now = time.monotonic()
+            eligible = self._eligible(now)
+            while eligible and self._in_flight < self.max_in_flight:
+                # Temps virtuel le plus petit d'abord : partage pondéré par la priorité
+                best = min(range(len(eligible)), key=lambda i: eligible[i][0].virtual_time)
+                self._dispatch(*eligible.pop(best), now)
+            try:
+                await asyncio.wait_for(self._wake.wait(), config.INGEST_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, source, latest, now):
+        seq, captured_at, frame = latest
+        period = 1.0 / source.fps
+        if source.last_seq:
+            # Frames capturées depuis la dernière analyse et jamais analysées
+            source.skipped += seq - source.last_seq - 1
+            if now - source.next_due > period:
+                source.late += 1
+        # Parmi elles, celles arrivées alors que la source attendait déjà son tour
+        source.dropped += max(0, seq - max(source.due_seq or seq, source.last_seq + 1))
+        source.due_seq = None
+        source.last_seq = seq
+        # Pas de rattrapage en rafale après un retard
+        source.next_due = max(source.next_due + period, now)
+
+        start = max(source.virtual_time, self._virtual_clock)
+        self._virtual_clock = start
+        source.virtual_time = start + 1.0 / max(source.priority, 1e-6)
+
+        source.in_flight = True
+        self._in_flight += 1
+        task = asyncio.create_task(self._process(source, seq, captured_at, frame))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, source, seq, captured_at, frame):
+        try:
+            results, inferred = await detect_tracked(source.name, frame, batch_scheduler.submit)
+            source.record(seq, captured_at, results, inferred)
+        except Exception as e:
+            source.errors += 1
+            source.last_error = str(e)
+        finally:
+            source.in_flight = False
+            self._in_flight -= 1
+            self._notify()
+
+    def stats(self):
+        with self._lock:
+            sources = list(self._sources.values())
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "sources": [source.stats() for source in sources],
+        }
+
+
+# Service unique, démarré avec l'application
+ingestion_service = IngestionService()
@@ -1,6 +1,27 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from api_fastapi import config, metrics
+from api_fastapi.cache import detection_cache
+from api_fastapi.camera import camera_manager
+from api_fastapi.concurrency import request_limiter
+from api_fastapi.downloads import close_http_client
+from api_fastapi.gating import scene_gates
+from api_fastapi.ingestion import ingestion_service
+from api_fastapi.tracking import trackers
+from api_fastapi.ml import batch_scheduler, inference_ready, model_loader
+from api_fastapi.profiles import source_profiles
+from api_fastapi.store import detection_store
+from api_fastapi.tiling import tiled_detector
+from api_fastapi.workers import worker_pool
 from api_fastapi.endpoints.detect_image import router as image_router
+from api_fastapi.endpoints.detect_batch import router as batch_router
 from api_fastapi.endpoints.detect_webcam import router as webcam_router
+from api_fastapi.endpoints.stream_webcam import router as stream_router
+from api_fastapi.endpoints.sources import router as sources_router
+from api_fastapi.endpoints.history import router as history_router
 
 """
 Point d'entrée principal de l'API de détection de feu et fumée avec YOLO11.
@@ -15,7 +36,20 @@ Application Properties:
 
 Routes incluses:
     - /detect_image: Détection sur images uploadées
+    - /detect_fire_upload: Détection sur une image envoyée (multipart)
+    - /detect_fire_batch: Détection sur une liste d'URL (flux NDJSON)
+    - /detect_fire_batch_files: Détection sur des images envoyées (flux NDJSON)
     - /detect_webcam: Détection via flux webcam
+    - /stream_fire_webcam: Flux MJPEG annoté de la webcam
+    - /cameras: État des caméras ouvertes
+    - /sources: Sources vidéo surveillées en continu (ajout, retrait, métriques)
+    - /detections/history: Historique des détections (DuckDB et archives Parquet)
+    - /health: Vivacité du processus (liveness)
+    - /ready: Modèle chargé et préchauffé (readiness)
+    - /metrics: Histogrammes de latence par étape et jauges au format Prometheus
+    - /stats: Compteurs internes (modèle, micro-batching, limiteur de concurrence, cache,
+      frames webcam analysées / sautées, suivi entre images clés, historique, tuiles,
+      processus de modèle)
 
 Note:
     L'API utilise FastAPI pour:
@@ -26,16 +60,65 @@ Note:
     - Intégration avec YOLO11 pour la détection en temps réel
 """
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Cycle de vie de l'application : démarre l'ordonnanceur d'inférence,
+    charge et préchauffe le modèle en arrière-plan, puis libère les
+    ressources à l'arrêt.
+
+    Le chargement n'empêche pas le serveur de répondre : ``/ready`` passe
+    en 200 une fois le modèle préchauffé. Avec ``MODEL_WORKERS`` > 0, le
+    modèle est chargé par chaque processus de modèle et non par l'API.
+    """
+    # Écriture différée de l'historique des détections
+    detection_store.start()
+    await batch_scheduler.start()
+    if worker_pool.enabled:
+        # Processus de modèle : chacun charge et préchauffe son modèle
+        worker_pool.start()
+        model_task = None
+    else:
+        # Dans le thread d'inférence : le préchauffage ne croise jamais un lot
+        model_task = asyncio.create_task(batch_scheduler.run(model_loader.load_and_warm_up))
+    # Régions d'intérêt et tailles d'entrée par source (fichier SOURCE_PROFILES)
+    if config.SOURCE_PROFILES:
+        source_profiles.load(config.SOURCE_PROFILES)
+    # Sources vidéo surveillées en continu (fichier VIDEO_SOURCES)
+    if config.VIDEO_SOURCES:
+        ingestion_service.load(config.VIDEO_SOURCES)
+    await ingestion_service.start()
+    yield
+    await ingestion_service.stop()
+    if model_task is not None and not model_task.done():
+        await asyncio.wait([model_task])
+    await batch_scheduler.stop()
+    worker_pool.stop()
+    await close_http_client()
+    # Fermer les caméras ouvertes par le gestionnaire de capture
+    camera_manager.stop_all()
+    # Écrire les détections encore en file avant de fermer la base
+    detection_store.stop()
+
+
 # Créer l'application FastAPI
 app = FastAPI(
     title="API de détection de feu et fumée", 
     description="API utilisant YOLO11 pour détecter le feu et la fumée en temps réel", 
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Durée des requêtes, requêtes en cours et en-tête Server-Timing
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Inclure les routes de détection
 app.include_router(image_router)
+app.include_router(batch_router)
 app.include_router(webcam_router)
+app.include_router(stream_router)
+app.include_router(sources_router)
+app.include_router(history_router)
 
 # Endpoint de santé simple
 @app.get("/")
@@ -48,7 +131,108 @@ async def root():
         "status": "active",
         "endpoints": [
             "/detect_fire_url - Détection sur images",  
+            "/detect_fire_upload - Détection sur une image envoyée",
+            "/detect_fire_batch - Détection par lot d'URL (NDJSON)",
+            "/detect_fire_batch_files - Détection par lot de fichiers (NDJSON)",
             "/detect_fire_webcam - Détection via webcam",  
+            "/stream_fire_webcam - Flux MJPEG annoté de la webcam",
+            "/cameras - État des caméras",
+            "/sources - Sources vidéo surveillées",
+            "/detections/history - Historique des détections",
+            "/health - Vivacité du processus",
+            "/ready - Disponibilité du modèle",
+            "/metrics - Métriques Prometheus",
+            "/stats - Statistiques internes",
             "/docs - Documentation Swagger"
         ]
     }
+
+
+@app.get("/health")
+async def health():
+    """
+    Sonde de vivacité : le processus répond, que le modèle soit chargé ou non.
+    """
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Sonde de disponibilité : 200 une fois le modèle chargé et préchauffé, 503 avant.
+
+    Le corps donne l'état du chargement et les temps d'import, de chargement
+    et de préchauffage (de chaque processus de modèle si ``MODEL_WORKERS`` > 0).
+    """
+    body = worker_pool.stats() if worker_pool.enabled else model_loader.stats()
+    return JSONResponse(body, status_code=200 if inference_ready() else 503)
+
+
+@app.get("/stats")
+async def stats():
+    """
+    Compteurs internes de l'API (moteur d'inférence, taille des lots, attente
+    en file d'inférence, requêtes en cours et rejetées, succès et évictions du cache,
+    frames webcam analysées ou sautées, pistes suivies entre images clés,
+    écriture de l'historique, images analysées par tuiles, processus de modèle,
+    régions d'intérêt et tailles d'entrée des sources).
+    """
+    return {
+        "model": model_loader.stats(),
+        "batching": batch_scheduler.stats(),
+        "requests": request_limiter.stats(),
+        "cache": detection_cache.stats(),
+        "scene_gates": scene_gates.stats(),
+        "tracking": trackers.stats(),
+        "store": detection_store.stats(),
+        "tiling": tiled_detector.stats(),
+        "workers": worker_pool.stats(),
+        "profiles": source_profiles.stats()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Métriques au format d'exposition Prometheus.
+
+    Histogrammes de durée par étape (``download``, ``decode``, ``inference``,
+    ``queue_wait``, ``model``, ``postprocess``, ``render``, ``encode``...) et
+    par route, erreurs par étape, requêtes en cours, état et temps de
+    chargement du modèle, file d'inférence et historique.
+    """
+    model = model_loader.stats()
+    limiter = request_limiter.stats()
+    batching = batch_scheduler.stats()
+    store = detection_store.stats()
+    gauges = [
+        ("fire_api_model_ready", "Modèle chargé et préchauffé.", inference_ready()),
+        ("fire_api_model_workers_ready", "Processus de modèle prêts.", sum(
+            worker.state == "ready" for worker in worker_pool.workers
+        )),
+        ("fire_api_model_state", "État du chargement du modèle.", {
+            (("state", state),): model["state"] == state
+            for state in ("pending", "loading", "warming_up", "ready", "failed")
+        }),
+        ("fire_api_model_load_seconds", "Temps de chargement du modèle par phase (s).", {
+            (("phase", phase),): model[f"{phase}_seconds"]
+            for phase in ("import", "load", "warmup", "ready") if model[f"{phase}_seconds"] is not None
+        }),
+        ("fire_api_detection_requests_in_flight", "Requêtes de détection en cours.", limiter["in_flight"]),
+        ("fire_api_detection_requests_queued", "Requêtes de détection en attente.", limiter["queued"]),
+        ("fire_api_inference_queued", "Images en attente d'inférence.", batching["queued"]),
+        ("fire_api_store_queued", "Détections en attente d'écriture.", store["queued"]),
+    ]
+    counters = [
+        ("fire_api_model_worker_restarts_total", "Relances des processus de modèle.", {
+            (("worker", worker.index),): worker.restarts for worker in worker_pool.workers
+        }),
+        ("fire_api_detection_requests_rejected_total", "Requêtes rejetées (429) depuis le démarrage.",
+         limiter["rejected"]),
+        ("fire_api_inference_batches_total", "Lots d'inférence exécutés.", batching["batches"]),
+        ("fire_api_inference_errors_total", "Lots d'inférence en erreur.", batching["errors"]),
+        ("fire_api_store_dropped_total", "Détections abandonnées (file pleine).", store["dropped"]),
+    ]
+    return PlainTextResponse(
+        metrics.render(gauges, counters), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,301 @@
+# metrics.py - Mesure des étapes de traitement et exposition au format Prometheus
+
+"""
+Instrumentation des latences de l'API.
+
+Chaque étape d'une détection (téléchargement, décodage, inférence, dessin,
+encodage...) est mesurée par ``stage("nom")`` ; les durées alimentent des
+histogrammes par étape, et les exceptions qui traversent une étape sont
+comptées par étape et par type d'erreur.
+
+Pendant une requête HTTP, ``MetricsMiddleware`` collecte aussi les durées
+des étapes de cette requête et les renvoie dans l'en-tête ``Server-Timing``
+(durées cumulées si une étape se répète, par exemple dans un lot). Le
+middleware mesure enfin la durée totale de chaque requête (par route, méthode
+et code HTTP) et le nombre de requêtes en cours.
+
+``render`` produit le texte servi par ``/metrics`` (format d'exposition
+Prometheus 0.0.4), sans dépendance à ``prometheus_client``.
+
+Coût:
+    Une mesure coûte deux ``perf_counter``, une recherche dichotomique dans
+    les bornes et un verrou non contendu (quelques microsecondes), ce qui
+    permet de la laisser activée en pleine charge (``METRICS_ENABLED``).
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+
+from api_fastapi import config
+
+# Étapes de la requête HTTP en cours (None hors requête, ex: thread d'inférence)
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """
+    Durées des étapes d'une requête, dans l'ordre de première apparition.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.failed_stage = None
+
+    def add(self, stage, seconds):
+        self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        """
+        Valeur de l'en-tête ``Server-Timing`` (durées en millisecondes).
+        """
+        entries = [f"{stage};dur={1000 * seconds:.1f}" for stage, seconds in self.durations.items()]
+        entries.append(f"total;dur={1000 * (time.perf_counter() - self.started):.1f}")
+        return ", ".join(entries)
+
+
+class Histogram:
+    """
+    Histogramme de durées (s) par combinaison d'étiquettes, à bornes fixes.
+
+    Args:
+        name: Nom de la métrique Prometheus.
+        help: Description de la métrique.
+        labels: Noms des étiquettes (ex: ``("stage",)``).
+        buckets: Bornes supérieures des classes (s), croissantes.
+    """
+
+    def __init__(self, name, help, labels, buckets=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets or config.METRICS_BUCKETS))
+        self._lock = threading.Lock()
+        # étiquettes -> [compte par classe (+Inf en dernier), somme, compte]
+        self._series = {}
+
+    def observe(self, label_values, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labels + ("le",), label_values + (le,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    """
+    Compteur par combinaison d'étiquettes.
+    """
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Métriques de l'application
+stage_seconds = Histogram(
+    "fire_api_stage_duration_seconds", "Durée des étapes de traitement (s).", ("stage",)
+)
+stage_errors = Counter(
+    "fire_api_stage_errors_total", "Exceptions levées pendant une étape, par type.", ("stage", "error")
+)
+request_seconds = Histogram(
+    "fire_api_request_duration_seconds", "Durée des requêtes HTTP (s).", ("route", "method", "status")
+)
+requests_in_flight = 0
+
+
+def observe(stage_name, seconds, per_request=True):
+    """
+    Enregistre la durée d'une étape mesurée à part (ex: attente en file d'inférence).
+
+    Avec ``per_request=False``, seul l'histogramme est alimenté : à utiliser
+    dans les tâches de fond, dont le contexte peut provenir d'une requête.
+    """
+    if not config.METRICS_ENABLED:
+        return
+    stage_seconds.observe((stage_name,), seconds)
+    timings = _request_timings.get() if per_request else None
+    if timings is not None:
+        timings.add(stage_name, seconds)
+
+
+@contextmanager
+def stage(stage_name):
+    """
+    Mesure le bloc comme étape ``stage_name`` (histogramme, ``Server-Timing``).
+
+    Une exception qui traverse le bloc est comptée pour cette étape puis
+    propagée ; la première étape en échec d'une requête est retenue
+    (voir ``failed_stage``). Ne sont pas des échecs de l'étape : l'annulation
+    (client déconnecté, arrêt) et les ``HTTPException`` de code < 500
+    (erreur du client).
+    """
+    if not config.METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if isinstance(e, HTTPException) and e.status_code < 500:
+            raise
+        stage_errors.inc((stage_name, type(e).__name__))
+        timings = _request_timings.get()
+        if timings is not None and timings.failed_stage is None:
+            timings.failed_stage = stage_name
+        raise
+    finally:
+        observe(stage_name, time.perf_counter() - started)
+
+
+def failed_stage():
+    """
+    Première étape en échec de la requête en cours (``None`` si inconnue).
+    """
+    timings = _request_timings.get()
+    return timings.failed_stage if timings is not None else None
+
+
+def error_detail(error):
+    """
+    Message d'erreur 500 indiquant l'étape en échec.
+    """
+    where = failed_stage()
+    if where is None:
+        return f"Erreur: {str(error)}"
+    return f"Erreur ({where}): {str(error)}"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI : durée des requêtes, requêtes en cours et en-tête ``Server-Timing``.
+
+    Middleware ASGI pur (et non ``BaseHTTPMiddleware``) : pas de tâche
+    supplémentaire par requête, et les réponses en flux (NDJSON, MJPEG)
+    passent sans être mises en mémoire.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global requests_in_flight
+        if scope["type"] != "http" or not config.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        requests_in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            requests_in_flight -= 1
+            _request_timings.reset(token)
+            # Gabarit de la route (ex: /sources/{name}) pour borner le nombre de séries
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_seconds.observe(
+                (route, scope["method"], str(status)), time.perf_counter() - timings.started
+            )
+
+
+def _render_values(name, help, kind, value):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    if isinstance(value, dict):
+        for label_items, item_value in value.items():
+            names = tuple(key for key, _ in label_items)
+            values = tuple(val for _, val in label_items)
+            lines.append(f"{name}{_format_labels(names, values)} {_format_value(item_value)}")
+    elif value is not None:
+        lines.append(f"{name} {_format_value(value)}")
+    return lines
+
+
+def render(gauges=(), counters=()):
+    """
+    Texte de ``/metrics`` au format d'exposition Prometheus.
+
+    Args:
+        gauges: ``(nom, description, valeur)`` ou ``(nom, description, {étiquettes: valeur})``
+            pour les jauges de l'état courant (modèle, limiteur, file d'inférence...).
+        counters: Même forme, pour les compteurs cumulés tenus ailleurs (rejets,
+            lots, relances...) ; leur nom se termine par ``_total``.
+    """
+    lines = stage_seconds.render() + stage_errors.render() + request_seconds.render()
+    lines += [
+        "# HELP fire_api_http_requests_in_flight Requêtes HTTP en cours de traitement.",
+        "# TYPE fire_api_http_requests_in_flight gauge",
+        f"fire_api_http_requests_in_flight {requests_in_flight}",
+    ]
+    for name, help, value in gauges:
+        lines += _render_values(name, help, "gauge", value)
+    for name, help, value in counters:
+        lines += _render_values(name, help, "counter", value)
+    return "\n".join(lines) + "\n"
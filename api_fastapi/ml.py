@@ -1,80 +1,299 @@
 # ml.py
 
-import cv2
+import os
+import threading
+import time
+
 import numpy as np
-from ultralytics import YOLO
 
-# Charger le modèle une seule fois
-model = YOLO("best.pt")
+from api_fastapi import config, metrics
+from api_fastapi.backends import exported_path, load_model
+from api_fastapi.batching import BatchScheduler
+from api_fastapi.camera import CameraError, camera_manager
+from api_fastapi.scene import detection_results
+from api_fastapi.workers import worker_pool
+
+
+def _weights_fingerprint(path):
+    """
+    Identifie une version des poids (chemin, taille, date de modification).
+
+    Les modèles OpenVINO sont des dossiers : leurs fichiers sont tous pris en compte.
+    """
+    if not os.path.exists(path):
+        return path
+    if os.path.isdir(path):
+        stats = [os.stat(os.path.join(path, name)) for name in sorted(os.listdir(path))]
+        size = sum(stat.st_size for stat in stats)
+        mtime = max((stat.st_mtime_ns for stat in stats), default=0)
+    else:
+        stat = os.stat(path)
+        size, mtime = stat.st_size, stat.st_mtime_ns
+    return f"{os.path.abspath(path)}:{size}:{mtime}"
+
+
+def _class_thresholds(names):
+    """
+    Tableau des seuils de confiance indexé par identifiant de classe.
+
+    Seuil par défaut ``CONFIDENCE_THRESHOLD``, surchargeable par classe via
+    ``CLASS_CONFIDENCE_THRESHOLDS`` (ex: "fire=0.5,smoke=0.4").
+    """
+    thresholds = np.full(max(names) + 1, config.CONFIDENCE_THRESHOLD, dtype=np.float32)
+    ids_by_name = {name: class_id for class_id, name in names.items()}
+    for name, threshold in config.CLASS_CONFIDENCE_THRESHOLDS.items():
+        if name in ids_by_name:
+            thresholds[ids_by_name[name]] = threshold
+    return thresholds
+
+
+class ModelLoader:
+    """
+    Chargement différé du modèle, préchauffage et état de disponibilité.
+
+    L'import d'``ultralytics`` et le chargement des poids ne se font plus à
+    l'import du module : ``api_fastapi.main`` démarre et répond tout de suite,
+    le modèle est chargé puis préchauffé en arrière-plan (voir ``lifespan``).
+    Une inférence demandée avant la fin du chargement attend simplement.
+
+    États : ``pending``, ``loading``, ``warming_up``, ``ready``, ``failed``.
+    """
+
+    def __init__(self):
+        self._created = time.perf_counter()
+        self._lock = threading.Lock()
+        self.model = None
+        # Chemin et version connus sans charger le modèle (clés du cache), recalculés à chaque chargement
+        self.path = exported_path()
+        self._version = _weights_fingerprint(self.path)
+        # Noms des classes lus depuis le modèle (et non codés en dur)
+        self.class_names = {}
+        self.thresholds = np.empty(0, dtype=np.float32)
+
+        self.state = "pending"
+        self.error = None
+        self.import_seconds = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.ready_seconds = None
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @property
+    def version(self):
+        """
+        Empreinte des poids en service : ceux des processus de modèle s'ils sont actifs.
+        """
+        if worker_pool.enabled and worker_pool.model_version is not None:
+            return worker_pool.model_version
+        return self._version
+
+    def get(self):
+        """
+        Retourne le modèle, en le chargeant au premier appel (bloquant).
+        """
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    self._load()
+        return self.model
+
+    def _load(self):
+        self.state = "loading"
+        started = time.perf_counter()
+        try:
+            # Import mesuré séparément : torch/ultralytics dominent le démarrage à froid
+            import ultralytics  # noqa: F401
+            imported = time.perf_counter()
+            model, path = load_model()
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            raise
+        self.import_seconds = imported - started
+        self.load_seconds = time.perf_counter() - imported
+        self.class_names = dict(model.names)
+        self.thresholds = _class_thresholds(self.class_names)
+        # Poids réellement chargés : le cache de résultats est purgé s'ils ont changé
+        self.path = path
+        self._version = _weights_fingerprint(path)
+        self.model = model
+        self.error = None
+
+    def load_and_warm_up(self):
+        """
+        Charge le modèle puis le préchauffe sur des frames noires à la taille d'entrée.
+
+        Le premier appel au modèle (allocation mémoire, choix des noyaux, graphe
+        des moteurs exportés) est bien plus lent que les suivants : il est payé
+        ici plutôt que par la première vraie requête. Un lot de taille 1 puis un
+        lot de ``BATCH_MAX_SIZE`` couvrent les deux cas du micro-batching.
+
+        Doit s'exécuter dans le thread d'inférence (le modèle n'est pas thread-safe).
+        Les erreurs sont enregistrées (``state``, ``error``) et non propagées.
+        """
+        try:
+            model = self.get()
+            self.state = "warming_up"
+            started = time.perf_counter()
+            frame = np.zeros((config.INFERENCE_IMGSZ, config.INFERENCE_IMGSZ, 3), dtype=np.uint8)
+            for batch_size in sorted({1, config.BATCH_MAX_SIZE}):
+                for _ in range(config.MODEL_WARMUP_RUNS):
+                    model([frame] * batch_size, verbose=False)
+            # Autres tailles d'entrée des profils de sources (régions d'intérêt, résolution adaptative)
+            for imgsz in config.WARMUP_IMGSZ:
+                if imgsz != config.INFERENCE_IMGSZ:
+                    model([frame], imgsz=imgsz, verbose=False)
+            self.warmup_seconds = time.perf_counter() - started
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            return
+        self.ready_seconds = time.perf_counter() - self._created
+        self.state = "ready"
+
+    def stats(self):
+        def rounded(seconds):
+            return round(seconds, 3) if seconds is not None else None
+
+        return {
+            "backend": config.INFERENCE_BACKEND,
+            "precision": config.INFERENCE_PRECISION,
+            "path": self.path,
+            "version": self._version,
+            "state": self.state,
+            "error": self.error,
+            "import_seconds": rounded(self.import_seconds),
+            "load_seconds": rounded(self.load_seconds),
+            "warmup_seconds": rounded(self.warmup_seconds),
+            "ready_seconds": rounded(self.ready_seconds),
+        }
+
+
+# Chargeur unique : le modèle est chargé au démarrage de l'application, pas à l'import
+model_loader = ModelLoader()
+
+
+def postprocess(data):
+    """
+    Filtre les détections brutes d'une image en une seule opération vectorisée.
+
+    Args:
+        data: Tableau ``(N, 6)`` ``[x1, y1, x2, y2, confiance, classe]``.
+
+    Returns:
+        Résultat en colonnes (``boxes`` ``(N, 4)``, ``scores`` ``(N,)``,
+        ``class_ids`` ``(N,)``, ``labels``), la liste ``detections`` pour les
+        réponses JSON et les indicateurs ``fire_detected`` / ``smoke_detected``.
+    """
+    data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+    class_ids = data[:, 5].astype(np.int64)
+
+    # Classes inconnues du modèle écartées, puis seuil propre à chaque classe
+    thresholds = model_loader.thresholds
+    known = (class_ids >= 0) & (class_ids < len(thresholds))
+    keep = known & (data[:, 4] >= thresholds[np.where(known, class_ids, 0)])
+
+    return build_results(data[keep, :4], data[keep, 4], class_ids[keep])
+
+
+def build_results(boxes, scores, class_ids, labels=None):
+    """
+    Assemble le résultat en colonnes et sa liste ``detections`` pour le JSON.
+
+    Les ``labels`` sont déduits des noms de classes du modèle s'ils ne sont pas fournis.
+    """
+    if labels is None:
+        labels = [model_loader.class_names.get(class_id, str(class_id)) for class_id in class_ids.tolist()]
+    return detection_results(boxes, scores, class_ids, labels)
+
+
+def rescale_results(results, factor):
+    """
+    Retourne une copie du résultat avec les boîtes multipliées par ``factor``.
+
+    Sert à exprimer dans les coordonnées de l'image d'origine les détections
+    faites sur une image décodée à résolution réduite.
+    """
+    if factor == 1:
+        return results
+    return build_results(results["boxes"] * factor, results["scores"], results["class_ids"], results["labels"])
+
+
+def parse_result(result):
+    """
+    Convertit un résultat YOLO en résultat de détection.
+    """
+    if result.boxes is None:
+        return postprocess(np.empty((0, 6), dtype=np.float32))
+    return postprocess(result.boxes.data.cpu().numpy())
+
+
+def detect_fire_images(image_arrays, imgsz=None):
+    """
+    Détecte le feu et la fumée sur un lot d'images en un seul appel au modèle.
+
+    ``imgsz`` : taille d'entrée du modèle, entier ou ``(hauteur, largeur)`` (celle du modèle par défaut).
+    Retourne une liste de résultats, dans le même ordre que les images.
+    """
+    model = model_loader.get()
+    options = {"imgsz": imgsz} if imgsz else {}
+    # Étapes mesurées dans le thread d'inférence : histogrammes seulement (un lot sert plusieurs requêtes)
+    with metrics.stage("model"):
+        results = model(list(image_arrays), verbose=False, **options)
+    with metrics.stage("postprocess"):
+        return [parse_result(result) for result in results]
+
 
 def detect_fire_image(image_array):
-    # ... (cette fonction ne change pas)
-    results = model(image_array)
-    
-    detections = []
-    fire_detected = False
-    smoke_detected = False
-    
-    for result in results:
-        if result.boxes is not None:
-            for box in result.boxes:
-                confidence = float(box.conf[0])
-                if confidence >= 0.5:
-                    class_id = int(box.cls[0])
-                    
-                    if class_id == 0:
-                        detection_type = "fire"
-                        fire_detected = True
-                    elif class_id == 1:
-                        detection_type = "smoke"
-                        smoke_detected = True
-                    else:
-                        continue
-                    
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    
-                    detections.append({
-                        "type": detection_type,
-                        "confidence": confidence,
-                        "x1": x1,
-                        "y1": y1,
-                        "x2": x2,
-                        "y2": y2
-                    })
-    
-    return {
-        "detections": detections,
-        "fire_detected": fire_detected,
-        "smoke_detected": smoke_detected
-    }
+    return detect_fire_images([image_array])[0]
 
-def detect_fire_webcam(camera_index=0):
+
+def infer_batch(image_arrays, imgsz=None):
     """
-    Détecte le feu via webcam et retourne les résultats ET l'image.
+    Inférence d'un lot de l'ordonnanceur : dans un processus de modèle
+    (``MODEL_WORKERS`` > 0) ou avec le modèle de ce processus.
+    """
+    if worker_pool.enabled:
+        return worker_pool.infer(image_arrays, imgsz)
+    return detect_fire_images(image_arrays, imgsz)
+
+
+def inference_ready():
+    """
+    Le modèle (ou au moins un processus de modèle) est-il chargé et préchauffé ?
+    """
+    return worker_pool.ready if worker_pool.enabled else model_loader.ready
+
+
+# Ordonnanceur partagé : regroupe les requêtes concurrentes en un seul appel au modèle.
+# Avec un pool de processus, un lot par processus peut s'exécuter en parallèle.
+batch_scheduler = BatchScheduler(infer_batch, max_concurrent_batches=max(1, config.MODEL_WORKERS))
+
+
+def capture_webcam_frame(camera_index=0):
+    """
+    Retourne la frame la plus récente de la caméra (en lecture seule).
+
+    La frame provient du tampon du gestionnaire de caméras : le périphérique
+    reste ouvert entre les requêtes.
     """
-    cap = None
     try:
-        # Essayer -1 en premier, puis 0, 1
-        for index in [-1, 0, 1]:
-            cap = cv2.VideoCapture(index, cv2.CAP_V4L2)
-            if cap.isOpened():
-                break
-        else:
-            raise Exception("Aucune caméra accessible trouvée")
-
-        ret, frame = cap.read()
-        
-        if not ret or frame is None:
-            raise Exception("Impossible de capturer une frame")
-        
-        # Effectuer la détection
-        results = detect_fire_image(frame)
-        
-        # <--- CHANGEMENT CLÉ : retourner les résultats ET la frame
-        return results, frame
-        
-    except Exception as e:
+        _, _, frame = camera_manager.read_latest(camera_index)
+    except CameraError as e:
         raise Exception(f"Erreur webcam: {str(e)}")
-    finally:
-        if cap is not None:
-            cap.release()
+    return frame
+
+
+def detect_fire_webcam(camera_index=0):
+    """
+    Détecte le feu via webcam et retourne les résultats ET l'image.
+    """
+    frame = capture_webcam_frame(camera_index)
+
+    # Effectuer la détection
+    results = detect_fire_image(frame)
+
+    return results, frame
@@ -0,0 +1,164 @@
+# pipeline.py - Chaîne d'analyse d'une image : téléchargement, cache, inférence, rendu
+
+"""
+Chaîne d'analyse partagée par ``/detect_fire_url`` et l'endpoint de lot.
+
+Une image passe par : téléchargement (client HTTP partagé), empreinte du
+contenu et cache (voir ``api_fastapi.cache``), décodage, inférence via
+l'ordonnanceur de micro-batching et rendu de l'image annotée si le format
+de réponse le demande. Avec ``TILING_ENABLED``, les grandes images sont
+décodées en pleine résolution et analysées par tuiles (voir
+``api_fastapi.tiling``).
+
+Chaque étape est mesurée (``api_fastapi.metrics``) : ``download``, ``hash``,
+``decode``, ``inference`` (attente en file comprise) et ``render``.
+"""
+
+import hashlib
+
+from api_fastapi import config, ml
+from api_fastapi.metrics import stage
+from api_fastapi.cache import detection_cache
+from api_fastapi.concurrency import run_cpu
+from api_fastapi.downloads import download_image
+from api_fastapi.imaging import decode_image
+from api_fastapi.ml import batch_scheduler
+from api_fastapi.responses import render_image
+from api_fastapi.store import detection_store
+from api_fastapi.tiling import tiled_detector
+
+
+def _decode_min_size():
+    # Les tuiles ont besoin de la pleine résolution : pas de décodage réduit
+    return None if config.TILING_ENABLED else config.DECODE_MIN_SIZE
+
+
+async def _infer(image):
+    """
+    Inférence sur une image décodée, par tuiles si elle est assez grande (``TILING_ENABLED``).
+    """
+    if config.TILING_ENABLED and tiled_detector.applies(image):
+        return await tiled_detector.detect(image, batch_scheduler.submit)
+    return await batch_scheduler.submit(image)
+
+
+def _render_key(options):
+    if options.response_format == "detections":
+        return None
+    return (options.jpeg_quality, options.max_size)
+
+
+async def analyse_content(content, options):
+    """
+    Décode, analyse et rend une image (octets), en réutilisant le cache par contenu.
+
+    Sans cache activé, l'image est toujours décodée et analysée.
+
+    Retourne ``(résultats, jpeg, empreinte, inférence exécutée)``.
+    """
+    render_key = _render_key(options)
+    use_cache = bool(config.DETECTION_CACHE_ENABLED)
+    digest = None
+    if use_cache:
+        # Même version des poids pour tous les chemins (URL, envoi de fichier, lot)
+        detection_cache.check_model_version(ml.model_loader.version)
+        with stage("hash"):
+            digest = await run_cpu(lambda: hashlib.sha256(content).hexdigest())
+
+    results = detection_cache.get_results(digest) if use_cache else None
+    jpeg = detection_cache.get_render(digest, render_key) if use_cache and render_key else None
+    inferred = results is None
+    image_array = None
+
+    if results is None:
+        # Décoder l'image en array numpy BGR (résolution réduite pour les très grands JPEG)
+        with stage("decode"):
+            image_array, scale = await run_cpu(decode_image, content, _decode_min_size())
+
+        # Inférence via l'ordonnanceur de micro-batching, boîtes ramenées à l'image d'origine
+        with stage("inference"):
+            results = ml.rescale_results(await _infer(image_array), 1.0 / scale)
+        if use_cache:
+            detection_cache.put_results(digest, results)
+            detection_cache.misses += 1
+    elif use_cache:
+        detection_cache.content_hits += 1
+
+    if render_key is not None and jpeg is None:
+        if image_array is None:
+            with stage("decode"):
+                image_array, scale = await run_cpu(decode_image, content, _decode_min_size())
+        # L'image décodée n'est plus utilisée ensuite : dessin sans copie
+        jpeg = await render_image(image_array, results, options, copy=False, box_scale=scale)
+        if use_cache:
+            detection_cache.put_render(digest, render_key, jpeg)
+
+    return results, jpeg, digest, inferred
+
+
+async def _analyse_download(url, content, headers, options):
+    results, jpeg, digest, inferred = await analyse_content(content, options)
+    detection_cache.put_url(url, headers, digest)
+    return results, jpeg, "MISS" if inferred else "CONTENT"
+
+
+async def detect_url(url, options):
+    """
+    Télécharge et analyse l'image d'une URL en passant par le cache.
+
+    Retourne ``(résultats, jpeg, statut du cache)``.
+
+    Statuts : ``HIT`` (aucun accès réseau), ``REVALIDATED`` (304 du serveur),
+    ``CONTENT`` (image retéléchargée mais déjà analysée), ``MISS``.
+    """
+    render_key = _render_key(options)
+    detection_cache.check_model_version(ml.model_loader.version)
+
+    entry = detection_cache.get_url(url)
+    status = "HIT"
+    if entry is not None and not entry.fresh:
+        if not entry.revalidable:
+            entry = None
+        else:
+            # Requête conditionnelle : le serveur répond 304 si l'image n'a pas changé
+            with stage("download"):
+                content, headers = await download_image(url, etag=entry.etag, last_modified=entry.last_modified)
+            if content is not None:
+                return await _analyse_download(url, content, headers, options)
+            entry.mark_validated()
+            status = "REVALIDATED"
+
+    if entry is not None:
+        results = detection_cache.get_results(entry.digest)
+        jpeg = detection_cache.get_render(entry.digest, render_key) if render_key else None
+        if results is not None and (render_key is None or jpeg is not None):
+            if status == "HIT":
+                detection_cache.hits += 1
+            else:
+                detection_cache.revalidated += 1
+            return results, jpeg, status
+
+    # Téléchargement complet (URL inconnue ou résultat évincé du cache)
+    with stage("download"):
+        content, headers = await download_image(url)
+    return await _analyse_download(url, content, headers, options)
+
+
+async def analyse_url(url, options):
+    """
+    Analyse l'image d'une URL, avec ou sans cache selon la configuration.
+
+    Les détections sont enregistrées dans l'historique (écriture différée).
+
+    Retourne ``(résultats, jpeg, statut du cache)``.
+    """
+    if config.DETECTION_CACHE_ENABLED:
+        results, jpeg, status = await detect_url(url, options)
+    else:
+        # Télécharger l'image depuis l'URL (client HTTP partagé)
+        with stage("download"):
+            content, _ = await download_image(url)
+        results, jpeg, _, _ = await analyse_content(content, options)
+        status = "DISABLED"
+    detection_store.record(url, results)
+    return results, jpeg, status
@@ -0,0 +1,302 @@
+# profiles.py - Régions d'intérêt et taille d'entrée adaptative par source vidéo
+
+"""
+Profils d'inférence propres à chaque source vidéo.
+
+Une bonne partie des frames de nos caméras fixes est du ciel ou un premier
+plan immobile, et chaque frame passe pourtant entière par le modèle à sa
+taille d'entrée par défaut. Un profil de source règle deux choses:
+
+    - Région d'intérêt : un ou plusieurs polygones (coordonnées normalisées
+      0-1). La frame est recadrée sur leur rectangle englobant, les pixels
+      hors des polygones sont remplis du gris du letterbox, et les boîtes
+      sont ramenées dans les coordonnées de la frame entière. La région
+      garde l'échelle qu'aurait la frame entière à la taille d'entrée : les
+      objets gardent leur taille en pixels. Chaque côté est ensuite complété
+      de gris jusqu'au multiple du pas du réseau (32 px) : l'entrée est
+      rectangulaire, son calcul suit l'aire de la région, et l'ordonnanceur
+      groupe en lots les frames de même forme d'entrée.
+    - Taille d'entrée : fixe, ou adaptative entre plusieurs tailles (ex:
+      320, 480, 640). Une source descend d'une taille quand la file
+      d'inférence dépasse ``ADAPTIVE_HIGH_LOAD`` lots pleins, remonte sous
+      ``ADAPTIVE_LOW_LOAD``, et repasse à la plus grande taille pendant
+      ``ADAPTIVE_HOLD_SECONDS`` s après une détection.
+
+Le recadrage, l'échelle et le masque dépendent seulement de la forme de la
+frame et de la taille d'entrée : ils sont calculés une fois puis réutilisés
+d'une frame à l'autre.
+
+Les profils sont déclarés dans le fichier JSON ``SOURCE_PROFILES`` (clés :
+nom de la source, ou ``webcam:<index>`` pour une webcam locale) ou avec la
+source via l'API ``/sources``.
+"""
+
+import json
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from api_fastapi import config, ml
+from api_fastapi.concurrency import run_cpu
+
+# Gris de remplissage du letterbox d'ultralytics
+_FILL = 114
+# Pas du réseau : les tailles d'entrée en sont des multiples
+_STRIDE = 32
+
+
+class ProfileError(ValueError):
+    """Profil de source invalide (polygone, taille d'entrée)."""
+
+
+def _stride_multiple(size):
+    return max(_STRIDE, math.ceil(size / _STRIDE) * _STRIDE)
+
+
+def _parse_polygons(roi):
+    polygons = []
+    for polygon in roi:
+        points = np.asarray(polygon, dtype=np.float32)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+            raise ProfileError("Chaque polygone de la région d'intérêt doit avoir au moins 3 points [x, y]")
+        if points.min() < 0 or points.max() > 1:
+            raise ProfileError("Les points de la région d'intérêt sont normalisés entre 0 et 1")
+        polygons.append(points)
+    if not polygons:
+        raise ProfileError("Région d'intérêt vide")
+    return polygons
+
+
+class Geometry:
+    """
+    Recadrage, échelle et masque d'une forme de frame à une taille d'entrée donnée.
+    """
+
+    def __init__(self, height, width, imgsz, polygons):
+        if polygons:
+            points = np.concatenate(polygons) * np.array([width, height], dtype=np.float32)
+            self.x0, self.y0 = (max(0, int(math.floor(value))) for value in points.min(axis=0))
+            self.x1 = min(width, int(math.ceil(points[:, 0].max())))
+            self.y1 = min(height, int(math.ceil(points[:, 1].max())))
+        else:
+            self.x0, self.y0, self.x1, self.y1 = 0, 0, width, height
+        crop_width, crop_height = max(1, self.x1 - self.x0), max(1, self.y1 - self.y0)
+
+        # Échelle de la frame entière à cette taille d'entrée (jamais d'agrandissement)
+        self.scale = min(1.0, imgsz / max(height, width))
+        self.size = (max(1, round(crop_width * self.scale)), max(1, round(crop_height * self.scale)))
+        # Entrée rectangulaire (hauteur, largeur) : chaque côté complété au multiple du pas,
+        # le letterbox n'a plus ni à redimensionner ni à compléter
+        self.imgsz = (_stride_multiple(self.size[1]), _stride_multiple(self.size[0]))
+        self.area = crop_width * crop_height / (width * height)
+
+        self.outside = None
+        if polygons:
+            mask = np.zeros((self.size[1], self.size[0]), dtype=np.uint8)
+            offset = np.array([self.x0, self.y0], dtype=np.float32)
+            cv2.fillPoly(mask, [
+                np.round((polygon * np.array([width, height], dtype=np.float32) - offset) * self.scale).astype(np.int32)
+                for polygon in polygons
+            ], 1)
+            outside = mask == 0
+            # Région rectangulaire : le recadrage suffit
+            if outside.any():
+                self.outside = outside
+
+    def apply(self, frame):
+        """
+        Image transmise au modèle : région recadrée, réduite et masquée.
+        """
+        crop = frame[self.y0:self.y1, self.x0:self.x1]
+        image = crop
+        if self.size != (crop.shape[1], crop.shape[0]):
+            image = cv2.resize(crop, self.size, interpolation=cv2.INTER_AREA)
+        if self.outside is not None:
+            image = crop.copy() if image is crop else image
+            image[self.outside] = _FILL
+        # Complément en bas et à droite : les coordonnées des boîtes sont inchangées
+        bottom, right = self.imgsz[0] - self.size[1], self.imgsz[1] - self.size[0]
+        if bottom or right:
+            image = cv2.copyMakeBorder(image, 0, bottom, 0, right, cv2.BORDER_CONSTANT, value=(_FILL,) * 3)
+        return image
+
+    def restore(self, results):
+        """
+        Résultat exprimé dans les coordonnées de la frame entière.
+        """
+        if self.scale == 1 and self.x0 == 0 and self.y0 == 0:
+            return results
+        offset = np.array([self.x0, self.y0, self.x0, self.y0], dtype=np.float32)
+        boxes = (results["boxes"] / self.scale + offset).astype(np.float32)
+        return ml.build_results(boxes, results["scores"], results["class_ids"], results["labels"])
+
+
+class AdaptiveResolution:
+    """
+    Choix de la taille d'entrée d'une source parmi ses tailles configurées.
+
+    Démarre à la plus grande taille ; une étape à la fois, au plus toutes les
+    ``interval`` s, sauf après une détection (retour immédiat à la plus grande).
+    Sûre entre threads (frames d'une même source analysées en parallèle).
+    """
+
+    def __init__(self, sizes, high_load=None, low_load=None, interval=None, hold=None):
+        self.sizes = sorted({_stride_multiple(size) for size in sizes})
+        self.high_load = config.ADAPTIVE_HIGH_LOAD if high_load is None else high_load
+        self.low_load = config.ADAPTIVE_LOW_LOAD if low_load is None else low_load
+        self.interval = config.ADAPTIVE_INTERVAL if interval is None else interval
+        self.hold = config.ADAPTIVE_HOLD_SECONDS if hold is None else hold
+
+        self._lock = threading.Lock()
+        self._index = len(self.sizes) - 1
+        self._changed_at = 0.0
+        self._detected_at = None
+
+        # Statistiques
+        self.changes = 0
+        self.frames = {size: 0 for size in self.sizes}
+
+    @property
+    def imgsz(self):
+        return self.sizes[self._index]
+
+    def select(self, load):
+        """
+        Taille d'entrée de la prochaine frame, selon la charge de la file d'inférence.
+        """
+        with self._lock:
+            index = self._index
+            now = time.monotonic()
+            if self._detected_at is not None and now - self._detected_at < self.hold:
+                index = len(self.sizes) - 1
+            elif now - self._changed_at >= self.interval:
+                if load >= self.high_load:
+                    index = max(0, index - 1)
+                elif load <= self.low_load:
+                    index = min(len(self.sizes) - 1, index + 1)
+            if index != self._index:
+                self._index = index
+                self._changed_at = now
+                self.changes += 1
+            imgsz = self.sizes[index]
+            self.frames[imgsz] += 1
+            return imgsz
+
+    def observe(self, results):
+        if len(results["boxes"]):
+            with self._lock:
+                self._detected_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "imgsz": self.imgsz,
+                "sizes": self.sizes,
+                "changes": self.changes,
+                "frames_by_size": {str(size): count for size, count in self.frames.items()},
+            }
+
+
+class SourceProfile:
+    """
+    Région d'intérêt et taille(s) d'entrée d'une source.
+
+    Args:
+        roi: Polygones ``[[[x, y], ...], ...]`` en coordonnées normalisées (toute la frame si absent).
+        imgsz: Taille d'entrée fixe, ou liste de tailles pour une résolution adaptative
+            (``INFERENCE_IMGSZ`` si absent).
+    """
+
+    def __init__(self, roi=None, imgsz=None):
+        self.polygons = _parse_polygons(roi) if roi is not None else []
+        sizes = [imgsz or config.INFERENCE_IMGSZ] if not isinstance(imgsz, (list, tuple)) else list(imgsz)
+        if not sizes or any(not isinstance(size, int) or size <= 0 for size in sizes):
+            raise ProfileError("imgsz : entier positif ou liste d'entiers positifs")
+        self.resolution = AdaptiveResolution(sizes)
+        # Géométries par (hauteur, largeur, taille d'entrée), réutilisées frame à frame
+        self._geometries = {}
+        self._last_geometry = None
+
+    def prepare(self, frame, load=0.0):
+        """
+        Image à transmettre au modèle et géométrie pour en restituer les boîtes.
+        """
+        imgsz = self.resolution.select(load)
+        height, width = frame.shape[:2]
+        key = (height, width, imgsz)
+        geometry = self._geometries.get(key)
+        if geometry is None:
+            # Deux threads peuvent la calculer : la première enregistrée sert à tous
+            geometry = self._geometries.setdefault(
+                key, Geometry(height, width, imgsz, self.polygons)
+            )
+        self._last_geometry = geometry
+        return geometry.apply(frame), geometry
+
+    def stats(self):
+        geometry = self._last_geometry
+        stats = self.resolution.stats()
+        stats.update({
+            "roi": len(self.polygons) > 0,
+            "roi_area": round(geometry.area, 3) if geometry is not None else None,
+            "input_size": list(geometry.size) if geometry is not None else None,
+            "input_imgsz": list(geometry.imgsz) if geometry is not None else None,
+        })
+        return stats
+
+
+class SourceProfileRegistry:
+    """
+    Profils des sources vidéo, par nom de source (``webcam:<index>`` pour les webcams).
+    """
+
+    def __init__(self):
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def set(self, source, profile):
+        with self._lock:
+            self._profiles[source] = profile
+
+    def remove(self, source):
+        with self._lock:
+            self._profiles.pop(source, None)
+
+    def get(self, source):
+        return self._profiles.get(source)
+
+    def load(self, path):
+        """
+        Déclare les profils d'un fichier JSON : ``{"source": {"roi": ..., "imgsz": ...}, ...}``.
+        """
+        with open(path) as f:
+            for source, item in json.load(f).items():
+                self.set(source, SourceProfile(item.get("roi"), item.get("imgsz")))
+
+    def bind(self, source, submit):
+        """
+        Enveloppe ``submit`` (ordonnanceur d'inférence) avec le profil de la source, s'il existe.
+        """
+        profile = self.get(source)
+        if profile is None:
+            return submit
+
+        async def submit_profiled(frame):
+            image, geometry = await run_cpu(profile.prepare, frame, ml.batch_scheduler.load())
+            results = await submit(image, imgsz=geometry.imgsz)
+            profile.resolution.observe(results)
+            return geometry.restore(results)
+
+        return submit_profiled
+
+    def stats(self):
+        with self._lock:
+            profiles = dict(self._profiles)
+        return {source: profile.stats() for source, profile in profiles.items()}
+
+
+# Registre partagé par l'ingestion multi-caméras et les endpoints webcam
+source_profiles = SourceProfileRegistry()
@@ -0,0 +1,131 @@
+# responses.py - Formats de réponse des endpoints de détection
+
+"""
+Construction des réponses des endpoints de détection.
+
+Formats disponibles (champ ``response_format`` de la requête):
+    - ``json``: détections + image annotée en base64 (``encoded_image``)
+    - ``detections``: détections seules, sans dessin ni encodage d'image
+    - ``jpeg``: image annotée brute (``image/jpeg``), détections dans l'en-tête ``X-Detections``
+    - ``multipart``: ``multipart/mixed`` avec une partie JSON et une partie JPEG
+
+La qualité JPEG (``jpeg_quality``) et la taille maximale de l'image renvoyée
+(``max_size``, plus grand côté en pixels) sont réglables par requête.
+"""
+
+import json
+from typing import Literal, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, Field, ValidationError
+
+from api_fastapi import config
+from api_fastapi.concurrency import run_cpu
+from api_fastapi.imaging import encode_base64, render_annotated_jpeg
+from api_fastapi.metrics import stage
+
+MULTIPART_BOUNDARY = "detection"
+
+
+class DetectionOutputOptions(BaseModel):
+    """
+    Options de sortie communes aux endpoints de détection.
+    """
+    response_format: Literal["json", "detections", "jpeg", "multipart"] = "json"
+    jpeg_quality: int = Field(default_factory=lambda: config.JPEG_QUALITY, ge=1, le=100)
+    max_size: Optional[int] = Field(default=None, gt=0)
+
+
+def options_from_form(model, **fields):
+    """
+    Valide les options de sortie reçues en champs de formulaire (requêtes multipart).
+
+    Les champs absents (``None``) prennent la valeur par défaut du modèle.
+    """
+    try:
+        return model(**{key: value for key, value in fields.items() if value is not None})
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=jsonable_encoder(e.errors()))
+
+
+def detection_message(fire_detected, smoke_detected, where):
+    """
+    Message de réponse selon les classes détectées (``where`` : "dans l'image", "via webcam"...).
+    """
+    if fire_detected and smoke_detected:
+        return f"Feu et fumée détectés {where}"
+    elif fire_detected:
+        return f"Feu détecté {where}"
+    elif smoke_detected:
+        return f"Fumée détectée {where}"
+    return "Aucun feu ou fumée détecté"
+
+
+async def render_image(image, results, options, copy=True, box_scale=1.0):
+    """
+    Dessine et encode l'image annotée, sauf en format ``detections`` (retourne ``None``).
+    """
+    if options.response_format == "detections":
+        return None
+    with stage("render"):
+        return await run_cpu(
+            render_annotated_jpeg, image, results, options.jpeg_quality, options.max_size, copy, box_scale
+        )
+
+
+async def format_detection_response(payload, options, jpeg=None, headers=None):
+    """
+    Met en forme la réponse au format demandé à partir du JPEG déjà rendu.
+
+    Args:
+        payload: Corps JSON sans l'image (``success``, ``message``, ``detections``...).
+        options: ``DetectionOutputOptions`` de la requête.
+        jpeg: Octets de l'image annotée (ignorés en format ``detections``).
+        headers: En-têtes supplémentaires de la réponse.
+    """
+    with stage("encode"):
+        return await _format_response(payload, options, jpeg, dict(headers or {}))
+
+
+async def _format_response(payload, options, jpeg, headers):
+    if options.response_format == "detections":
+        # Ni dessin ni encodage : les clients machine ne veulent que les boîtes
+        return JSONResponse(jsonable_encoder(payload), headers=headers)
+
+    if options.response_format == "json":
+        payload["encoded_image"] = await run_cpu(encode_base64, jpeg)
+        return JSONResponse(jsonable_encoder(payload), headers=headers)
+
+    metadata = json.dumps(jsonable_encoder(payload))
+
+    if options.response_format == "jpeg":
+        headers["X-Detections"] = metadata
+        return Response(content=jpeg, media_type="image/jpeg", headers=headers)
+
+    body = b"".join([
+        f"--{MULTIPART_BOUNDARY}\r\nContent-Type: application/json\r\n\r\n".encode(),
+        metadata.encode(),
+        f"\r\n--{MULTIPART_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode(),
+        jpeg,
+        f"\r\n--{MULTIPART_BOUNDARY}--\r\n".encode(),
+    ])
+    return Response(
+        content=body, media_type=f"multipart/mixed; boundary={MULTIPART_BOUNDARY}", headers=headers
+    )
+
+
+async def build_detection_response(image, results, payload, options, copy=True):
+    """
+    Construit la réponse au format demandé.
+
+    Args:
+        image: Image analysée (BGR).
+        results: Résultat de détection (colonnes ``boxes``, ``scores``, ``labels``).
+        payload: Corps JSON sans l'image (``success``, ``message``, ``detections``...).
+        options: ``DetectionOutputOptions`` de la requête.
+        copy: Dessiner sur une copie de l'image (frames partagées).
+    """
+    jpeg = await render_image(image, results, options, copy)
+    return await format_detection_response(payload, options, jpeg)
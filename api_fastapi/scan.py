@@ -0,0 +1,617 @@
+# scan.py - Analyse hors ligne d'archives (dossiers d'images, motifs, vidéos)
+
+"""
+Ré-analyse en lot, sans serveur HTTP, d'images et de vidéos archivées.
+
+Utilisation::
+
+    python -m api_fastapi.scan archives/ "drone/**/*.jpg" camera1.mp4 -o scan.jsonl
+    python -m api_fastapi.scan archives/ -o scan_parquet --format parquet --annotate-dir annotated/
+
+Chaîne de traitement (les trois étapes se recouvrent):
+    - Lecture : un thread parcourt les sources ; les images sont décodées en
+      parallèle par ``--decode-workers`` threads, les vidéos sont lues frame
+      par frame (``--every`` / ``--fps`` pour n'en garder qu'une partie). Les
+      frames prêtes attendent dans une file bornée (``--prefetch``).
+    - Inférence : les frames sont regroupées par lots de ``--batch-size`` et
+      passées au modèle (ou aux processus de modèle si ``MODEL_WORKERS`` > 0,
+      un lot par processus en parallèle).
+    - Écriture : un thread écrit les résultats au fil de l'eau, en JSONL (une
+      ligne par frame) ou en Parquet (une ligne par détection, un fichier
+      ``part-NNNNN.parquet`` par vidage), et les images ou vidéos annotées
+      si ``--annotate-dir`` est donné.
+
+Toutes les files sont bornées : une vidéo n'est jamais chargée entière en
+mémoire, quelle que soit sa durée.
+
+Reprise:
+    L'avancement est enregistré dans ``<sortie>.progress`` après chaque
+    vidage de la sortie : dernière frame écrite par source et sources
+    terminées (identifiées par chemin, taille et date de modification).
+    Relancée avec la même sortie, la commande reprend là où elle s'était
+    arrêtée (``--no-resume`` pour tout refaire). Les frames écrites entre
+    le dernier vidage et un arrêt brutal peuvent apparaître deux fois.
+    Une erreur d'inférence est retentée à la reprise : l'avancement d'une
+    vidéo s'arrête à la dernière frame écrite avant sa première frame en
+    échec (les frames suivantes, déjà écrites, le seront à nouveau).
+"""
+
+import argparse
+import glob
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from api_fastapi import config, imaging, ml
+from api_fastapi.tiling import tiled_detector
+from api_fastapi.workers import worker_pool
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mkv", ".mov", ".m4v", ".webm", ".mpg", ".mpeg"}
+
+# Fin de flux dans les files de la chaîne
+_END = object()
+
+
+class Source:
+    """
+    Fichier à analyser : image ou vidéo.
+    """
+
+    __slots__ = ("path", "kind", "key", "relative", "output_fps")
+
+    def __init__(self, path, root):
+        self.path = path
+        extension = os.path.splitext(path)[1].lower()
+        self.kind = "video" if extension in VIDEO_EXTENSIONS else "image"
+        stat = os.stat(path)
+        # Une source modifiée depuis la dernière exécution est ré-analysée
+        self.key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        self.relative = os.path.relpath(os.path.abspath(path), root)
+        self.output_fps = None
+
+
+class Frame:
+    """
+    Frame en transit dans la chaîne.
+
+    Une frame sans image et sans erreur marque la fin d'une vidéo.
+    """
+
+    __slots__ = ("source", "index", "time", "image", "scale", "last", "error")
+
+    def __init__(self, source, index=0, seconds=None, image=None, scale=1.0, last=False, error=None):
+        self.source = source
+        self.index = index
+        self.time = seconds
+        self.image = image
+        self.scale = scale
+        self.last = last
+        self.error = error
+
+
+def expand_inputs(inputs):
+    """
+    Liste triée et sans doublons des images et vidéos désignées par des
+    dossiers (parcourus récursivement), des motifs glob ou des fichiers.
+    """
+    paths = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for directory, _, names in os.walk(entry):
+                paths.extend(os.path.join(directory, name) for name in names)
+        elif glob.has_magic(entry):
+            paths.extend(glob.glob(entry, recursive=True))
+        else:
+            paths.append(entry)
+    known = IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+    return sorted({
+        os.path.normpath(path) for path in paths
+        if os.path.isfile(path) and os.path.splitext(path)[1].lower() in known
+    })
+
+
+def _decode_file(path, min_size):
+    with open(path, "rb") as f:
+        content = f.read()
+    return imaging.decode_image(content, min_size)
+
+
+class Progress:
+    """
+    Avancement par source, ajouté ligne par ligne à un fichier JSONL.
+    """
+
+    def __init__(self, path, resume=True):
+        self.path = path
+        self.state = {}
+        if resume and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Dernière ligne tronquée par un arrêt brutal
+                        continue
+                    self.state[entry["key"]] = entry
+        self._dirty = {}
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def done(self, source):
+        return self.state.get(source.key, {}).get("done", False)
+
+    def next_frame(self, source):
+        entry = self.state.get(source.key)
+        return entry["frame"] + 1 if entry is not None else 0
+
+    def update(self, source, frame, done=False):
+        entry = {"key": source.key, "source": source.path, "frame": frame, "done": done}
+        self.state[source.key] = entry
+        self._dirty[source.key] = entry
+
+    def flush(self):
+        for entry in self._dirty.values():
+            self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        self._dirty.clear()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class JsonlOutput:
+    """
+    Une ligne JSON par frame analysée (détections, éventuelle erreur).
+    """
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class ParquetOutput:
+    """
+    Une ligne par détection ; chaque vidage ajoute un fichier ``part-NNNNN.parquet``.
+
+    Les frames sans détection et les erreurs ne produisent pas de ligne
+    (elles restent comptées dans le rapport et l'avancement).
+    """
+
+    COLUMNS = ("source", "frame", "time", "class", "confidence", "x1", "y1", "x2", "y2")
+
+    def __init__(self, directory):
+        import duckdb
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._con = duckdb.connect()
+        self._con.execute(
+            "CREATE TABLE detections (source VARCHAR, frame BIGINT, time DOUBLE, class VARCHAR, "
+            "confidence DOUBLE, x1 DOUBLE, y1 DOUBLE, x2 DOUBLE, y2 DOUBLE)"
+        )
+        self._part = len(glob.glob(os.path.join(directory, "part-*.parquet")))
+        self._rows = []
+
+    def write(self, record):
+        for detection in record.get("detections", []):
+            self._rows.append((
+                record["source"], record["frame"], record["time"], detection["type"], detection["confidence"],
+                detection["x1"], detection["y1"], detection["x2"], detection["y2"],
+            ))
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = [list(column) for column in zip(*self._rows)]
+        placeholders = ", ".join("unnest(?)" for _ in self.COLUMNS)
+        self._con.execute(f"INSERT INTO detections SELECT {placeholders}", columns)
+        target = os.path.join(self.directory, f"part-{self._part:05d}.parquet").replace("'", "''")
+        self._con.execute(f"COPY detections TO '{target}' (FORMAT PARQUET)")
+        self._con.execute("DELETE FROM detections")
+        self._part += 1
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        self._con.close()
+
+
+class ScanPipeline:
+    """
+    Lecture, inférence et écriture en parallèle sur une liste de sources.
+
+    Args:
+        sources: Sources (``Source``) à analyser, dans l'ordre.
+        output: Sortie (``JsonlOutput`` ou ``ParquetOutput``).
+        progress: Avancement (``Progress``).
+        batch_size: Nombre de frames par lot d'inférence.
+        decode_workers: Threads de décodage des images.
+        prefetch: Nombre maximal de frames lues en avance.
+        every: Garder une frame vidéo sur ``every``.
+        fps: Cadence d'échantillonnage des vidéos (prioritaire sur ``every``).
+        annotate_dir: Dossier des images et vidéos annotées (aucune si ``None``).
+        tiled: Inférence par tuiles (voir ``api_fastapi.tiling``).
+        flush_interval: Intervalle (s) entre deux vidages de la sortie et de l'avancement.
+        report_interval: Intervalle (s) entre deux rapports de progression.
+    """
+
+    def __init__(self, sources, output, progress, batch_size=None, decode_workers=None, prefetch=None,
+                 every=1, fps=None, annotate_dir=None, jpeg_quality=None, tiled=False,
+                 flush_interval=5.0, report_interval=5.0):
+        self.sources = sources
+        self.output = output
+        self.progress = progress
+        self.batch_size = batch_size or config.BATCH_MAX_SIZE
+        self.every = max(1, every)
+        self.fps = fps
+        self.annotate_dir = annotate_dir
+        self.jpeg_quality = jpeg_quality or config.JPEG_QUALITY
+        self.tiled = tiled
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        # Les tuiles ont besoin de la pleine résolution
+        self.min_size = None if tiled else config.DECODE_MIN_SIZE
+
+        self._frames = queue.Queue(maxsize=prefetch or 4 * self.batch_size)
+        inference_workers = max(1, config.MODEL_WORKERS)
+        # Lots en cours d'inférence ou en attente d'écriture
+        self._results = queue.Queue(maxsize=2 * inference_workers)
+        self._decode_pool = ThreadPoolExecutor(decode_workers or config.CPU_WORKERS, thread_name_prefix="scan-decode")
+        self._infer_pool = ThreadPoolExecutor(inference_workers, thread_name_prefix="scan-infer")
+        self._stop = threading.Event()
+        self._videos = {}
+        # Vidéos dont une frame a échoué à l'inférence : leur avancement n'avance plus
+        self._stalled = set()
+        self.failure = None
+
+        # Statistiques
+        self.frames = 0
+        self.detections = 0
+        self.errors = 0
+        self.sources_done = 0
+        self._started = None
+        self._last_report = (0.0, 0)
+
+    # --- Lecture ---
+
+    def _put(self, target, item):
+        """
+        Ajout bloquant à une file bornée, interrompu par un arrêt demandé.
+        """
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        try:
+            for source in self.sources:
+                if self._stop.is_set():
+                    break
+                if self.progress.done(source):
+                    continue
+                if source.kind == "image":
+                    future = self._decode_pool.submit(_decode_file, source.path, self.min_size)
+                    if not self._put(self._frames, (Frame(source, last=True), future)):
+                        break
+                else:
+                    self._read_video(source, self.progress.next_frame(source))
+        finally:
+            self._frames.put(_END)
+
+    def _read_video(self, source, start):
+        capture = cv2.VideoCapture(source.path)
+        if not capture.isOpened():
+            self._put(self._frames, (Frame(source, error="Vidéo illisible"), None))
+            return
+        native_fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        every = self.every
+        if self.fps and native_fps:
+            every = max(1, round(native_fps / self.fps))
+        source.output_fps = native_fps / every if native_fps else 1.0
+
+        index = 0
+        try:
+            while not self._stop.is_set():
+                if index < start or index % every:
+                    # Frame non retenue : grab() évite la conversion en image BGR
+                    if not capture.grab():
+                        break
+                    index += 1
+                    continue
+                ok, image = capture.read()
+                if not ok:
+                    break
+                frame = Frame(source, index, index / native_fps if native_fps else None, image)
+                if not self._put(self._frames, (frame, None)):
+                    return
+                index += 1
+        finally:
+            capture.release()
+        if not self._stop.is_set():
+            # Fin de la vidéo
+            self._put(self._frames, (Frame(source), None))
+
+    # --- Inférence ---
+
+    def _infer(self, images):
+        if self.tiled:
+            return [
+                tiled_detector.detect_sync(image, ml.infer_batch) if tiled_detector.applies(image)
+                else ml.infer_batch([image])[0]
+                for image in images
+            ]
+        return ml.infer_batch(images)
+
+    def _submit(self, batch):
+        if batch:
+            future = self._infer_pool.submit(self._infer, [frame.image for frame in batch])
+            self._results.put((batch, future))
+        return []
+
+    def _dispatch(self):
+        batch = []
+        while not self._stop.is_set():
+            item = self._frames.get()
+            if item is _END:
+                break
+            frame, pending = item
+            if pending is not None:
+                try:
+                    frame.image, frame.scale = pending.result()
+                except Exception as e:
+                    frame.error = str(e)
+            if frame.image is None:
+                # Erreur ou fin de vidéo : transmise dans l'ordre, après le lot en cours
+                batch = self._submit(batch)
+                self._results.put(([frame], None))
+                continue
+            batch.append(frame)
+            if len(batch) >= self.batch_size:
+                batch = self._submit(batch)
+        self._submit(batch)
+
+    # --- Écriture ---
+
+    def _annotate(self, frame, results):
+        source = frame.source
+        if source.kind == "image":
+            path = os.path.join(self.annotate_dir, source.relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            jpeg = imaging.render_annotated_jpeg(frame.image, results, self.jpeg_quality, copy=False, box_scale=frame.scale)
+            with open(os.path.splitext(path)[0] + ".jpg", "wb") as f:
+                f.write(jpeg)
+            return
+        writer = self._videos.get(source.key)
+        if writer is None:
+            path = os.path.splitext(os.path.join(self.annotate_dir, source.relative))[0] + ".mp4"
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            height, width = frame.image.shape[:2]
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), source.output_fps, (width, height))
+            self._videos[source.key] = writer
+        writer.write(imaging.draw_detections(frame.image, results))
+
+    def _close_video(self, source):
+        writer = self._videos.pop(source.key, None)
+        if writer is not None:
+            writer.release()
+
+    def _write_frame(self, frame, results, error=None):
+        source = frame.source
+        error = error or frame.error
+        record = {"source": source.path, "frame": frame.index, "time": frame.time}
+
+        if error is not None:
+            self.errors += 1
+            record["error"] = error
+            self.output.write(record)
+            # Source illisible : inutile de réessayer à la reprise (une erreur d'inférence, elle, sera retentée)
+            if frame.error is not None:
+                self.progress.update(source, frame.index, done=True)
+                self.sources_done += 1
+                self._close_video(source)
+            elif source.kind == "video":
+                self._stalled.add(source.key)
+            frame.image = None
+            return
+
+        if frame.image is None:
+            # Fin de vidéo : terminée seulement si aucune frame n'a échoué
+            if source.key not in self._stalled:
+                self.progress.update(source, self.progress.next_frame(source) - 1, done=True)
+                self.sources_done += 1
+            self._close_video(source)
+            return
+
+        results = ml.rescale_results(results, 1.0 / frame.scale)
+        height, width = frame.image.shape[:2]
+        record.update({
+            "width": round(width / frame.scale),
+            "height": round(height / frame.scale),
+            "detections": results["detections"],
+        })
+        self.output.write(record)
+        if self.annotate_dir:
+            self._annotate(frame, results)
+        self.frames += 1
+        self.detections += len(results["detections"])
+        if source.key not in self._stalled:
+            self.progress.update(source, frame.index, done=frame.last)
+        if frame.last:
+            self.sources_done += 1
+        # La frame n'est plus utile : mémoire libérée sans attendre la fin du lot
+        frame.image = None
+
+    def _write(self):
+        try:
+            self._write_results()
+        except BaseException as e:
+            self.failure = e
+            self._stop.set()
+            # Vider la file pour ne pas bloquer l'inférence
+            while self._results.get() is not _END:
+                pass
+
+    def _write_results(self):
+        last_flush = time.monotonic()
+        while True:
+            item = self._results.get()
+            if item is _END:
+                break
+            frames, future = item
+            results, error = [None] * len(frames), None
+            if future is not None:
+                try:
+                    results = future.result()
+                except Exception as e:
+                    error = f"Erreur d'inférence: {e}"
+            for frame, result in zip(frames, results):
+                self._write_frame(frame, result, error)
+
+            now = time.monotonic()
+            if now - last_flush >= self.flush_interval:
+                # Sortie d'abord, avancement ensuite : la reprise ne saute jamais une frame non écrite
+                self.output.flush()
+                self.progress.flush()
+                last_flush = now
+            if now - self._last_report[0] >= self.report_interval:
+                self.report()
+
+        for source_key in list(self._videos):
+            self._videos.pop(source_key).release()
+        self.output.flush()
+        self.progress.flush()
+
+    # --- Exécution ---
+
+    def report(self, final=False):
+        now = time.monotonic()
+        elapsed = max(now - self._started, 1e-9)
+        last_time, last_frames = self._last_report
+        recent = (self.frames - last_frames) / max(now - last_time, 1e-9)
+        self._last_report = (now, self.frames)
+        prefix = "Terminé" if final else "En cours"
+        print(
+            f"{prefix} : {self.frames} frames en {elapsed:.1f} s ({self.frames / elapsed:.1f} fps, "
+            f"récent {recent:.1f} fps), {self.detections} détections, {self.errors} erreurs, "
+            f"sources {self.sources_done}/{len(self.sources)}, "
+            f"files lecture {self._frames.qsize()} / écriture {self._results.qsize()}",
+            file=sys.stderr,
+        )
+
+    def run(self):
+        self._started = time.monotonic()
+        self._last_report = (self._started, 0)
+        self.sources_done = sum(self.progress.done(source) for source in self.sources)
+        reader = threading.Thread(target=self._read, name="scan-read", daemon=True)
+        writer = threading.Thread(target=self._write, name="scan-write", daemon=True)
+        reader.start()
+        writer.start()
+        try:
+            self._dispatch()
+        except KeyboardInterrupt:
+            # Arrêt propre : les lots déjà soumis sont écrits et l'avancement enregistré
+            self._stop.set()
+            print("Interruption : écriture des lots en cours...", file=sys.stderr)
+        finally:
+            self._stop.set()
+            self._results.put(_END)
+            writer.join()
+            reader.join(1.0)
+            self._decode_pool.shutdown(wait=False, cancel_futures=True)
+            self._infer_pool.shutdown(wait=True)
+        if self.failure is not None:
+            raise self.failure
+        self.report(final=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse hors ligne d'images et de vidéos archivées")
+    parser.add_argument("inputs", nargs="+", help="Dossiers, motifs glob (entre guillemets), images ou vidéos")
+    parser.add_argument("-o", "--output", required=True, help="Fichier JSONL, ou dossier Parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], help="Déduit de la sortie par défaut")
+    parser.add_argument("--batch-size", type=int, default=config.BATCH_MAX_SIZE)
+    parser.add_argument("--decode-workers", type=int, default=config.CPU_WORKERS)
+    parser.add_argument("--prefetch", type=int, help="Frames lues en avance (4 lots par défaut)")
+    parser.add_argument("--every", type=int, default=1, help="Garder une frame vidéo sur N")
+    parser.add_argument("--fps", type=float, help="Cadence d'échantillonnage des vidéos (frames/s)")
+    parser.add_argument("--annotate-dir", help="Écrire les images et vidéos annotées dans ce dossier")
+    parser.add_argument("--jpeg-quality", type=int, default=config.JPEG_QUALITY)
+    parser.add_argument("--tiled", action="store_true", help="Inférence par tuiles des grandes images")
+    parser.add_argument("--no-resume", action="store_true", help="Ignorer l'avancement d'une exécution précédente")
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("Erreur: aucune image ni vidéo trouvée", file=sys.stderr)
+        return 2
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    sources = [Source(path, root) for path in paths]
+
+    output_format = args.format or ("jsonl" if args.output.endswith((".jsonl", ".json")) else "parquet")
+    resume = not args.no_resume
+    if output_format == "jsonl":
+        if not resume and os.path.exists(args.output):
+            os.remove(args.output)
+        output = JsonlOutput(args.output)
+    else:
+        if not resume:
+            for part in glob.glob(os.path.join(args.output, "part-*.parquet")):
+                os.remove(part)
+        output = ParquetOutput(args.output)
+    progress = Progress(args.output.rstrip("/\\") + ".progress", resume)
+
+    if worker_pool.enabled:
+        worker_pool.start()
+    else:
+        ml.model_loader.load_and_warm_up()
+        if not ml.model_loader.ready:
+            print(f"Erreur: modèle indisponible ({ml.model_loader.error})", file=sys.stderr)
+            return 2
+
+    pipeline = ScanPipeline(
+        sources, output, progress,
+        batch_size=args.batch_size,
+        decode_workers=args.decode_workers,
+        prefetch=args.prefetch,
+        every=args.every,
+        fps=args.fps,
+        annotate_dir=args.annotate_dir,
+        jpeg_quality=args.jpeg_quality,
+        tiled=args.tiled,
+        report_interval=args.report_interval,
+    )
+    try:
+        pipeline.run()
+    finally:
+        output.close()
+        progress.close()
+        worker_pool.stop()
+    return 1 if pipeline.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+# scene.py - Porte de changement de scène et suivi sur images clés (numpy/cv2 seulement)
+
+"""
+Logique des sources vidéo continues, sans dépendance à l'API.
+
+Ce module n'importe que ``numpy``, ``cv2`` et ``api_fastapi.config`` : la
+boucle webcam locale (``main_app.py``) s'en sert sans charger FastAPI, les
+singletons du modèle, l'historique des détections ni les profils de source.
+Les registres par source et l'intégration à l'ordonnanceur d'inférence
+restent dans ``api_fastapi.gating`` et ``api_fastapi.tracking``.
+
+    - ``SceneChangeGate`` : saute l'inférence tant que la scène d'une caméra
+      fixe n'a pas changé (voir ``api_fastapi.gating``).
+    - ``KeyframeTracker`` : détection sur images clés et propagation des
+      boîtes par flux optique entre elles (voir ``api_fastapi.tracking``).
+"""
+
+import math
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from api_fastapi import config
+
+
+def detection_results(boxes, scores, class_ids, labels):
+    """
+    Assemble le résultat en colonnes et sa liste ``detections`` pour le JSON.
+    """
+    detections = [
+        {"type": label, "confidence": score, "x1": x1, "y1": y1, "x2": x2, "y2": y2}
+        for label, score, (x1, y1, x2, y2) in zip(labels, scores.tolist(), boxes.tolist())
+    ]
+    return {
+        "boxes": boxes,
+        "scores": scores,
+        "class_ids": class_ids,
+        "labels": labels,
+        "detections": detections,
+        "fire_detected": "fire" in labels,
+        "smoke_detected": "smoke" in labels,
+    }
+
+
+class SceneChangeGate:
+    """
+    Décide, frame par frame, si une caméra doit repasser par le modèle.
+
+    Args:
+        width: Largeur (px) de la vignette comparée.
+        pixel_delta: Écart de niveau de gris à partir duquel un pixel a changé.
+        threshold: Part des pixels changés (0-1) déclenchant une inférence.
+        max_interval: Intervalle maximal (s) entre deux inférences complètes.
+    """
+
+    def __init__(self, width=None, pixel_delta=None, threshold=None, max_interval=None):
+        self.width = width or config.SCENE_GATE_WIDTH
+        self.pixel_delta = config.SCENE_GATE_PIXEL_DELTA if pixel_delta is None else pixel_delta
+        self.threshold = config.SCENE_GATE_THRESHOLD if threshold is None else threshold
+        self.max_interval = config.SCENE_GATE_MAX_INTERVAL if max_interval is None else max_interval
+
+        # (vignette, résultats, instant, détections présentes) de la dernière frame analysée
+        self._reference = None
+
+        # Statistiques
+        self.inferred = 0
+        self.skipped = 0
+        self.forced = 0
+        self.last_change = None
+
+    def thumbnail(self, frame):
+        """
+        Vignette en niveaux de gris de la frame (la réduction INTER_AREA lisse le bruit du capteur).
+        """
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, round(height * self.width / width)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def check(self, frame):
+        """
+        Compare la frame à la dernière frame analysée.
+
+        Returns:
+            ``(vignette, résultats)`` : résultats précédents réutilisables, ou
+            ``None`` si la frame doit être analysée (passer alors la vignette à ``update``).
+        """
+        thumbnail = self.thumbnail(frame)
+        reference = self._reference
+        if reference is None or reference[0].shape != thumbnail.shape:
+            return thumbnail, None
+
+        previous, results, inferred_at, active = reference
+        if active:
+            return thumbnail, None
+        if time.monotonic() - inferred_at >= self.max_interval:
+            self.forced += 1
+            return thumbnail, None
+
+        changed = np.count_nonzero(cv2.absdiff(thumbnail, previous) > self.pixel_delta) / thumbnail.size
+        self.last_change = round(changed, 4)
+        if changed >= self.threshold:
+            return thumbnail, None
+
+        self.skipped += 1
+        return thumbnail, results
+
+    def update(self, thumbnail, results, active):
+        """
+        Enregistre la frame analysée et ses résultats comme nouvelle référence.
+
+        ``active`` : la frame contient des détections (les frames suivantes seront analysées).
+        """
+        self._reference = (thumbnail, results, time.monotonic(), active)
+        self.inferred += 1
+
+    def stats(self):
+        frames = self.inferred + self.skipped
+        return {
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "forced": self.forced,
+            "skip_ratio": round(self.skipped / frames, 3) if frames else 0.0,
+            "last_change": self.last_change,
+        }
+
+
+def _iou_matrix(boxes_a, boxes_b):
+    """
+    IoU entre deux ensembles de boîtes ``(N, 4)`` et ``(M, 4)``.
+    """
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    width = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    height = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = width * height
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+
+class Track:
+    """
+    Objet suivi : boîte courante, classe et confiance de la dernière image clé.
+    """
+
+    __slots__ = ("track_id", "box", "score", "class_id", "label", "missed")
+
+    def __init__(self, track_id, box, score, class_id, label):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.score = float(score)
+        self.class_id = int(class_id)
+        self.label = label
+        # Images clés consécutives sans détection associée
+        self.missed = 0
+
+
+class KeyframeTracker:
+    """
+    Pistes d'une source vidéo, mises à jour par le détecteur ou par flux optique.
+
+    Args:
+        interval: N initial (frames entre deux images clés).
+        max_seconds: Délai maximal (s) entre deux images clés.
+        iou_threshold: IoU minimal pour associer une détection à une piste.
+        max_missed: Images clés sans détection avant suppression d'une piste.
+    """
+
+    def __init__(self, interval=None, max_seconds=None, iou_threshold=None, max_missed=None):
+        self.interval = interval or config.KEYFRAME_INTERVAL
+        self.max_seconds = config.KEYFRAME_MAX_SECONDS if max_seconds is None else max_seconds
+        self.iou_threshold = config.TRACK_IOU_THRESHOLD if iou_threshold is None else iou_threshold
+        self.max_missed = config.TRACK_MAX_MISSED if max_missed is None else max_missed
+
+        self._lock = threading.Lock()
+        self._tracks = []
+        self._next_id = 1
+        self._prev_gray = None
+        self._scale = 1.0
+        self._frames_since_keyframe = 0
+        self._last_keyframe = None
+        self._last_frame = None
+        self._frame_interval = None
+
+        # Statistiques
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.tracks_created = 0
+
+    def needs_keyframe(self):
+        """
+        Indique si la prochaine frame doit passer par le détecteur.
+        """
+        if self._prev_gray is None or self._last_keyframe is None:
+            return True
+        if self._frames_since_keyframe + 1 >= self.interval:
+            return True
+        return time.monotonic() - self._last_keyframe >= self.max_seconds
+
+    def _gray(self, frame):
+        """
+        Frame en niveaux de gris, réduite à ``TRACK_WIDTH`` px de large pour le flux optique.
+        """
+        height, width = frame.shape[:2]
+        scale = min(1.0, config.TRACK_WIDTH / width)
+        if scale < 1.0:
+            frame = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return gray, scale
+
+    def _tick(self):
+        now = time.monotonic()
+        if self._last_frame is not None:
+            interval = now - self._last_frame
+            # Moyenne glissante exponentielle de l'intervalle entre frames
+            self._frame_interval = interval if self._frame_interval is None else 0.9 * self._frame_interval + 0.1 * interval
+        self._last_frame = now
+        return now
+
+    def propagate(self, frame):
+        """
+        Déplace les pistes visibles vers la frame courante par flux optique.
+
+        Chaque boîte est translatée du déplacement médian de quelques points
+        d'intérêt suivis à l'intérieur ; une boîte sans point suivable reste en place.
+        """
+        with self._lock:
+            self._tick()
+            gray, scale = self._gray(frame)
+            if self._prev_gray is None or self._prev_gray.shape != gray.shape:
+                self._prev_gray, self._scale = gray, scale
+                return self._results()
+
+            for track in self._visible():
+                x1, y1, x2, y2 = np.rint(track.box * scale).astype(int)
+                x1, y1 = max(x1, 0), max(y1, 0)
+                x2, y2 = min(x2, gray.shape[1]), min(y2, gray.shape[0])
+                if x2 - x1 < 4 or y2 - y1 < 4:
+                    continue
+                mask = np.zeros_like(self._prev_gray)
+                mask[y1:y2, x1:x2] = 255
+                points = cv2.goodFeaturesToTrack(self._prev_gray, 20, 0.01, 3, mask=mask)
+                if points is None:
+                    continue
+                moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None)
+                found = status.ravel() == 1
+                if not found.any():
+                    continue
+                dx, dy = np.median((moved - points).reshape(-1, 2)[found], axis=0) / scale
+                track.box = track.box + np.array([dx, dy, dx, dy], dtype=np.float32)
+
+            self._prev_gray, self._scale = gray, scale
+            self._frames_since_keyframe += 1
+            self.tracked_frames += 1
+            return self._results()
+
+    def update(self, frame, detections, inference_seconds=None):
+        """
+        Associe les détections d'une image clé aux pistes existantes.
+
+        Args:
+            frame: Frame analysée par le détecteur.
+            detections: Résultat du détecteur (``boxes``, ``scores``, ``class_ids``, ``labels``).
+            inference_seconds: Durée de l'inférence, pour adapter N (``None`` : pas d'adaptation).
+
+        Returns:
+            Résultat de détection avec ``track_ids``, ``new_track_ids`` et
+            un ``track_id`` dans chaque élément de ``detections``.
+        """
+        with self._lock:
+            now = self._tick()
+            boxes = np.asarray(detections["boxes"], dtype=np.float32).reshape(-1, 4)
+            scores = np.asarray(detections["scores"])
+            class_ids = np.asarray(detections["class_ids"])
+            labels = detections["labels"]
+
+            unmatched = set(range(len(boxes)))
+            if self._tracks and len(boxes):
+                ious = _iou_matrix(np.stack([track.box for track in self._tracks]), boxes)
+                # Pas d'association entre classes différentes
+                same_class = np.array([track.class_id for track in self._tracks])[:, None] == class_ids[None, :]
+                ious = np.where(same_class, ious, 0.0)
+                # Association gloutonne par IoU décroissant
+                for flat in np.argsort(ious, axis=None)[::-1]:
+                    t, d = np.unravel_index(flat, ious.shape)
+                    if ious[t, d] < self.iou_threshold:
+                        break
+                    if d not in unmatched or self._tracks[t].missed < 0:
+                        continue
+                    track = self._tracks[t]
+                    track.box, track.score = boxes[d].copy(), float(scores[d])
+                    # Marqueur provisoire : piste associée pendant cette image clé
+                    track.missed = -1
+                    unmatched.discard(d)
+
+            for track in self._tracks:
+                track.missed = 0 if track.missed < 0 else track.missed + 1
+            self._tracks = [track for track in self._tracks if track.missed <= self.max_missed]
+
+            new_ids = []
+            for d in sorted(unmatched):
+                track = Track(self._next_id, boxes[d], scores[d], class_ids[d], labels[d])
+                self._next_id += 1
+                self.tracks_created += 1
+                self._tracks.append(track)
+                new_ids.append(track.track_id)
+
+            self._prev_gray, self._scale = self._gray(frame)
+            self._frames_since_keyframe = 0
+            self._last_keyframe = now
+            self.keyframes += 1
+            if inference_seconds is not None and config.KEYFRAME_ADAPTIVE:
+                self._adapt(inference_seconds)
+
+            results = self._results()
+            results["new_track_ids"] = new_ids
+            return results
+
+    def _adapt(self, inference_seconds):
+        """
+        Choisit N pour que l'inférence tienne dans la part de CPU qui lui est allouée.
+        """
+        if not self._frame_interval:
+            return
+        budget = config.KEYFRAME_CPU_BUDGET * _free_cpu_ratio()
+        interval = math.ceil(inference_seconds / max(budget * self._frame_interval, 1e-6))
+        self.interval = min(max(interval, config.KEYFRAME_MIN_INTERVAL), config.KEYFRAME_MAX_INTERVAL)
+
+    def _visible(self):
+        # Une piste non revue à la dernière image clé n'est plus affichée
+        return [track for track in self._tracks if track.missed == 0]
+
+    def _results(self):
+        tracks = self._visible()
+        if tracks:
+            boxes = np.stack([track.box for track in tracks])
+        else:
+            boxes = np.empty((0, 4), dtype=np.float32)
+        results = detection_results(
+            boxes,
+            np.array([track.score for track in tracks], dtype=np.float32),
+            np.array([track.class_id for track in tracks], dtype=np.int64),
+            [track.label for track in tracks],
+        )
+        results["track_ids"] = [track.track_id for track in tracks]
+        results["new_track_ids"] = []
+        for detection, track in zip(results["detections"], tracks):
+            detection["track_id"] = track.track_id
+        return results
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "keyframes": self.keyframes,
+            "tracked_frames": self.tracked_frames,
+            "tracks": len(self._visible()),
+            "tracks_created": self.tracks_created,
+            "frame_interval_ms": round(1000 * self._frame_interval, 2) if self._frame_interval else None,
+        }
+
+
+def _free_cpu_ratio():
+    """
+    Part du CPU libre d'après la charge moyenne sur 1 minute (1.0 si indisponible).
+    """
+    if not hasattr(os, "getloadavg"):
+        return 1.0
+    load = os.getloadavg()[0] / (os.cpu_count() or 1)
+    return min(1.0, max(0.1, 1.0 - load))
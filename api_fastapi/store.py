@@ -0,0 +1,358 @@
+# store.py - Historique des détections : écriture différée dans DuckDB et archivage Parquet
+
+"""
+Persistance des détections dans ``fire_detections.duckdb``.
+
+L'écriture ne doit jamais ralentir une requête : les endpoints se contentent
+d'ajouter leurs détections (une ligne par boîte : horodatage, source, classe,
+confiance, coordonnées) à une file en mémoire. Un thread dédié vide la file
+par insertions groupées dès que ``STORE_FLUSH_ROWS`` lignes sont en attente
+ou toutes les ``STORE_FLUSH_INTERVAL`` s.
+
+Les journées entières plus anciennes que ``STORE_RETENTION_HOURS`` sont
+régulièrement déplacées vers un fichier Parquet par jour
+(``STORE_PARQUET_DIR/day=AAAA-MM-JJ/detections.parquet``) ; ``history``
+interroge la base et les fichiers Parquet ensemble.
+
+Contre-pression:
+    Si l'écriture prend du retard (disque lent, base verrouillée), la file
+    grossit jusqu'à ``STORE_QUEUE_MAX`` lignes. Au-delà, les nouvelles
+    détections ne sont pas mises en file : elles sont comptées dans
+    ``dropped`` (voir ``/stats``) et la requête n'est jamais bloquée. Une
+    insertion en échec est remise en tête de file dans la limite de la
+    place disponible, puis retentée au cycle suivant. À l'arrêt de
+    l'application, la file est vidée avant la fermeture de la base.
+
+Migration:
+    Les bases créées par les versions précédentes contiennent une table
+    ``fire_detections`` (id, timestamp, source_type, confidence). Au
+    démarrage, ses lignes sont copiées dans ``detections`` (classe
+    ``fire``, sans coordonnées) puis la table est supprimée, dans une même
+    transaction : l'historique existant reste visible dans
+    ``/detections/history``.
+"""
+
+import glob
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from api_fastapi import config
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("timestamp", "source", "class", "confidence", "x1", "y1", "x2", "y2")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    timestamp TIMESTAMP,
+    source VARCHAR,
+    class VARCHAR,
+    confidence DOUBLE,
+    x1 DOUBLE,
+    y1 DOUBLE,
+    x2 DOUBLE,
+    y2 DOUBLE
+)
+"""
+
+
+# Table des versions précédentes, migrée au démarrage
+_LEGACY_TABLE = "fire_detections"
+_LEGACY_COLUMNS = {"timestamp", "source_type", "confidence"}
+
+
+def _sql_string(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class DetectionStore:
+    """
+    File en mémoire et thread d'écriture des détections dans DuckDB.
+
+    Args:
+        path: Fichier de la base DuckDB.
+        parquet_dir: Dossier des archives Parquet.
+    """
+
+    def __init__(self, path=None, parquet_dir=None):
+        self.path = path or config.STORE_PATH
+        self.parquet_dir = parquet_dir or config.STORE_PARQUET_DIR
+        self.max_rows = config.STORE_QUEUE_MAX
+
+        self._rows = deque()
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._con = None
+
+        # Statistiques
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+        self.archived = 0
+        self.migrated = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.last_error = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not config.STORE_ENABLED or self.running:
+            return
+        import duckdb
+
+        self._con = duckdb.connect(self.path)
+        self._con.execute(_SCHEMA)
+        self.migrate()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="detection-store", daemon=True)
+        self._thread.start()
+
+    def migrate(self):
+        """
+        Copie l'ancienne table ``fire_detections`` dans ``detections``, puis la supprime.
+
+        Returns:
+            Nombre de lignes migrées (0 si la base n'a pas d'ancienne table).
+        """
+        columns = {
+            row[0] for row in self._con.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = ?", [_LEGACY_TABLE]
+            ).fetchall()
+        }
+        if not _LEGACY_COLUMNS <= columns:
+            return 0
+        self._con.execute("BEGIN TRANSACTION")
+        try:
+            count = self._con.execute(f"SELECT count(*) FROM {_LEGACY_TABLE}").fetchone()[0]
+            # Seules les détections de feu étaient enregistrées, sans leurs boîtes
+            self._con.execute(
+                f"INSERT INTO detections SELECT CAST(timestamp AS TIMESTAMP), source_type, 'fire', confidence, "
+                f"NULL, NULL, NULL, NULL FROM {_LEGACY_TABLE}"
+            )
+            self._con.execute(f"DROP TABLE {_LEGACY_TABLE}")
+            self._con.execute("COMMIT")
+        except Exception:
+            self._con.execute("ROLLBACK")
+            raise
+        self.migrated = count
+        return count
+
+    def stop(self, timeout=10.0):
+        """
+        Vide la file puis ferme la base.
+
+        Si le thread d'écriture n'a pas fini dans le délai (insertion ou
+        archivage en cours), la base n'est pas fermée sous lui : il termine
+        son cycle et le processus s'arrête sans fermeture explicite.
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.last_error = f"Écriture non terminée après {timeout} s : base laissée ouverte"
+            logger.warning(self.last_error)
+            return
+        self._thread = None
+        self._con.close()
+        self._con = None
+
+    def record(self, source, results, timestamp=None):
+        """
+        Met en file les détections d'un résultat, sans jamais bloquer.
+
+        Args:
+            source: Origine de l'image (URL, ``webcam:0``, nom de source...).
+            results: Résultat de détection (colonnes ``boxes``, ``scores``, ``labels``).
+            timestamp: Horodatage des détections (maintenant par défaut).
+        """
+        if not self.running or len(results["labels"]) == 0:
+            return
+        timestamp = timestamp or datetime.now()
+        rows = [
+            (timestamp, str(source), label, score, x1, y1, x2, y2)
+            for label, score, (x1, y1, x2, y2) in zip(
+                results["labels"], results["scores"].tolist(), results["boxes"].tolist()
+            )
+        ]
+        with self._condition:
+            if len(self._rows) + len(rows) > self.max_rows:
+                # Écriture en retard : on abandonne plutôt que de bloquer la requête
+                self.dropped += len(rows)
+                return
+            self._rows.extend(rows)
+            if len(self._rows) >= config.STORE_FLUSH_ROWS:
+                self._condition.notify()
+
+    def _run(self):
+        last_archive = time.monotonic()
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: len(self._rows) >= config.STORE_FLUSH_ROWS or self._stop_event.is_set(),
+                    config.STORE_FLUSH_INTERVAL,
+                )
+                batch = list(self._rows)
+                self._rows.clear()
+                stopping = self._stop_event.is_set()
+
+            if batch:
+                self._append(batch)
+            if time.monotonic() - last_archive >= config.STORE_ARCHIVE_INTERVAL:
+                self._archive()
+                last_archive = time.monotonic()
+            if stopping:
+                # Dernier essai pour une éventuelle insertion remise en file
+                if self._rows:
+                    self._append(list(self._rows))
+                return
+
+    def _append(self, batch):
+        """
+        Insère un lot de lignes en une seule requête (colonnes déroulées par ``unnest``).
+        """
+        started = time.perf_counter()
+        columns = [list(column) for column in zip(*batch)]
+        placeholders = ", ".join("unnest(?)" for _ in COLUMNS)
+        try:
+            self._con.execute(f"INSERT INTO detections SELECT {placeholders}", columns)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            with self._condition:
+                room = self.max_rows - len(self._rows)
+                self.dropped += max(len(batch) - room, 0)
+                self._rows.extendleft(reversed(batch[:max(room, 0)]))
+            return
+        elapsed = 1000 * (time.perf_counter() - started)
+        self.written += len(batch)
+        self.flushes += 1
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+
+    def _archive(self):
+        """
+        Déplace vers Parquet les journées entières plus anciennes que la rétention.
+
+        Chaque journée a un seul fichier (``day=AAAA-MM-JJ/detections.parquet``),
+        réécrit à chaque archivage de cette journée avec l'union (sans doublons)
+        de son contenu et des lignes encore en base. L'export est donc idempotent :
+        si la suppression échoue après l'écriture, l'archivage suivant réécrit
+        le même fichier avec les mêmes lignes au lieu de les dupliquer.
+        """
+        cutoff = datetime.combine(
+            (datetime.now() - timedelta(hours=config.STORE_RETENTION_HOURS)).date(), datetime.min.time()
+        )
+        columns = ", ".join(COLUMNS)
+        try:
+            days = [
+                row[0] for row in self._con.execute(
+                    "SELECT DISTINCT CAST(timestamp AS DATE) FROM detections WHERE timestamp < ? ORDER BY 1", [cutoff]
+                ).fetchall()
+            ]
+            for day in days:
+                start = datetime.combine(day, datetime.min.time())
+                end = start + timedelta(days=1)
+                directory = os.path.join(self.parquet_dir, f"day={day.isoformat()}")
+                target = os.path.join(directory, "detections.parquet")
+                staging = target + ".tmp"
+                os.makedirs(directory, exist_ok=True)
+
+                # COPY n'accepte pas de paramètres : valeurs insérées littéralement
+                query = (
+                    f"SELECT {columns} FROM detections WHERE timestamp >= TIMESTAMP '{start.isoformat(sep=' ')}' "
+                    f"AND timestamp < TIMESTAMP '{end.isoformat(sep=' ')}'"
+                )
+                if os.path.exists(target):
+                    query += f" UNION SELECT {columns} FROM read_parquet({_sql_string(target)})"
+                self._con.execute(f"COPY ({query}) TO {_sql_string(staging)} (FORMAT PARQUET)")
+                # Remplacement atomique : un lecteur voit l'ancien fichier ou le nouveau
+                os.replace(staging, target)
+
+                count = self._con.execute(
+                    "DELETE FROM detections WHERE timestamp >= ? AND timestamp < ?", [start, end]
+                ).fetchone()[0]
+                self.archived += count
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+
+    def history(self, start=None, end=None, source=None, class_name=None, limit=1000):
+        """
+        Détections entre ``start`` et ``end``, tous supports confondus (base et Parquet).
+
+        Les filtres sont optionnels ; les plus récentes d'abord.
+        Bloquant : à appeler via ``run_cpu`` depuis un endpoint.
+        """
+        if self._con is None:
+            raise RuntimeError("Historique des détections désactivé")
+
+        conditions, params = [], []
+        for clause, value in (
+            ("timestamp >= ?", start), ("timestamp < ?", end), ("source = ?", source), ("class = ?", class_name),
+        ):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        columns = ", ".join(COLUMNS)
+
+        query = f"SELECT {columns} FROM detections {where}"
+        query_params = list(params)
+        pattern = os.path.join(self.parquet_dir, "**", "*.parquet")
+        if glob.glob(pattern, recursive=True):
+            # Filtre sur la partition (jour) : seuls les fichiers utiles sont lus
+            day_conditions, day_params = [], []
+            if start is not None:
+                day_conditions.append("day >= CAST(? AS DATE)")
+                day_params.append(start)
+            if end is not None:
+                day_conditions.append("day <= CAST(? AS DATE)")
+                day_params.append(end)
+            parquet_where = " AND ".join(conditions + day_conditions)
+            query += (
+                f" UNION ALL SELECT {columns} FROM read_parquet({_sql_string(pattern)}, hive_partitioning = true)"
+                + (f" WHERE {parquet_where}" if parquet_where else "")
+            )
+            query_params += params + day_params
+
+        cursor = self._con.cursor()
+        try:
+            rows = cursor.execute(
+                f"SELECT * FROM ({query}) ORDER BY timestamp DESC LIMIT ?", query_params + [limit]
+            ).fetchall()
+        finally:
+            cursor.close()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def stats(self):
+        return {
+            "enabled": bool(config.STORE_ENABLED),
+            "running": self.running,
+            "queued": len(self._rows),
+            "max_queued": self.max_rows,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "archived": self.archived,
+            "migrated": self.migrated,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+
+# Instance unique, démarrée avec l'application
+detection_store = DetectionStore()
@@ -0,0 +1,216 @@
+# tiling.py - Inférence par tuiles recouvrantes pour les images haute résolution
+
+"""
+Détection des petits objets dans les grandes images (drones, satellites).
+
+Le modèle travaille à ``INFERENCE_IMGSZ`` (640 px) : une image de 4000 px
+est réduite six fois avant l'inférence et un petit panache de fumée n'y
+occupe plus que quelques pixels. Le ``TiledDetector`` découpe l'image en
+tuiles de ``TILE_SIZE`` px qui se recouvrent de ``TILE_OVERLAP``, les fait
+passer dans le modèle par groupes de ``TILE_CONCURRENCY`` (le micro-batching
+les regroupe en lots), puis ramène les boîtes dans les coordonnées de l'image
+et fusionne les doublons aux bords des tuiles par une NMS par classe.
+
+Une passe supplémentaire sur l'image entière (``TILE_INCLUDE_FULL``) garde
+les grands objets coupés par plusieurs tuiles.
+
+Mémoire:
+    Les tuiles sont des vues de l'image décodée (aucune copie) produites à la
+    demande : seul le groupe en cours d'inférence est converti à la taille
+    d'entrée du modèle, quelle que soit la taille de l'image.
+"""
+
+import asyncio
+import itertools
+import threading
+
+import numpy as np
+
+from api_fastapi import config, ml
+
+
+def tile_starts(length, tile_size, stride):
+    """
+    Positions de départ des tuiles sur un axe ; la dernière tuile est alignée sur le bord.
+    """
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+def nms(boxes, scores, class_ids, threshold, metric="iou"):
+    """
+    Suppression des non-maxima par classe.
+
+    Args:
+        boxes: Boîtes ``(N, 4)`` ``[x1, y1, x2, y2]``.
+        scores: Confiances ``(N,)``.
+        class_ids: Classes ``(N,)`` : seules les boîtes d'une même classe se suppriment.
+        threshold: Recouvrement au-delà duquel la boîte la moins confiante est supprimée.
+        metric: ``iou`` (intersection sur union) ou ``ios`` (intersection sur la plus
+            petite boîte, qui rattache aussi les boîtes tronquées au bord d'une tuile).
+
+    Returns:
+        Indices des boîtes conservées, par confiance décroissante.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    # Décalage par classe : des boîtes de classes différentes ne se recouvrent jamais
+    offsets = class_ids.astype(np.float32)[:, None] * (float(boxes.max()) + 1)
+    shifted = boxes + offsets
+    areas = np.maximum(shifted[:, 2] - shifted[:, 0], 0) * np.maximum(shifted[:, 3] - shifted[:, 1], 0)
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.clip(
+            np.minimum(shifted[best, 2], shifted[rest, 2]) - np.maximum(shifted[best, 0], shifted[rest, 0]), 0, None
+        )
+        height = np.clip(
+            np.minimum(shifted[best, 3], shifted[rest, 3]) - np.maximum(shifted[best, 1], shifted[rest, 1]), 0, None
+        )
+        inter = width * height
+        if metric == "ios":
+            overlap = inter / np.maximum(np.minimum(areas[best], areas[rest]), 1e-9)
+        else:
+            overlap = inter / np.maximum(areas[best] + areas[rest] - inter, 1e-9)
+        order = rest[overlap <= threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+class TiledDetector:
+    """
+    Découpe, inférence par groupes et fusion des détections d'une grande image.
+
+    Args:
+        tile_size: Côté (px) des tuiles.
+        overlap: Recouvrement entre tuiles voisines (fraction du côté, 0-1).
+        min_size: Plus grand côté (px) à partir duquel l'image est découpée.
+        concurrency: Nombre de tuiles soumises ensemble à l'inférence.
+        include_full: Ajouter une passe sur l'image entière.
+        nms_threshold: Seuil de fusion des détections.
+        nms_metric: ``iou`` ou ``ios`` (voir ``nms``).
+    """
+
+    def __init__(self, tile_size=None, overlap=None, min_size=None, concurrency=None,
+                 include_full=None, nms_threshold=None, nms_metric=None):
+        self.tile_size = tile_size or config.TILE_SIZE
+        self.overlap = config.TILE_OVERLAP if overlap is None else overlap
+        self.min_size = config.TILE_MIN_SIZE if min_size is None else min_size
+        self.concurrency = concurrency or config.TILE_CONCURRENCY
+        self.include_full = bool(config.TILE_INCLUDE_FULL if include_full is None else include_full)
+        self.nms_threshold = config.TILE_NMS_THRESHOLD if nms_threshold is None else nms_threshold
+        self.nms_metric = nms_metric or config.TILE_NMS_METRIC
+        self._lock = threading.Lock()
+
+        # Statistiques
+        self.images = 0
+        self.tiles = 0
+        self.merged = 0
+
+    def applies(self, image):
+        """
+        L'image est-elle assez grande pour être découpée ?
+        """
+        return max(image.shape[:2]) >= self.min_size
+
+    def tiles_of(self, image):
+        """
+        Génère ``(x, y, tuile)`` à la demande ; chaque tuile est une vue de l'image.
+
+        Avec ``include_full``, l'image entière est produite en premier (origine ``(0, 0)``).
+        """
+        if self.include_full:
+            yield 0, 0, image
+        height, width = image.shape[:2]
+        stride = max(1, int(self.tile_size * (1 - self.overlap)))
+        for y in tile_starts(height, self.tile_size, stride):
+            for x in tile_starts(width, self.tile_size, stride):
+                yield x, y, image[y:y + self.tile_size, x:x + self.tile_size]
+
+    def _groups(self, image):
+        tiles = self.tiles_of(image)
+        while True:
+            group = list(itertools.islice(tiles, self.concurrency))
+            if not group:
+                return
+            yield group
+
+    def merge(self, parts):
+        """
+        Ramène les détections des tuiles dans l'image et fusionne les doublons.
+
+        Args:
+            parts: Liste de ``(x, y, résultat)`` (résultat de ``ml.postprocess`` sur la tuile).
+        """
+        boxes, scores, class_ids, labels = [], [], [], []
+        for x, y, results in parts:
+            if len(results["labels"]) == 0:
+                continue
+            boxes.append(results["boxes"] + np.array([x, y, x, y], dtype=np.float32))
+            scores.append(results["scores"])
+            class_ids.append(results["class_ids"])
+            labels.extend(results["labels"])
+        if not boxes:
+            return ml.build_results(
+                np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64), []
+            )
+
+        boxes = np.concatenate(boxes).astype(np.float32)
+        scores = np.concatenate(scores)
+        class_ids = np.concatenate(class_ids)
+        keep = nms(boxes, scores, class_ids, self.nms_threshold, self.nms_metric)
+        with self._lock:
+            self.merged += len(boxes) - len(keep)
+        return ml.build_results(boxes[keep], scores[keep], class_ids[keep], [labels[i] for i in keep])
+
+    def _count(self, tiles):
+        with self._lock:
+            self.images += 1
+            self.tiles += tiles
+
+    async def detect(self, image, submit):
+        """
+        Détection par tuiles d'une image, chaque tuile passant par ``submit``
+        (ordonnanceur de micro-batching).
+        """
+        parts = []
+        for group in self._groups(image):
+            results = await asyncio.gather(*(submit(tile) for _, _, tile in group))
+            parts.extend((x, y, result) for (x, y, _), result in zip(group, results))
+        self._count(len(parts))
+        return self.merge(parts)
+
+    def detect_sync(self, image, infer=None):
+        """
+        Variante bloquante (scripts, benchmarks) : chaque groupe de tuiles est un lot
+        passé à ``infer`` (``ml.detect_fire_images`` par défaut).
+        """
+        infer = infer or ml.detect_fire_images
+        parts = []
+        for group in self._groups(image):
+            results = infer([tile for _, _, tile in group])
+            parts.extend((x, y, result) for (x, y, _), result in zip(group, results))
+        self._count(len(parts))
+        return self.merge(parts)
+
+    def stats(self):
+        return {
+            "enabled": bool(config.TILING_ENABLED),
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "min_size": self.min_size,
+            "include_full": self.include_full,
+            "images": self.images,
+            "tiles": self.tiles,
+            "mean_tiles": round(self.tiles / self.images, 2) if self.images else 0.0,
+            "merged_duplicates": self.merged,
+        }
+
+
+# Détecteur partagé par les endpoints (TILING_ENABLED)
+tiled_detector = TiledDetector()
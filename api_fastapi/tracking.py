@@ -0,0 +1,106 @@
+# tracking.py - Détection sur images clés et suivi des boîtes entre elles
+
+"""
+Suivi léger des détections pour les sources vidéo continues.
+
+Plutôt que d'analyser chaque frame d'une webcam, le détecteur ne tourne que
+sur des images clés (toutes les N frames, ou au moins toutes les
+``KEYFRAME_MAX_SECONDS`` s). Entre deux images clés, les boîtes de feu et de
+fumée sont déplacées par flux optique (Lucas-Kanade sur quelques points de
+chaque boîte), ce qui coûte une fraction d'inférence.
+
+À chaque image clé, les nouvelles détections sont associées aux pistes
+existantes par IoU (même classe) : une piste garde son identifiant
+``track_id`` d'une frame à l'autre. Les pistes nouvellement créées sont
+listées dans ``new_track_ids``, ce qui permet de n'alerter qu'une fois par
+événement plutôt qu'à chaque frame.
+
+N s'adapte au CPU disponible : il est choisi pour que l'inférence n'occupe
+qu'une part ``KEYFRAME_CPU_BUDGET`` du temps entre frames, réduite d'autant
+que la machine est chargée (charge moyenne système).
+
+Le ``KeyframeTracker`` lui-même est dans ``api_fastapi.scene`` (sans
+dépendance à l'API) ; ce module tient les pistes de chaque source et les
+relie à l'ordonnanceur d'inférence et à l'historique.
+"""
+
+import threading
+import time
+
+from api_fastapi import config
+from api_fastapi.concurrency import run_cpu
+from api_fastapi.gating import detect_gated
+from api_fastapi.profiles import source_profiles
+from api_fastapi.scene import KeyframeTracker
+from api_fastapi.store import detection_store
+
+
+class TrackerRegistry:
+    """
+    Un ``KeyframeTracker`` par source vidéo (index de caméra).
+    """
+
+    def __init__(self):
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+    def get(self, source):
+        with self._lock:
+            tracker = self._trackers.get(source)
+            if tracker is None:
+                tracker = KeyframeTracker()
+                self._trackers[source] = tracker
+            return tracker
+
+    def remove(self, source):
+        with self._lock:
+            self._trackers.pop(source, None)
+
+    def stats(self):
+        with self._lock:
+            trackers = dict(self._trackers)
+        return {
+            "enabled": bool(config.TRACKING_ENABLED),
+            "sources": {str(source): tracker.stats() for source, tracker in trackers.items()},
+        }
+
+
+# Registre partagé par l'endpoint webcam et le flux MJPEG
+trackers = TrackerRegistry()
+
+
+def _source_label(source):
+    # Les index numériques sont les webcams locales, les autres des sources nommées
+    return f"webcam:{source}" if isinstance(source, int) else str(source)
+
+
+async def detect_tracked(source, frame, submit):
+    """
+    Résultat de détection d'une frame d'une source vidéo.
+
+    Sans suivi activé (``TRACKING_ENABLED``), équivaut à ``detect_gated``.
+    Sinon, le détecteur ne tourne que sur les images clés et les boîtes sont
+    propagées par flux optique entre elles. Les détections issues du modèle
+    sont enregistrées dans l'historique. Le profil de la source (région
+    d'intérêt, taille d'entrée) s'applique à chaque inférence.
+
+    Returns:
+        ``(résultats, inférence exécutée)``.
+    """
+    submit = source_profiles.bind(_source_label(source), submit)
+    if not config.TRACKING_ENABLED:
+        results, inferred = await detect_gated(source, frame, submit)
+        if inferred:
+            detection_store.record(_source_label(source), results)
+        return results, inferred
+
+    tracker = trackers.get(source)
+    if not tracker.needs_keyframe():
+        return await run_cpu(tracker.propagate, frame), False
+
+    started = time.perf_counter()
+    detections, inferred = await detect_gated(source, frame, submit)
+    if inferred:
+        detection_store.record(_source_label(source), detections)
+    inference_seconds = time.perf_counter() - started if inferred else None
+    return await run_cpu(tracker.update, frame, detections, inference_seconds), inferred
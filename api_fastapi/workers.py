@@ -0,0 +1,398 @@
+# workers.py - Pool de processus de modèle, frames transmises par mémoire partagée
+
+"""
+Inférence répartie sur plusieurs processus (``MODEL_WORKERS``).
+
+Dans un seul processus uvicorn, tout le travail Python autour de
+l'inférence (prétraitement, post-traitement) passe par un seul
+interpréteur. Le ``WorkerPool`` lance ``MODEL_WORKERS`` processus, chacun
+avec son propre modèle et ``WORKER_THREADS`` threads de calcul, ce qui
+permet d'occuper tous les cœurs des nœuds CPU tandis que le processus de
+l'API ne fait plus que le HTTP, le décodage et le rendu.
+
+Transmission des frames:
+    Chaque processus dispose d'un segment de mémoire partagée découpé en
+    ``WORKER_SLOTS`` emplacements de ``WORKER_SLOT_BYTES`` octets. La frame
+    y est copiée une fois, et seule sa description (emplacement, forme,
+    type) passe par le tube : aucun tableau numpy n'est sérialisé. Les
+    frames trop grandes, ou en surnombre, sont sérialisées normalement.
+
+Répartition et reprise:
+    Chaque lot va au processus prêt qui a le moins d'images en cours. Un
+    processus qui s'arrête (plantage, mémoire) est relancé automatiquement
+    après ``WORKER_RESTART_DELAY`` s, délai doublé à chaque échec
+    consécutif. Un lot interrompu par un plantage est relancé une fois sur
+    un autre processus, et un lot qui dépasse ``WORKER_TIMEOUT`` fait
+    relancer son processus.
+
+Le pool s'utilise depuis les threads de l'ordonnanceur de micro-batching
+(``infer`` est bloquant) : un lot par processus peut s'exécuter en parallèle.
+"""
+
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from api_fastapi import config
+
+
+class WorkerCrashed(RuntimeError):
+    """
+    Processus de modèle arrêté avant d'avoir rendu le résultat d'un lot.
+    """
+
+
+def _attach(name):
+    """
+    Ouvre le segment de mémoire partagée créé par le processus de l'API.
+
+    Le segment appartient au processus de l'API : il ne doit pas être suivi
+    (et supprimé à la sortie) par le processus de modèle.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 : pas d'option track, on se retire du suivi à la main
+        from multiprocessing import resource_tracker
+
+        memory = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+def _limit_threads(threads):
+    """
+    Fixe le nombre de threads de calcul avant l'import de torch / onnxruntime.
+    """
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(threads)
+    import cv2
+
+    # Prétraitement d'un lot à la fois : un thread OpenCV par processus suffit
+    cv2.setNumThreads(1)
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except ImportError:
+        pass
+
+
+def _frame(memory, slot_bytes, frame):
+    if frame[0] == "shm":
+        _, slot, shape, dtype = frame
+        return np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=slot * slot_bytes)
+    return frame[1]
+
+
+def _worker_main(conn, memory_name, slot_bytes, threads):
+    """
+    Boucle d'un processus de modèle : charge le modèle, puis traite les lots reçus.
+
+    Messages reçus : ``("infer", identifiant, frames, imgsz)`` ou ``None`` (arrêt).
+    Messages envoyés : ``("ready", état du modèle)``, ``("failed", erreur)`` et
+    ``("result", identifiant, résultats, erreur)``.
+    """
+    _limit_threads(threads)
+    from api_fastapi import ml
+
+    ml.model_loader.load_and_warm_up()
+    if not ml.model_loader.ready:
+        conn.send(("failed", ml.model_loader.error))
+        return
+    conn.send(("ready", ml.model_loader.stats()))
+
+    memory = _attach(memory_name)
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        _, request_id, frames, imgsz = message
+        try:
+            images = [_frame(memory, slot_bytes, frame) for frame in frames]
+            results = ml.detect_fire_images(images, imgsz)
+            del images
+            conn.send(("result", request_id, results, None))
+        except Exception as e:
+            conn.send(("result", request_id, None, f"{type(e).__name__}: {e}"))
+    try:
+        memory.close()
+    except BufferError:
+        # Le prédicteur garde une référence au dernier lot : libéré à la sortie du processus
+        pass
+
+
+class ModelWorker:
+    """
+    Un processus de modèle, son tube et son segment de mémoire partagée.
+
+    États : ``starting``, ``ready``, ``restarting``, ``stopped``.
+    """
+
+    def __init__(self, index, slot_bytes, slots, threads):
+        self.index = index
+        self.slot_bytes = slot_bytes
+        self.threads = threads
+        self.memory = shared_memory.SharedMemory(create=True, size=max(slot_bytes * slots, 1))
+        self.free_slots = list(range(slots))
+        self.process = None
+        self.conn = None
+        self.state = "stopped"
+        self.in_flight = 0
+        self.pending = {}
+        self.send_lock = threading.Lock()
+        self.ids = itertools.count()
+
+        # Statistiques
+        self.batches = 0
+        self.items = 0
+        self.shared_frames = 0
+        self.pickled_frames = 0
+        self.restarts = 0
+        self.failures = 0
+        self.last_error = None
+        self.model = None
+
+    def start(self, context):
+        parent_conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, self.memory.name, self.slot_bytes, self.threads),
+            name=f"model-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.state = "starting"
+
+    def kill(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+
+    def stats(self):
+        return {
+            "index": self.index,
+            "pid": self.process.pid if self.process is not None else None,
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "batches": self.batches,
+            "items": self.items,
+            "shared_frames": self.shared_frames,
+            "pickled_frames": self.pickled_frames,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+            "model": self.model,
+        }
+
+
+class WorkerPool:
+    """
+    Processus de modèle, répartition au moins chargé et relance automatique.
+
+    Args:
+        size: Nombre de processus (0 : pool désactivé).
+        threads: Threads de calcul par processus (cœurs répartis par défaut).
+        slot_bytes: Taille d'un emplacement de frame en mémoire partagée.
+        slots: Emplacements par processus.
+    """
+
+    def __init__(self, size=None, threads=None, slot_bytes=None, slots=None):
+        self.size = config.MODEL_WORKERS if size is None else size
+        self.threads = threads or config.WORKER_THREADS or max(1, (os.cpu_count() or 1) // max(self.size, 1))
+        self.slot_bytes = slot_bytes or config.WORKER_SLOT_BYTES
+        self.slots = config.WORKER_SLOTS if slots is None else slots
+        self.workers = []
+        # Empreinte des poids du dernier processus prêt (clés du cache de résultats)
+        self.model_version = None
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        # spawn : pas d'héritage de l'état du processus de l'API (boucle asyncio, threads)
+        self._context = multiprocessing.get_context("spawn")
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    @property
+    def ready(self):
+        return any(worker.state == "ready" for worker in self.workers)
+
+    def start(self):
+        if not self.enabled or self.workers:
+            return
+        self._stop_event.clear()
+        for index in range(self.size):
+            worker = ModelWorker(index, self.slot_bytes, self.slots, self.threads)
+            self.workers.append(worker)
+            self._spawn(worker)
+
+    def stop(self, timeout=10.0):
+        self._stop_event.set()
+        for worker in self.workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.kill()
+                worker.process.join()
+            worker.memory.close()
+            worker.memory.unlink()
+        self.workers = []
+
+    def _spawn(self, worker):
+        worker.start(self._context)
+        threading.Thread(
+            target=self._watch, args=(worker,), name=f"model-worker-{worker.index}-reader", daemon=True
+        ).start()
+
+    def _watch(self, worker):
+        """
+        Lit les messages d'un processus, puis gère son arrêt (échec des lots en cours, relance).
+        """
+        conn = worker.conn
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "ready":
+                with self._condition:
+                    worker.state = "ready"
+                    worker.model = message[1]
+                    self.model_version = message[1].get("version")
+                    worker.failures = 0
+                    self._condition.notify_all()
+            elif message[0] == "failed":
+                worker.last_error = message[1]
+            else:
+                _, request_id, results, error = message
+                with self._condition:
+                    future = worker.pending.pop(request_id, None)
+                if future is None:
+                    continue
+                if error is not None:
+                    future.set_exception(RuntimeError(error))
+                else:
+                    future.set_result(results)
+
+        worker.process.join(1.0)
+        exitcode = worker.process.exitcode
+        conn.close()
+        with self._condition:
+            worker.state = "stopped" if self._stop_event.is_set() else "restarting"
+            pending, worker.pending = worker.pending, {}
+        for future in pending.values():
+            future.set_exception(WorkerCrashed(f"Processus de modèle {worker.index} arrêté (code {exitcode})"))
+        if self._stop_event.is_set():
+            return
+
+        worker.restarts += 1
+        worker.failures += 1
+        if exitcode:
+            worker.last_error = worker.last_error or f"Code de sortie {exitcode}"
+        delay = min(config.WORKER_RESTART_DELAY * 2 ** (worker.failures - 1), config.WORKER_RESTART_MAX_DELAY)
+        if not self._stop_event.wait(delay):
+            self._spawn(worker)
+
+    def _submit(self, images, imgsz):
+        """
+        Choisit le processus le moins chargé, copie les frames et envoie le lot.
+        """
+        with self._condition:
+            # Avant le premier chargement (ou pendant une relance), on attend un processus prêt
+            if not self._condition.wait_for(lambda: self.ready, config.WORKER_TIMEOUT):
+                raise RuntimeError("Aucun processus de modèle disponible")
+            worker = min((w for w in self.workers if w.state == "ready"), key=lambda w: w.in_flight)
+            worker.in_flight += len(images)
+            slots = [
+                worker.free_slots.pop() if image.nbytes <= self.slot_bytes and worker.free_slots else None
+                for image in images
+            ]
+            request_id = next(worker.ids)
+            future = Future()
+            worker.pending[request_id] = future
+
+        frames = []
+        for image, slot in zip(images, slots):
+            if slot is None:
+                frames.append(("array", np.ascontiguousarray(image)))
+                worker.pickled_frames += 1
+                continue
+            shared = np.ndarray(image.shape, dtype=image.dtype, buffer=worker.memory.buf, offset=slot * self.slot_bytes)
+            np.copyto(shared, image)
+            del shared
+            frames.append(("shm", slot, image.shape, image.dtype.str))
+            worker.shared_frames += 1
+
+        try:
+            with worker.send_lock:
+                worker.conn.send(("infer", request_id, frames, imgsz))
+        except (OSError, ValueError):
+            # Tube fermé : le processus vient de s'arrêter
+            with self._condition:
+                worker.pending.pop(request_id, None)
+            if not future.done():
+                future.set_exception(WorkerCrashed(f"Processus de modèle {worker.index} injoignable"))
+        return worker, slots, future
+
+    def _release(self, worker, slots, count, done):
+        with self._condition:
+            worker.in_flight -= count
+            worker.free_slots.extend(slot for slot in slots if slot is not None)
+            if done:
+                worker.batches += 1
+                worker.items += count
+
+    def infer(self, images, imgsz=None):
+        """
+        Détecte le feu et la fumée sur un lot d'images dans un processus de modèle (bloquant).
+
+        Même contrat que ``ml.detect_fire_images`` : un résultat par image, dans l'ordre.
+        """
+        images = list(images)
+        for attempt in range(2):
+            worker, slots, future = self._submit(images, imgsz)
+            done = False
+            try:
+                results = future.result(config.WORKER_TIMEOUT)
+                done = True
+                return results
+            except WorkerCrashed:
+                # Lot relancé une fois, sur un autre processus si possible
+                if attempt:
+                    raise
+            except FutureTimeoutError:
+                worker.last_error = f"Lot bloqué plus de {config.WORKER_TIMEOUT} s"
+                worker.kill()
+                raise RuntimeError(f"Processus de modèle {worker.index} bloqué, relance en cours")
+            finally:
+                self._release(worker, slots, len(images), done)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "size": self.size,
+            "threads_per_worker": self.threads,
+            "slot_bytes": self.slot_bytes,
+            "slots_per_worker": self.slots,
+            "ready": sum(worker.state == "ready" for worker in self.workers),
+            "workers": [worker.stats() for worker in self.workers],
+        }
+
+
+# Pool unique, démarré avec l'application si MODEL_WORKERS > 0
+worker_pool = WorkerPool()
@@ -0,0 +1,229 @@
+# common.py - Outils partagés des benchmarks : mesures, images, serveur local, comparaison
+
+"""
+Fonctions communes aux benchmarks de ``benchmarks/``.
+
+Les résultats sont écrits en JSON sous la forme::
+
+    {"meta": {...}, "results": {"<nom>": {"<métrique>": valeur, ...}}}
+
+ce qui permet de comparer deux exécutions métrique par métrique
+(``compare``) : les métriques en ``_ms`` sont meilleures à la baisse, les
+débits (``rps``, ``ops``) et les rappels à la hausse.
+"""
+
+import glob
+import http.server
+import json
+import os
+import platform
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Résolutions des frames synthétiques (largeur, hauteur)
+SYNTHETIC_SIZES = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080), "4k": (3840, 2160)}
+
+
+def summarize(durations):
+    """
+    Statistiques (ms) d'une liste de durées en secondes.
+    """
+    values = np.asarray(durations, dtype=np.float64) * 1000
+    if len(values) == 0:
+        return {"count": 0}
+    return {
+        "count": int(len(values)),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def measure(fn, repeat=20, warmup=2, min_seconds=0.0):
+    """
+    Appelle ``fn`` ``repeat`` fois (au moins ``min_seconds`` s) après ``warmup`` appels à blanc.
+
+    Returns:
+        Statistiques de ``summarize`` plus ``ops`` (appels par seconde).
+    """
+    for _ in range(warmup):
+        fn()
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < repeat or time.perf_counter() - started < min_seconds:
+        t0 = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - t0)
+    stats = summarize(durations)
+    stats["ops"] = round(len(durations) / sum(durations), 2) if sum(durations) else None
+    return stats
+
+
+def synthetic_frame(width, height, seed=0):
+    """
+    Frame BGR synthétique (dégradés et bruit) : se compresse comme une vraie photo,
+    contrairement à un bruit blanc pur.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2)
+    noise = rng.normal(0, 12, (height, width, 3))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def sample_images():
+    """
+    Entrées des benchmarks : ``{nom: octets JPEG}`` pour les JPEG du dépôt
+    et les frames synthétiques à plusieurs résolutions.
+    """
+    images = {}
+    for path in sorted(glob.glob(os.path.join(ROOT, "*.jpg"))):
+        with open(path, "rb") as f:
+            images[f"bundled:{os.path.basename(path)[:24]}"] = f.read()
+    for name, (width, height) in SYNTHETIC_SIZES.items():
+        _, buffer = cv2.imencode(".jpg", synthetic_frame(width, height), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        images[f"synthetic:{name}"] = buffer.tobytes()
+    return images
+
+
+class ImageServer:
+    """
+    Serveur HTTP local servant des images en mémoire (``/<nom>``), en remplacement
+    des serveurs d'images distants. S'utilise comme gestionnaire de contexte.
+
+    Avec ``unique=True``, la chaîne de requête (``/<nom>?n=42``) est ajoutée
+    après les octets de l'image : chaque URL donne un contenu distinct (le
+    cache par contenu de l'API ne sert jamais) pour la même image décodée.
+    """
+
+    def __init__(self, images, host="127.0.0.1", port=0, unique=False):
+        self.images = {self.path(name): content for name, content in images.items()}
+        images_by_path = self.images
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                content = images_by_path.get(path)
+                if content is None:
+                    self.send_error(404)
+                    return
+                if unique and query:
+                    # Après le marqueur de fin du JPEG : ignoré au décodage
+                    content = content + query.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @staticmethod
+    def path(name):
+        return "/" + name.replace(":", "_").replace("/", "_")
+
+    def url(self, name):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.path(name)}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="image-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def metadata(**extra):
+    meta = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+    meta.update(extra)
+    return meta
+
+
+def write_results(path, meta, results):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+
+
+def _higher_is_better(metric):
+    return metric in ("rps", "ops", "recall", "small_recall", "map50_95")
+
+
+def compare(current, baseline, tolerance=0.1):
+    """
+    Compare deux exécutions (dictionnaires ``results``) métrique par métrique.
+
+    Seules les moyennes, percentiles, débits, mémoire et précision communs aux deux exécutions
+    sont comparés. Une régression est un écart défavorable supérieur à
+    ``tolerance`` (fraction de la valeur de référence).
+
+    Returns:
+        ``(lignes de rapport, nombre de régressions)``.
+    """
+    lines, regressions = [], 0
+    for name in sorted(set(current) & set(baseline)):
+        for metric in (
+            "mean_ms", "p50_ms", "p95_ms", "p99_ms", "rps", "ops", "recall", "small_recall", "peak_rss_mb", "map50_95",
+        ):
+            new, old = current[name].get(metric), baseline[name].get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            worse = -change if _higher_is_better(metric) else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif worse < -tolerance:
+                flag = "  amélioration"
+            lines.append(f"{name:45s} {metric:8s} {old:12.3f} -> {new:12.3f} ({change:+.1%}){flag}")
+    return lines, regressions
+
+
+def report_baseline(results, baseline_path, tolerance, meta=None, same=()):
+    """
+    Affiche la comparaison avec une exécution de référence et retourne le code de sortie.
+
+    ``same`` : clés de ``meta`` qui doivent valoir la même chose dans la
+    référence (sinon, code 2 sans comparaison : mesures non comparables).
+    """
+    with open(baseline_path) as f:
+        data = json.load(f)
+    for key in same:
+        if data.get("meta", {}).get(key) != meta.get(key):
+            print(
+                f"Référence non comparable : {key}={data.get('meta', {}).get(key)!r} "
+                f"(exécution courante : {meta.get(key)!r})"
+            )
+            return 2
+    baseline = data["results"]
+    lines, regressions = compare(results, baseline, tolerance)
+    print("\n".join(lines))
+    print(f"{regressions} régression(s) au-delà de {tolerance:.0%}")
+    return 1 if regressions else 0
@@ -0,0 +1,168 @@
+# load.py - Générateur de charge de bout en bout pour l'API
+
+"""
+Charge soutenue sur ``/detect_fire_url`` à plusieurs niveaux de concurrence.
+
+Les images sont servies par un serveur local (pas de dépendance réseau).
+L'API est pilotée soit dans le même processus (``httpx.ASGITransport``, cycle
+de vie FastAPI compris), soit sur ``--url`` (ex: ``http://localhost:8086``).
+Pour chaque niveau de concurrence, ``N`` clients enchaînent les requêtes
+pendant ``--duration`` secondes ; le rapport donne les requêtes/s et les
+latences p50/p95/p99.
+
+Utilisation::
+
+    python -m benchmarks.load --concurrency 1 4 16 64 --output bench/load.json
+    python -m benchmarks.load --url http://localhost:8086 --baseline bench/load.json
+
+Par défaut (``--cache off``), chaque requête mesure la chaîne complète
+(téléchargement, décodage, inférence, rendu) : l'URL porte un numéro unique
+et le serveur d'images ajoute ce numéro après le JPEG, si bien que ni le
+cache par URL ni le cache par contenu ne servent, même sur une API distante
+(en mode intégré, le cache est en plus désactivé). ``--cache on`` réutilise
+les mêmes URL pour mesurer les réponses servies par le cache. Le mode est
+enregistré dans les résultats, et une référence mesurée dans l'autre mode
+est refusée.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import ImageServer, metadata, report_baseline, sample_images, summarize, write_results
+
+
+@contextlib.asynccontextmanager
+async def _client(url):
+    """
+    Client HTTP vers l'API : distante (``url``) ou intégrée au processus.
+    """
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=60.0) as client:
+            yield client
+        return
+
+    from api_fastapi.main import app
+
+    # ASGITransport n'exécute pas le cycle de vie : démarrage explicite
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api", timeout=60.0) as client:
+            yield client
+
+
+async def _wait_ready(client, timeout):
+    """
+    Attend que ``/ready`` réponde 200 (modèle chargé et préchauffé).
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("L'API n'est pas prête (GET /ready)")
+
+
+async def _worker(client, urls, response_format, deadline, latencies, statuses):
+    while time.monotonic() < deadline:
+        payload = {"image_url": next(urls), "response_format": response_format}
+        started = time.perf_counter()
+        try:
+            response = await client.post("/detect_fire_url", json=payload)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = "error"
+        latencies.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+
+
+async def run_level(client, urls, concurrency, duration, response_format):
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(
+        _worker(client, urls, response_format, deadline, latencies, statuses) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    stats = summarize(latencies)
+    ok = statuses.get(200, 0)
+    stats.update({
+        "concurrency": concurrency,
+        "rps": round(ok / elapsed, 2),
+        "errors": sum(count for status, count in statuses.items() if status != 200),
+        "statuses": {str(status): count for status, count in statuses.items()},
+    })
+    return stats
+
+
+async def run(args):
+    images = sample_images()
+    if args.images:
+        images = {name: content for name, content in images.items() if any(key in name for key in args.images)}
+
+    cached = args.cache == "on"
+    if not cached and not args.url:
+        from api_fastapi import config
+        config.DETECTION_CACHE_ENABLED = 0
+
+    results = {}
+    with ImageServer(images, host=args.image_host, unique=not cached) as server:
+        urls = itertools.cycle([server.url(name) for name in images])
+        if not cached:
+            urls = (f"{url}?n={n}" for n, url in enumerate(urls))
+        async with _client(args.url) as client:
+            await _wait_ready(client, args.ready_timeout)
+            for concurrency in args.concurrency:
+                stats = await run_level(client, urls, concurrency, args.duration, args.response_format)
+                results[f"concurrency={concurrency}"] = stats
+                print(
+                    f"concurrence {concurrency:4d}  {stats['rps']:8.2f} req/s  "
+                    f"p50 {stats.get('p50_ms', 0):9.2f} ms  p95 {stats.get('p95_ms', 0):9.2f} ms  "
+                    f"p99 {stats.get('p99_ms', 0):9.2f} ms  erreurs {stats['errors']}"
+                )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Charge de bout en bout sur /detect_fire_url")
+    parser.add_argument("--url", help="API distante (par défaut : application dans le processus)")
+    parser.add_argument("--image-host", default="127.0.0.1", help="Adresse d'écoute du serveur d'images local")
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--duration", type=float, default=10.0, help="Durée (s) de chaque niveau")
+    parser.add_argument("--response-format", default="json", choices=["json", "detections", "jpeg", "multipart"])
+    parser.add_argument("--images", nargs="*", help="Filtre sur les noms d'images (ex: synthetic:720p)")
+    parser.add_argument(
+        "--cache", choices=["off", "on"], default="off",
+        help="off : URL et contenu uniques par requête (chaîne complète) ; on : mêmes URL (réponses du cache)",
+    )
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--output", default="bench/load.json")
+    parser.add_argument("--baseline", help="Exécution de référence (JSON) à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    meta = metadata(
+        benchmark="load",
+        target=args.url or "in-process",
+        duration=args.duration,
+        response_format=args.response_format,
+        cache=args.cache,
+    )
+    write_results(args.output, meta, results)
+    print(f"Résultats écrits dans {args.output}")
+    if args.baseline:
+        return report_baseline(results, args.baseline, args.tolerance, meta, same=("cache", "response_format"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# runs.py - Vitesse et précision des entraînements de runs/detect (tableau de Pareto)
+
+"""
+Compare les poids de chaque entraînement de ``runs/detect`` pour choisir le
+modèle et la taille d'entrée déployés sur des mesures plutôt qu'à la main.
+
+Pour chaque entraînement (``args.yaml``, ``results.csv``, ``weights/best.pt``):
+
+    - précision : mAP50 et mAP50-95 de la meilleure époque de ``results.csv``
+      (celle de ``best.pt``, critère ``fitness`` d'ultralytics), mesurée à la
+      taille d'entraînement ; avec ``--data``, mAP recalculée par ``model.val``
+      à chaque taille d'entrée sur un même jeu de validation
+    - vitesse : latence CPU (p50/p95, par lot et par image) et débit, pour
+      chaque ``--imgsz`` et ``--batch``
+    - mémoire : RSS après chargement et pic de RSS, chaque configuration étant
+      mesurée dans un processus neuf
+
+Les entraînements n'utilisent pas tous le même jeu de données : sans
+``--data``, le front de Pareto (latence par image / mAP50-95) est calculé
+par jeu de données et par taille de lot. Un entraînement sans ``best.pt``
+n'apparaît qu'avec sa précision.
+
+Utilisation::
+
+    python -m benchmarks.runs --imgsz 320 480 640 --batch 1 8 --output bench/runs.json
+    python -m benchmarks.runs --data FIRE-1/data.yaml --weights deployed=best.pt
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import glob
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+
+from benchmarks.common import ROOT, measure, metadata, report_baseline, sample_images, write_results
+
+
+def read_args(path):
+    """
+    Paramètres de premier niveau d'un ``args.yaml`` (la dernière valeur d'une clé répétée l'emporte).
+    """
+    values = {}
+    with open(path) as f:
+        for line in f:
+            if line.startswith((" ", "#", "-")) or ":" not in line:
+                continue
+            key, value = line.split(":", 1)
+            values[key.strip()] = value.strip()
+    return values
+
+
+def best_epoch(path):
+    """
+    Meilleure époque de ``results.csv`` selon le critère ``fitness`` d'ultralytics
+    (0.1 x mAP50 + 0.9 x mAP50-95), celle enregistrée dans ``best.pt``.
+    """
+    with open(path, newline="") as f:
+        rows = [
+            {key.strip(): value.strip() for key, value in row.items() if key is not None}
+            for row in csv.DictReader(f)
+        ]
+    rows = [row for row in rows if row.get("metrics/mAP50-95(B)")]
+    if not rows:
+        return None
+
+    def fitness(row):
+        return 0.1 * float(row["metrics/mAP50(B)"]) + 0.9 * float(row["metrics/mAP50-95(B)"])
+
+    best = max(rows, key=fitness)
+    return {
+        "epoch": int(float(best["epoch"])),
+        "epochs_run": len(rows),
+        "precision": float(best["metrics/precision(B)"]),
+        "recall": float(best["metrics/recall(B)"]),
+        "map50": float(best["metrics/mAP50(B)"]),
+        "map50_95": float(best["metrics/mAP50-95(B)"]),
+    }
+
+
+def discover_runs(runs_dir, extra_weights):
+    """
+    Entraînements de ``runs_dir`` et poids supplémentaires (``nom=chemin``).
+    """
+    runs = []
+    for args_path in sorted(glob.glob(os.path.join(runs_dir, "*", "args.yaml"))):
+        run_dir = os.path.dirname(args_path)
+        args = read_args(args_path)
+        results_path = os.path.join(run_dir, "results.csv")
+        weights = os.path.join(run_dir, "weights", "best.pt")
+        runs.append({
+            "name": os.path.basename(run_dir),
+            "base_model": args.get("model"),
+            "data": args.get("data"),
+            "train_imgsz": int(args.get("imgsz", 640)),
+            "weights": weights if os.path.exists(weights) else None,
+            "accuracy": best_epoch(results_path) if os.path.exists(results_path) else None,
+        })
+    for entry in extra_weights:
+        name, _, path = entry.partition("=")
+        runs.append({
+            "name": name, "base_model": None, "data": None, "train_imgsz": None,
+            "weights": path if os.path.exists(path) else None, "accuracy": None,
+        })
+    return runs
+
+
+def _rss_mb():
+    """
+    RSS courante (Mo), lue dans /proc (Linux).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss : kilo-octets sous Linux, octets sous macOS
+    return peak / 2**20 if platform.system() == "Darwin" else peak / 2**10
+
+
+def _measure(weights, imgsz, batch, repeat, threads, data):
+    """
+    Mesure d'une configuration dans un processus neuf (pic de mémoire propre à la configuration).
+    """
+    import torch
+    from ultralytics import YOLO
+
+    from api_fastapi.imaging import decode_image
+
+    if threads:
+        torch.set_num_threads(threads)
+    model = YOLO(weights, task="detect")
+    loaded_rss = _rss_mb()
+
+    frames = [decode_image(content)[0] for content in sample_images().values()]
+    images = [frames[i % len(frames)] for i in range(batch)]
+    stats = measure(lambda: model(images, imgsz=imgsz, device="cpu", verbose=False), repeat=repeat, warmup=2)
+    stats.update({
+        "per_image_p50_ms": round(stats["p50_ms"] / batch, 3),
+        "images_per_second": round(stats["ops"] * batch, 2) if stats["ops"] else None,
+        "loaded_rss_mb": round(loaded_rss, 1) if loaded_rss is not None else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "threads": torch.get_num_threads(),
+    })
+    if data:
+        metrics = model.val(data=data, imgsz=imgsz, batch=batch, device="cpu", plots=False, verbose=False)
+        stats["val_map50"] = round(float(metrics.box.map50), 4)
+        stats["val_map50_95"] = round(float(metrics.box.map), 4)
+    return stats
+
+
+def pareto_front(rows, key_latency="per_image_p50_ms", key_accuracy="map50_95"):
+    """
+    Marque ``pareto`` les lignes qu'aucune autre ne bat à la fois en latence et en précision.
+    """
+    candidates = [row for row in rows if row.get(key_latency) is not None and row.get(key_accuracy) is not None]
+    for row in candidates:
+        row["pareto"] = not any(
+            other[key_latency] <= row[key_latency] and other[key_accuracy] >= row[key_accuracy]
+            and (other[key_latency] < row[key_latency] or other[key_accuracy] > row[key_accuracy])
+            for other in candidates
+        )
+
+
+def _format_table(rows):
+    header = (
+        "| Entraînement | Modèle | Données | imgsz | Lot | ms/image (p50) | p95 lot (ms) | images/s "
+        "| RSS pic (Mo) | mAP50 | mAP50-95 | Pareto |"
+    )
+    lines = [header, "|" + "---|" * (header.count("|") - 1)]
+
+    def cell(value):
+        return "" if value is None else value
+
+    for row in rows:
+        lines.append(
+            f"| {row['run']} | {cell(row['base_model'])} | {cell(row['data'])} | {cell(row.get('imgsz'))} "
+            f"| {cell(row.get('batch'))} | {cell(row.get('per_image_p50_ms'))} | {cell(row.get('p95_ms'))} "
+            f"| {cell(row.get('images_per_second'))} | {cell(row.get('peak_rss_mb'))} | {cell(row.get('map50'))} "
+            f"| {cell(row.get('map50_95'))} | {'oui' if row.get('pareto') else ''} |"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vitesse, mémoire et précision des entraînements runs/detect")
+    parser.add_argument("--runs-dir", default=os.path.join(ROOT, "runs", "detect"))
+    parser.add_argument("--weights", nargs="*", default=[], help="Poids supplémentaires : nom=chemin (ex: deployed=best.pt)")
+    parser.add_argument("--imgsz", nargs="*", type=int, default=[320, 480, 640])
+    parser.add_argument("--batch", nargs="*", type=int, default=[1, 8])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=0, help="Threads torch (0 : valeur par défaut)")
+    parser.add_argument("--data", help="data.yaml commun : mAP recalculée à chaque imgsz")
+    parser.add_argument("--output", default="bench/runs.json")
+    parser.add_argument("--markdown", help="Écrire aussi le tableau en Markdown dans ce fichier")
+    parser.add_argument("--baseline", help="Exécution de référence (JSON) à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    runs = discover_runs(args.runs_dir, args.weights)
+    if not runs:
+        parser.error(f"Aucun entraînement dans {args.runs_dir}")
+
+    rows = []
+    # Un processus par configuration : le pic de RSS ne mélange pas deux mesures
+    context = multiprocessing.get_context("spawn")
+    for run in runs:
+        accuracy = run["accuracy"] or {}
+        base = {
+            "run": run["name"],
+            "base_model": run["base_model"],
+            "data": args.data or run["data"],
+            "weights": run["weights"],
+            "epoch": accuracy.get("epoch"),
+        }
+        if run["weights"] is None:
+            print(f"{run['name']}: poids absents, précision seule", file=sys.stderr)
+            rows.append(dict(base, map50=accuracy.get("map50"), map50_95=accuracy.get("map50_95")))
+            continue
+        for imgsz in args.imgsz:
+            for batch in args.batch:
+                with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                    try:
+                        stats = pool.submit(
+                            _measure, run["weights"], imgsz, batch, args.repeat, args.threads, args.data
+                        ).result()
+                    except Exception as e:
+                        print(f"{run['name']} imgsz={imgsz} lot={batch}: échec ({e})", file=sys.stderr)
+                        continue
+                row = dict(base, imgsz=imgsz, batch=batch, **stats)
+                if args.data:
+                    row["map50"], row["map50_95"] = stats.get("val_map50"), stats.get("val_map50_95")
+                elif imgsz == run["train_imgsz"]:
+                    # La mAP de results.csv ne vaut qu'à la taille d'entraînement
+                    row["map50"], row["map50_95"] = accuracy.get("map50"), accuracy.get("map50_95")
+                rows.append(row)
+                print(
+                    f"{run['name']:10s} imgsz {imgsz:4d} lot {batch:2d}  {row['per_image_p50_ms']:8.2f} ms/image  "
+                    f"pic {row['peak_rss_mb']:7.1f} Mo  mAP50-95 {row.get('map50_95')}",
+                    file=sys.stderr,
+                )
+
+    # Front de Pareto par jeu de données (mAP comparables) et par taille de lot
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["data"], row.get("batch")), []).append(row)
+    for group in groups.values():
+        pareto_front(group)
+
+    rows.sort(key=lambda row: (str(row["data"]), row.get("batch") or 0, row.get("per_image_p50_ms") or float("inf")))
+    table = _format_table(rows)
+    print(table)
+    if args.markdown:
+        with open(args.markdown, "w") as f:
+            f.write(table + "\n")
+
+    results = {
+        f"{row['run']}/imgsz={row.get('imgsz')}/batch={row.get('batch')}": row for row in rows
+    }
+    meta = metadata(benchmark="runs", imgsz=args.imgsz, batch=args.batch, repeat=args.repeat, data=args.data)
+    write_results(args.output, meta, results)
+    print(f"Résultats écrits dans {args.output}", file=sys.stderr)
+    if args.baseline:
+        return report_baseline(results, args.baseline, args.tolerance)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# stages.py - Micro-benchmarks de chaque étape de la chaîne /detect_fire_url
+
+"""
+Mesure isolée de chaque étape de l'analyse d'une image:
+
+    download, decode_pil (ancien chemin PIL + numpy), decode (cv2.imdecode),
+    decode_reduced (JPEG décodé à résolution réduite), color_conversion,
+    inference (1 image et lot de BATCH_MAX_SIZE), postprocess, draw,
+    jpeg_encode, base64
+
+sur les JPEG du dépôt et des frames synthétiques (480p à 4K). Le
+téléchargement passe par un serveur d'images local.
+
+Utilisation::
+
+    python -m benchmarks.stages --output bench/stages.json
+    python -m benchmarks.stages --baseline bench/stages.json --skip-inference
+"""
+
+import argparse
+import asyncio
+import io
+import sys
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from api_fastapi import config, imaging
+from benchmarks.common import ImageServer, measure, metadata, report_baseline, sample_images, write_results
+
+STAGES = (
+    "download", "decode_pil", "decode", "decode_reduced", "color_conversion",
+    "inference", "postprocess", "draw", "jpeg_encode", "base64",
+)
+
+
+def _synthetic_results(ml, image, count=10, seed=0):
+    """
+    Résultat de détection synthétique (``count`` boîtes) pour mesurer le dessin.
+    """
+    height, width = image.shape[:2]
+    rng = np.random.default_rng(seed)
+    x1 = rng.uniform(0, width * 0.8, count)
+    y1 = rng.uniform(0, height * 0.8, count)
+    boxes = np.stack([x1, y1, x1 + width * 0.1, y1 + height * 0.1], axis=1).astype(np.float32)
+    scores = rng.uniform(0.5, 1.0, count).astype(np.float32)
+    class_ids = np.arange(count, dtype=np.int64) % 2
+    return ml.build_results(boxes, scores, class_ids, [("fire", "smoke")[i] for i in class_ids])
+
+
+def run(stages, repeat, with_inference):
+    images = sample_images()
+    results = {}
+
+    ml = None
+    if with_inference or "draw" in stages or "postprocess" in stages:
+        from api_fastapi import ml
+    model = ml.model_loader.get() if with_inference else None
+
+    loop = asyncio.new_event_loop()
+    with ImageServer(images) as server:
+        from api_fastapi.downloads import close_http_client, download_image
+
+        for name, content in images.items():
+            image, _ = imaging.decode_image(content)
+            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            jpeg = imaging.encode_jpeg(image, config.JPEG_QUALITY)
+            url = server.url(name)
+
+            benchmarks = {
+                "download": lambda: loop.run_until_complete(download_image(url)),
+                "decode_pil": lambda: np.asarray(Image.open(io.BytesIO(content)).convert("RGB")),
+                "decode": lambda: imaging.decode_image(content),
+                "decode_reduced": lambda: imaging.decode_image(content, config.DECODE_MIN_SIZE),
+                "color_conversion": lambda: cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR),
+                "jpeg_encode": lambda: imaging.encode_jpeg(image, config.JPEG_QUALITY),
+                "base64": lambda: imaging.encode_base64(jpeg),
+            }
+            if ml is not None:
+                drawn = _synthetic_results(ml, image)
+                benchmarks["draw"] = lambda: imaging.draw_detections(image.copy(), drawn)
+            if model is not None:
+                raw = model([image], verbose=False)[0]
+                batch = [image] * config.BATCH_MAX_SIZE
+                benchmarks["inference"] = lambda: model([image], verbose=False)
+                benchmarks[f"inference_batch{config.BATCH_MAX_SIZE}"] = lambda: model(batch, verbose=False)
+                benchmarks["postprocess"] = lambda: ml.parse_result(raw)
+
+            for stage, fn in benchmarks.items():
+                if stage.split("_batch")[0] not in stages:
+                    continue
+                stats = measure(fn, repeat=repeat)
+                results[f"{stage}/{name}"] = stats
+                print(f"{stage:22s} {name:40s} p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms")
+
+            if "postprocess" in stages and model is not None:
+                # Post-traitement de 300 boîtes brutes (sortie maximale usuelle du NMS)
+                raw_boxes = np.concatenate([
+                    _synthetic_results(ml, image, 300)["boxes"],
+                    np.random.default_rng(1).uniform(0, 1, (300, 1)),
+                    np.random.default_rng(2).integers(0, 2, (300, 1)),
+                ], axis=1).astype(np.float32)
+                stats = measure(lambda: ml.postprocess(raw_boxes), repeat=repeat)
+                results[f"postprocess_300/{name}"] = stats
+        loop.run_until_complete(close_http_client())
+    loop.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks des étapes de /detect_fire_url")
+    parser.add_argument("--stages", nargs="*", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-inference", action="store_true", help="Ne pas charger le modèle")
+    parser.add_argument("--output", default="bench/stages.json")
+    parser.add_argument("--baseline", help="Exécution de référence (JSON) à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    with_inference = bool({"inference", "postprocess"} & set(args.stages)) and not args.skip_inference
+    results = run(args.stages, args.repeat, with_inference)
+    meta = metadata(
+        benchmark="stages",
+        backend=config.INFERENCE_BACKEND,
+        precision=config.INFERENCE_PRECISION,
+        repeat=args.repeat,
+    )
+    write_results(args.output, meta, results)
+    print(f"Résultats écrits dans {args.output}")
+    if args.baseline:
+        return report_baseline(results, args.baseline, args.tolerance)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
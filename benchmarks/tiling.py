@@ -0,0 +1,192 @@
+# tiling.py - Latence et rappel de l'inférence par tuiles face à l'image entière
+
+"""
+Compare les deux chemins d'inférence sur un jeu annoté au format YOLO
+(``images/`` et ``labels/`` voisins, comme ``FIRE-1/valid`` de ``data.yaml``):
+
+    - ``full`` : l'image entière réduite à la taille d'entrée du modèle
+    - ``tiled`` : ``TiledDetector`` (tuiles recouvrantes + fusion par NMS)
+
+Pour chaque chemin : latence par image (p50/p95/p99), rappel et précision à
+IoU 0.5, et rappel des petits objets (grand côté sous ``--small`` de celui
+de l'image). ``--mosaic N`` assemble les images par grilles N x N pour
+simuler des prises de vue haute résolution où les foyers sont petits.
+
+Utilisation::
+
+    python -m benchmarks.tiling --images FIRE-1/valid/images --mosaic 3 --output bench/tiling.json
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from api_fastapi import config, ml
+from api_fastapi.scene import _iou_matrix
+from api_fastapi.tiling import TiledDetector
+from benchmarks.common import metadata, report_baseline, summarize, write_results
+
+
+def _label_path(image_path):
+    images_dir, name = os.path.split(image_path)
+    labels_dir = os.path.join(os.path.dirname(images_dir), "labels")
+    return os.path.join(labels_dir, os.path.splitext(name)[0] + ".txt")
+
+
+def load_sample(image_path):
+    """
+    Image BGR et vérité terrain ``(boîtes (N, 4) en pixels, classes (N,))``.
+    """
+    image = cv2.imread(image_path)
+    height, width = image.shape[:2]
+    rows = []
+    label_path = _label_path(image_path)
+    if os.path.exists(label_path):
+        with open(label_path) as f:
+            rows = [line.split() for line in f if line.strip()]
+    # Format YOLO : classe, centre x, centre y, largeur, hauteur (normalisés)
+    data = np.array([[float(value) for value in row[:5]] for row in rows], dtype=np.float32).reshape(-1, 5)
+    cx, cy, w, h = data[:, 1] * width, data[:, 2] * height, data[:, 3] * width, data[:, 4] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return image, boxes, data[:, 0].astype(np.int64)
+
+
+def mosaics(samples, size):
+    """
+    Assemble les échantillons par grilles ``size`` x ``size`` (cellules à la taille de la plus grande image).
+    """
+    for start in range(0, len(samples) - size * size + 1, size * size):
+        group = samples[start:start + size * size]
+        cell_h = max(image.shape[0] for image, _, _ in group)
+        cell_w = max(image.shape[1] for image, _, _ in group)
+        canvas = np.zeros((cell_h * size, cell_w * size, 3), dtype=np.uint8)
+        boxes, class_ids = [], []
+        for index, (image, image_boxes, image_classes) in enumerate(group):
+            y, x = (index // size) * cell_h, (index % size) * cell_w
+            canvas[y:y + image.shape[0], x:x + image.shape[1]] = image
+            boxes.append(image_boxes + np.array([x, y, x, y], dtype=np.float32))
+            class_ids.append(image_classes)
+        yield canvas, np.concatenate(boxes), np.concatenate(class_ids)
+
+
+def match(results, boxes, class_ids, iou_threshold=0.5):
+    """
+    Appariement glouton (confiance décroissante, même classe) des détections à la vérité terrain.
+
+    Returns:
+        ``(vrais positifs, masque des objets retrouvés)``.
+    """
+    found = np.zeros(len(boxes), dtype=bool)
+    if len(boxes) == 0 or len(results["boxes"]) == 0:
+        return 0, found
+    iou = _iou_matrix(results["boxes"], boxes)
+    true_positives = 0
+    for index in np.argsort(-results["scores"]):
+        candidates = np.where(
+            (iou[index] >= iou_threshold) & ~found & (class_ids == results["class_ids"][index])
+        )[0]
+        if len(candidates):
+            found[candidates[np.argmax(iou[index][candidates])]] = True
+            true_positives += 1
+    return true_positives, found
+
+
+def evaluate(samples, detect, small):
+    durations = []
+    true_positives = predictions = objects = small_objects = small_found = 0
+    for image, boxes, class_ids in samples:
+        started = time.perf_counter()
+        results = detect(image)
+        durations.append(time.perf_counter() - started)
+
+        tp, found = match(results, boxes, class_ids)
+        true_positives += tp
+        predictions += len(results["boxes"])
+        objects += len(boxes)
+        is_small = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) < small * max(image.shape[:2])
+        small_objects += int(is_small.sum())
+        small_found += int(found[is_small].sum())
+
+    stats = summarize(durations)
+    stats.update({
+        "images": len(durations),
+        "objects": objects,
+        "recall": round(int(true_positives) / objects, 4) if objects else None,
+        "precision": round(int(true_positives) / predictions, 4) if predictions else None,
+        "small_objects": small_objects,
+        "small_recall": round(small_found / small_objects, 4) if small_objects else None,
+    })
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inférence par tuiles face à l'image entière")
+    parser.add_argument("--images", default="FIRE-1/valid/images", help="Dossier d'images annotées (YOLO)")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--mosaic", type=int, default=1, help="Assembler les images par grilles N x N")
+    parser.add_argument("--tile-size", type=int, default=config.TILE_SIZE)
+    parser.add_argument("--overlap", type=float, default=config.TILE_OVERLAP)
+    parser.add_argument("--concurrency", type=int, default=config.TILE_CONCURRENCY)
+    parser.add_argument("--no-full", action="store_true", help="Sans passe sur l'image entière")
+    parser.add_argument("--nms-metric", default=config.TILE_NMS_METRIC, choices=["iou", "ios"])
+    parser.add_argument("--small", type=float, default=0.05, help="Seuil des petits objets (fraction de l'image)")
+    parser.add_argument("--output", default="bench/tiling.json")
+    parser.add_argument("--baseline", help="Exécution de référence (JSON) à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    paths = sorted(
+        path for path in glob.glob(os.path.join(args.images, "*"))
+        if path.lower().endswith((".jpg", ".jpeg", ".png"))
+    )[:args.limit]
+    if not paths:
+        parser.error(f"Aucune image dans {args.images}")
+    samples = [load_sample(path) for path in paths]
+    if args.mosaic > 1:
+        samples = list(mosaics(samples, args.mosaic))
+
+    ml.model_loader.load_and_warm_up()
+    if not ml.model_loader.ready:
+        print(f"Modèle indisponible : {ml.model_loader.error}")
+        return 1
+
+    # Toutes les images sont découpées, quelle que soit leur taille
+    detector = TiledDetector(
+        tile_size=args.tile_size, overlap=args.overlap, min_size=0, concurrency=args.concurrency,
+        include_full=not args.no_full, nms_metric=args.nms_metric,
+    )
+    results = {
+        "full": evaluate(samples, ml.detect_fire_image, args.small),
+        "tiled": evaluate(samples, detector.detect_sync, args.small),
+    }
+    results["tiled"]["mean_tiles"] = detector.stats()["mean_tiles"]
+    for name, stats in results.items():
+        print(
+            f"{name:6s} p50 {stats['p50_ms']:9.1f} ms  p95 {stats['p95_ms']:9.1f} ms  "
+            f"rappel {stats['recall']}  précision {stats['precision']}  rappel petits objets {stats['small_recall']}"
+        )
+
+    meta = metadata(
+        benchmark="tiling",
+        backend=config.INFERENCE_BACKEND,
+        precision=config.INFERENCE_PRECISION,
+        images=args.images,
+        mosaic=args.mosaic,
+        tile_size=args.tile_size,
+        overlap=args.overlap,
+        include_full=not args.no_full,
+    )
+    write_results(args.output, meta, results)
+    print(f"Résultats écrits dans {args.output}")
+    if args.baseline:
+        return report_baseline(results, args.baseline, args.tolerance)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,12 @@ from ultralytics import YOLO
 import cv2
 import math 
 
+import time
+
+import numpy as np
+
+from api_fastapi.scene import KeyframeTracker, SceneChangeGate
+
 # start webcam
 cap = cv2.VideoCapture(0)
 cap.set(3, 640)
@@ -14,39 +20,62 @@ model = YOLO("runs/detect/train5/weights/best.pt")
 # object classes
 classNames = ["fire", "smoke"]
 
+# scene gate: reuse previous detections while the scene is unchanged
+gate = SceneChangeGate()
+
+# run the detector on keyframes only, track boxes in between
+tracker = KeyframeTracker()
+
+
+def detect(img):
+    thumbnail, detections = gate.check(img)
+    if detections is not None:
+        return detections, None
+    started = time.perf_counter()
+    data = np.concatenate([r.boxes.data.cpu().numpy() for r in model(img, stream=True)]).reshape(-1, 6)
+    class_ids = data[:, 5].astype(np.int64)
+    detections = {
+        "boxes": data[:, :4],
+        "scores": data[:, 4],
+        "class_ids": class_ids,
+        "labels": [classNames[c] for c in class_ids.tolist()],
+    }
+    gate.update(thumbnail, detections, active=len(data) > 0)
+    return detections, time.perf_counter() - started
+
 
 while True:
     success, img = cap.read()
-    results = model(img, stream=True)
+    if tracker.needs_keyframe():
+        detections, inference_seconds = detect(img)
+        results = tracker.update(img, detections, inference_seconds)
+    else:
+        results = tracker.propagate(img)
 
-    # coordinates
-    for r in results:
-        boxes = r.boxes
+    # alert once per new fire/smoke track, not once per frame
+    for detection in results["detections"]:
+        if detection["track_id"] in results["new_track_ids"]:
+            print("New", detection["type"], "track -->", detection["track_id"])
 
-        for box in boxes:
-            # bounding box
-            x1, y1, x2, y2 = box.xyxy[0]
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2) # convert to int values
-
-            # put box in cam
-            cv2.rectangle(img, (x1, y1), (x2, y2), (255, 0, 255), 3)
+    # coordinates
+    for detection in results["detections"]:
+        # bounding box
+        x1, y1, x2, y2 = (int(detection[k]) for k in ("x1", "y1", "x2", "y2"))
 
-            # confidence
-            confidence = math.ceil((box.conf[0]*100))/100
-            print("Confidence --->",confidence)
+        # put box in cam
+        cv2.rectangle(img, (x1, y1), (x2, y2), (255, 0, 255), 3)
 
-            # class name
-            cls = int(box.cls[0])
-            print("Class name -->", classNames[cls])
+        # confidence
+        confidence = math.ceil((detection["confidence"]*100))/100
 
-            # object details
-            org = [x1, y1]
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            fontScale = 1
-            color = (255, 0, 0)
-            thickness = 2
+        # object details
+        org = [x1, y1]
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        fontScale = 1
+        color = (255, 0, 0)
+        thickness = 2
 
-            cv2.putText(img, classNames[cls], org, font, fontScale, color, thickness)
+        cv2.putText(img, f"{detection['type']} #{detection['track_id']} {confidence}", org, font, fontScale, color, thickness)
 
     cv2.imshow('Webcam', img)
     if cv2.waitKey(1) == ord('q'):
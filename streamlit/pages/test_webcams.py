@@ -1,17 +1,44 @@
 import streamlit as st
 import requests
-import base64
-from PIL import Image
-import io
-import time
+import json
 
 # Titre de l'application
 st.title("🔥 Détection d'incendie en temps réel")
-st.caption("Le flux s'actualise en appelant l'API en continu.")
+st.caption("Le flux annoté est poussé en continu par l'API sur une seule connexion.")
+
+# URL du flux MJPEG webcam de ton API
+# API_URL = "http://localhost:8086/stream_fire_webcam"    # localhost
+API_URL = "http://fastapi:8086/stream_fire_webcam"    # docker
+
+
+def iter_mjpeg(response):
+    """
+    Découpe un flux multipart/x-mixed-replace en couples (jpeg, métadonnées).
+
+    Chaque partie annonce sa taille (Content-Length) : on lit exactement ce
+    nombre d'octets, sans décoder ni ré-encoder l'image côté client.
+    """
+    buffer = b""
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        buffer += chunk
+        while True:
+            header_end = buffer.find(b"\r\n\r\n")
+            if header_end == -1:
+                break
+            headers = {}
+            for line in buffer[:header_end].split(b"\r\n"):
+                if b":" in line:
+                    key, value = line.split(b":", 1)
+                    headers[key.strip().lower().decode()] = value.strip().decode()
+            length = int(headers.get("content-length", 0))
+            body_start = header_end + 4
+            if len(buffer) < body_start + length:
+                break
+            jpeg = buffer[body_start:body_start + length]
+            buffer = buffer[body_start + length:].lstrip(b"\r\n")
+            metadata = json.loads(headers.get("x-detections", "{}"))
+            yield jpeg, metadata
 
-# URL de l'endpoint webcam de ton API
-# API_URL = "http://localhost:8086/detect_fire_webcam"    # localhost
-API_URL = "http://fastapi:8086/detect_fire_webcam"    # docker
 
 # Initialiser l'état de la détection dans la session
 if 'run_detection' not in st.session_state:
@@ -33,28 +60,25 @@ with col2:
 image_placeholder = st.empty()
 status_placeholder = st.empty()
 
-# Boucle principale pour simuler le flux vidéo
+# Lecture du flux poussé par l'API (une seule connexion pour toutes les frames)
 if st.session_state.run_detection:
-    while st.session_state.run_detection:
-        try:
-            # Appel à l'API qui gère la capture et la détection
-            response = requests.post(API_URL, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data.get("success") and "image_encoded" in data:
-                    img_b64 = data["image_encoded"]
-                    img_bytes = base64.b64decode(img_b64)
-                    image = Image.open(io.BytesIO(img_bytes))
-                    
-                    # Afficher l'image analysée
+    try:
+        with requests.get(API_URL, stream=True, timeout=(5, 30)) as response:
+            if response.status_code != 200:
+                status_placeholder.error(f"Erreur de l'API (code {response.status_code}): {response.text}")
+                st.session_state.run_detection = False
+            else:
+                for jpeg, data in iter_mjpeg(response):
+                    if not st.session_state.run_detection:
+                        break
+
+                    # Afficher l'image analysée (octets JPEG affichés tels quels)
                     image_placeholder.image(
-                        image, 
-                        caption=data.get("message", "Image analysée"), 
+                        jpeg,
+                        caption=f"Frame {data.get('frame', '?')}",
                         use_container_width=True
                     )
-                    
+
                     # Afficher l'alerte correspondante
                     if data.get("fire_detected"):
                         status_placeholder.error("🚨 ALERTE FEU DÉTECTÉ ! 🚨")
@@ -62,19 +86,7 @@ if st.session_state.run_detection:
                         status_placeholder.warning("⚠️ ALERTE FUMÉE DÉTECTÉE ! ⚠️")
                     else:
                         status_placeholder.success("✅ Aucune menace détectée.")
-                else:
-                    status_placeholder.warning("L'API a répondu mais n'a pas retourné d'image valide.")
-
-            else:
-                status_placeholder.error(f"Erreur de l'API (code {response.status_code}): {response.text}")
-                st.session_state.run_detection = False  # Arrêter la boucle en cas d'erreur
-                break
-
-        except requests.exceptions.RequestException as e:
-            status_placeholder.error(f"Impossible de se connecter à l'API : {e}")
-            st.session_state.run_detection = False  # Arrêter la boucle en cas d'erreur
-            break
-            
-        # Pause pour contrôler la fréquence de rafraîchissement
-        time.sleep(0.1)  # Environ 10 images par seconde (en théorie)
 
+    except requests.exceptions.RequestException as e:
+        status_placeholder.error(f"Impossible de se connecter à l'API : {e}")
+        st.session_state.run_detection = False  # Arrêter la lecture en cas d'erreur